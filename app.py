@@ -1,9 +1,10 @@
 from flask import Flask
 from flask_cors import CORS
-from flask_sqlalchemy import SQLAlchemy
-from config.config import Config
-from controllers.search_controller import search_bp
-from utils.database import init_db
+from werkzeug.middleware.proxy_fix import ProxyFix
+from config.config import Config, PROXY_FIX_HOPS, WARMUP_CONFIG
+from controllers.search_controller import search_bp, WARM_UP_STEPS
+from controllers.admin_controller import admin_bp
+from utils.warmup import start_warm_up
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -12,15 +13,17 @@ app.config.from_object(Config)
 # Enable CORS
 CORS(app)
 
-# Initialize SQLAlchemy
-db = SQLAlchemy()
-db.init_app(app)
+# Behind proxies, remote_addr (and so the rate limit bucket) is the client from X-Forwarded-For
+if PROXY_FIX_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_FIX_HOPS)
 
-# Initialize database
-init_db(app)
+# Register blueprints (routes already carry the /api/search prefix)
+app.register_blueprint(search_bp)
+app.register_blueprint(admin_bp)
 
-# Register blueprints
-app.register_blueprint(search_bp, url_prefix='/api/search')
+# Create tables and load the filter and model; /api/search/ready reports progress
+if WARMUP_CONFIG['enabled']:
+    start_warm_up(WARM_UP_STEPS, background=WARMUP_CONFIG['background'])
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,4 @@
+from controllers.async_search_controller import AsyncSearchApp
+
+# ASGI entry point for the asyncio serving mode (uvicorn async_app:app); warm-up runs at lifespan startup
+app = AsyncSearchApp()
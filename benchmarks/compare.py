@@ -0,0 +1,63 @@
+"""
+Compare two benchmark reports from benchmarks.run and flag regressions.
+
+    python -m benchmarks.compare baseline.json candidate.json --threshold 0.1
+
+Exits with status 1 when any latency grew, or any throughput shrank, by
+more than the threshold.
+"""
+import argparse
+import json
+import sys
+from typing import Dict, Iterator, Tuple
+
+# Metrics where larger is better; every other compared metric is a latency
+_HIGHER_IS_BETTER = ('throughput', 'rows_per_second')
+_COMPARED = ('p50_ms', 'p95_ms', 'p99_ms', 'mean_ms') + _HIGHER_IS_BETTER
+
+
+def _metrics(report: Dict, path: str = '') -> Iterator[Tuple[str, float]]:
+    for key, value in report.items():
+        if key == 'meta':
+            continue
+        name = f"{path}.{key}" if path else key
+        if isinstance(value, dict):
+            yield from _metrics(value, name)
+        elif key in _COMPARED and isinstance(value, (int, float)):
+            yield name, float(value)
+
+
+def compare(baseline: Dict, candidate: Dict, threshold: float):
+    """Yield (metric, baseline, candidate, relative change, regressed) for metrics present in both"""
+    base = dict(_metrics(baseline))
+    for name, value in _metrics(candidate):
+        if name not in base or not base[name]:
+            continue
+        change = (value - base[name]) / base[name]
+        worse = -change if name.endswith(_HIGHER_IS_BETTER) else change
+        yield name, base[name], value, change, worse > threshold
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=0.1, help='Relative change counted as a regression')
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    regressions = 0
+    for name, before, after, change, regressed in compare(baseline, candidate, args.threshold):
+        regressions += regressed
+        flag = '  REGRESSION' if regressed else ''
+        print(f"{name:<60} {before:>12.3f} {after:>12.3f} {change:>+8.1%}{flag}")
+    print(f"\n{regressions} regression(s) above {args.threshold:.0%}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+import logging
+import threading
+import time
+from collections import Counter
+from typing import Dict, List
+
+import requests
+
+from benchmarks.stats import summarize
+from benchmarks.workload import QueryWorkload
+
+
+def serve_app(host: str = '127.0.0.1', port: int = 0):
+    """Serve the Flask app from a background thread; returns the server (its port is server.port)"""
+    from werkzeug.serving import make_server
+    from app import app
+
+    # Per-request access logs would dominate the client's own output
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server(host, port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='bench-server', daemon=True).start()
+    return server
+
+
+class LoadTest:
+    """
+    Closed-loop load test: `concurrency` simulated users each type a
+    Zipf-sampled query one keystroke per autocomplete request, then
+    sometimes send feedback on a suggestion or fetch popular searches.
+    """
+
+    def __init__(self, base_url: str, workload: QueryWorkload, concurrency: int = 8,
+                 duration: float = 20.0, feedback_rate: float = 0.2,
+                 report_rate: float = 0.01, popular_rate: float = 0.05,
+                 timeout: float = 10.0):
+        self.base_url = base_url.rstrip('/')
+        self.workload = workload
+        self.concurrency = concurrency
+        self.duration = duration
+        self.feedback_rate = feedback_rate
+        self.report_rate = report_rate
+        self.popular_rate = popular_rate
+        self.timeout = timeout
+
+    def _request(self, http: requests.Session, endpoint: str, method: str, path: str,
+                 latencies: Dict[str, List[float]], errors: Counter, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = http.request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+        except requests.RequestException:
+            errors[endpoint] += 1
+            return None
+        elapsed = time.perf_counter() - started
+        if response.status_code >= 400:
+            errors[endpoint] += 1
+            return None
+        latencies.setdefault(endpoint, []).append(elapsed)
+        return response.json()
+
+    def _user(self, index: int, deadline: float, results: List):
+        workload = self.workload.fork(index)
+        latencies: Dict[str, List[float]] = {}
+        errors: Counter = Counter()
+        with requests.Session() as http:
+            for prefixes in workload.sessions():
+                if time.perf_counter() >= deadline:
+                    break
+                last = None
+                for prefix in prefixes:
+                    last = self._request(http, 'autocomplete', 'GET', '/api/search/autocomplete',
+                                         latencies, errors, params={'q': prefix}) or last
+
+                if last and last.get('search_id') and workload.rng.random() < self.feedback_rate:
+                    suggestion = (last.get('suggestions') or prefixes[-1:])[0]
+                    self._request(http, 'feedback', 'POST', '/api/search/feedback', latencies, errors, json={
+                        'search_id': last['search_id'],
+                        'suggestion': suggestion,
+                        'is_inappropriate': bool(workload.rng.random() < self.report_rate)
+                    })
+
+                if workload.rng.random() < self.popular_rate:
+                    self._request(http, 'popular', 'GET', '/api/search/popular',
+                                  latencies, errors, params={'limit': 10})
+        results.append((latencies, errors))
+
+    def run(self) -> Dict:
+        results: List = []
+        started = time.perf_counter()
+        deadline = started + self.duration
+        users = [threading.Thread(target=self._user, args=(i, deadline, results), name=f'bench-user-{i}')
+                 for i in range(self.concurrency)]
+        for user in users:
+            user.start()
+        for user in users:
+            user.join()
+        elapsed = time.perf_counter() - started
+
+        latencies: Dict[str, List[float]] = {}
+        errors: Counter = Counter()
+        for user_latencies, user_errors in results:
+            for endpoint, samples in user_latencies.items():
+                latencies.setdefault(endpoint, []).extend(samples)
+            errors.update(user_errors)
+
+        report = {
+            'concurrency': self.concurrency,
+            'duration': round(elapsed, 3),
+            'endpoints': {},
+            'total': summarize([s for samples in latencies.values() for s in samples], elapsed)
+        }
+        for endpoint in ('autocomplete', 'feedback', 'popular'):
+            report['endpoints'][endpoint] = summarize(latencies.get(endpoint, []), elapsed)
+            report['endpoints'][endpoint]['errors'] = errors[endpoint]
+        report['total']['errors'] = sum(errors.values())
+        return report
@@ -0,0 +1,77 @@
+import time
+from typing import Callable, Dict, Iterable, List
+
+from benchmarks.stats import summarize
+from benchmarks.workload import QueryWorkload
+
+
+def _time_each(fn: Callable, items: Iterable) -> Dict:
+    latencies = []
+    started = time.perf_counter()
+    for item in items:
+        call_started = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - call_started)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def _unique_prefixes(workload: QueryWorkload, count: int) -> List[str]:
+    prefixes = {}
+    for session in workload.sessions():
+        for prefix in session:
+            prefixes.setdefault(prefix, None)
+        if len(prefixes) >= count:
+            break
+    return list(prefixes)[:count]
+
+
+def bench_train_model(service, repeat: int) -> Dict:
+    """Full rebuild from search history, including writing and mapping the artifact"""
+    result = _time_each(lambda _: service.train_model(), range(repeat))
+    result['queries'] = len(service.queries)
+    return result
+
+
+def bench_autocomplete(service, workload: QueryWorkload, count: int) -> Dict:
+    """Every prefix once against an empty cache, then again against a warm one"""
+    prefixes = _unique_prefixes(workload, count)
+    service.cache.clear_local()
+    return {
+        'cold': _time_each(service.get_autocomplete_suggestions, prefixes),
+        'warm': _time_each(service.get_autocomplete_suggestions, prefixes)
+    }
+
+
+def bench_filter_content(content_filter, workload: QueryWorkload, count: int,
+                         batch_size: int = 10) -> Dict:
+    """Single texts against an empty verdict memo, again memoized, and batched as suggestion lists"""
+    texts = list(dict.fromkeys(workload.sample_queries(count)))
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    content_filter.verdicts.clear()
+    cold = _time_each(content_filter.filter_content, texts)
+    warm = _time_each(content_filter.filter_content, texts)
+    content_filter.verdicts.clear()
+    batched = _time_each(content_filter.filter_suggestions, batches)
+    batched['batch_size'] = batch_size
+    return {'cold': cold, 'warm': warm, 'batched_cold': batched}
+
+
+def run_micro_benchmarks(workload: QueryWorkload, train_repeat: int = 3,
+                         prefix_count: int = 2000, filter_count: int = 2000) -> Dict:
+    from models.base import db_session, read_session
+    from services.prediction_service import PredictionService
+    from utils.content_filter import ContentFilter
+
+    content_filter = ContentFilter()
+    content_filter.load_nlp()
+    service = PredictionService(db_session, content_filter=content_filter, read_session=read_session)
+    try:
+        return {
+            'train_model': bench_train_model(service, train_repeat),
+            'get_autocomplete_suggestions': bench_autocomplete(service, workload, prefix_count),
+            'filter_content': bench_filter_content(content_filter, workload, filter_count)
+        }
+    finally:
+        service.shutdown()
+        db_session.remove()
+        read_session.remove()
@@ -0,0 +1,157 @@
+"""
+Reproducible benchmarks for the search API and the training path.
+
+Seeds a stand-in database (SQLite by default) with a synthetic Zipfian
+query log, runs micro-benchmarks of the model, autocomplete and content
+filter, then load-tests the HTTP endpoints. Results are written as JSON;
+compare two runs with `python -m benchmarks.compare`.
+
+    python -m benchmarks.run --rows 50000 --concurrency 8 --output bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workdir', help='Directory for the database and model artifact (default: a temp dir)')
+    parser.add_argument('--rows', type=int, default=50000, help='SearchHistory rows to seed')
+    parser.add_argument('--queries', type=int, default=5000, help='Distinct queries in the synthetic catalog')
+    parser.add_argument('--vocabulary', type=int, default=2000, help='Distinct words in the synthetic catalog')
+    parser.add_argument('--zipf', type=float, default=1.1, help='Zipf exponent for words and queries')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--concurrency', type=int, default=8, help='Simulated users in the load test')
+    parser.add_argument('--duration', type=float, default=20.0, help='Load test length in seconds')
+    parser.add_argument('--feedback-rate', type=float, default=0.2, help='Share of sessions sending feedback')
+    parser.add_argument('--report-rate', type=float, default=0.01, help='Share of feedback marked inappropriate')
+    parser.add_argument('--popular-rate', type=float, default=0.05, help='Share of sessions fetching popular searches')
+    parser.add_argument('--url', help='Load-test an already running server instead of an in-process one')
+    parser.add_argument('--train-repeat', type=int, default=3)
+    parser.add_argument('--prefixes', type=int, default=2000, help='Prefixes per autocomplete micro-benchmark pass')
+    parser.add_argument('--texts', type=int, default=2000, help='Texts per content filter micro-benchmark pass')
+    parser.add_argument('--skip-micro', action='store_true')
+    parser.add_argument('--skip-load', action='store_true')
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    return parser.parse_args(argv)
+
+
+def _configure_environment(workdir: str):
+    """Point the app at the stand-in database before any app module reads the config"""
+    os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+    os.environ.setdefault('MODEL_ARTIFACT_PATH', os.path.join(workdir, 'search_predictor.artifact'))
+    os.environ.setdefault('CACHE_TYPE', 'simple')
+    # Warm-up is run explicitly so it is not part of any measurement
+    os.environ.setdefault('WARMUP_ENABLED', 'false')
+    # The load test comes from one address and measures the full path, so neither guard should step in
+    os.environ.setdefault('RATELIMIT_ENABLED', 'false')
+    os.environ.setdefault('LOAD_SHEDDING_ENABLED', 'false')
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def seed_database(workload, rows: int, batch_size: int = 5000) -> Dict:
+    """Create the schema and insert `rows` synthetic searches and their query stats, unless already populated"""
+    from sqlalchemy import func, insert
+    from models.base import db_session, init_db
+    from models.search_model import SearchHistory
+    from utils.query_stats import backfill_from_search_history
+
+    init_db()
+    existing = db_session.query(func.count(SearchHistory.id)).scalar()
+    if existing:
+        db_session.remove()
+        return {'rows': existing, 'seconds': 0.0, 'reused': True}
+
+    started = time.perf_counter()
+    batch = []
+    for row in workload.history_rows(rows):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            db_session.execute(insert(SearchHistory), batch)
+            batch = []
+    if batch:
+        db_session.execute(insert(SearchHistory), batch)
+    db_session.commit()
+    backfill_from_search_history(db_session)
+    db_session.remove()
+    elapsed = time.perf_counter() - started
+    return {'rows': rows, 'seconds': round(elapsed, 3), 'rows_per_second': round(rows / elapsed, 1)}
+
+
+def run(args) -> Dict:
+    from benchmarks.workload import QueryWorkload
+
+    workload = QueryWorkload(num_queries=args.queries, vocabulary_size=args.vocabulary,
+                             exponent=args.zipf, seed=args.seed)
+    report = {
+        'meta': {
+            'commit': _git_commit(),
+            'started_at': datetime.utcnow().isoformat(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'database': os.environ.get('DATABASE_URL', '').split('@')[-1],
+            'params': vars(args)
+        }
+    }
+    if not args.url:
+        report['seed'] = seed_database(workload, args.rows)
+
+    if not args.skip_micro:
+        from benchmarks.micro import run_micro_benchmarks
+        report['micro'] = run_micro_benchmarks(workload.fork(args.seed), train_repeat=args.train_repeat,
+                                               prefix_count=args.prefixes, filter_count=args.texts)
+
+    if not args.skip_load:
+        from benchmarks.load import LoadTest, serve_app
+
+        server = None
+        base_url = args.url
+        if not base_url:
+            from controllers.search_controller import WARM_UP_STEPS
+            from utils.warmup import start_warm_up
+            start_warm_up(WARM_UP_STEPS, background=False)
+            server = serve_app()
+            base_url = f"http://127.0.0.1:{server.port}"
+        try:
+            report['load'] = LoadTest(
+                base_url, workload.fork(args.seed + 1), concurrency=args.concurrency,
+                duration=args.duration, feedback_rate=args.feedback_rate,
+                report_rate=args.report_rate, popular_rate=args.popular_rate
+            ).run()
+        finally:
+            if server is not None:
+                server.shutdown()
+    return report
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    args.workdir = args.workdir or tempfile.mkdtemp(prefix='search-bench-')
+    os.makedirs(args.workdir, exist_ok=True)
+    _configure_environment(args.workdir)
+
+    report = run(args)
+    output = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,23 @@
+from typing import Dict, Sequence
+
+import numpy as np
+
+
+def summarize(latencies: Sequence[float], elapsed: float = None) -> Dict:
+    """Latency summary in milliseconds; throughput in operations per second when `elapsed` is given"""
+    if not len(latencies):
+        return {'count': 0}
+    samples = np.asarray(latencies, dtype=np.float64) * 1000
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    summary = {
+        'count': len(samples),
+        'mean_ms': round(float(samples.mean()), 3),
+        'p50_ms': round(float(p50), 3),
+        'p95_ms': round(float(p95), 3),
+        'p99_ms': round(float(p99), 3),
+        'min_ms': round(float(samples.min()), 3),
+        'max_ms': round(float(samples.max()), 3)
+    }
+    if elapsed:
+        summary['throughput'] = round(len(samples) / elapsed, 1)
+    return summary
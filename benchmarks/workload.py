@@ -0,0 +1,93 @@
+import copy
+from datetime import datetime, timedelta
+from typing import Iterator, List, Optional
+
+import numpy as np
+
+_SYLLABLES = ['ka', 'lo', 'mi', 'ra', 'ton', 'sel', 'vin', 'dar', 'pe', 'qu',
+              'bri', 'zo', 'fal', 'nu', 'ter', 'gra', 'shi', 'mo', 'lek', 'ash']
+
+
+def zipf_weights(n: int, exponent: float) -> np.ndarray:
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+
+class QueryWorkload:
+    """
+    Synthetic query catalog where both the words inside queries and the
+    queries themselves follow a Zipf distribution, like real search logs: a
+    few head queries dominate and share vocabulary with a long tail. Also
+    produces the keystroke prefixes typed on the way to each query.
+    Everything derives from `seed`, so runs are reproducible.
+    """
+
+    def __init__(self, num_queries: int = 5000, vocabulary_size: int = 2000,
+                 exponent: float = 1.1, seed: int = 42):
+        self.exponent = exponent
+        self.rng = np.random.default_rng(seed)
+        words = self._words(vocabulary_size)
+        word_weights = zipf_weights(len(words), exponent)
+
+        queries = []
+        seen = set()
+        while len(queries) < num_queries:
+            length = int(self.rng.integers(1, 5))
+            query = ' '.join(words[i] for i in self.rng.choice(len(words), size=length, p=word_weights))
+            if query not in seen:
+                seen.add(query)
+                queries.append(query)
+        self.queries = queries
+        self.weights = zipf_weights(len(queries), exponent)
+
+    def _words(self, count: int) -> List[str]:
+        words = []
+        seen = set()
+        while len(words) < count:
+            syllables = self.rng.choice(_SYLLABLES, size=int(self.rng.integers(2, 4)))
+            word = ''.join(syllables)
+            if word not in seen:
+                seen.add(word)
+                words.append(word)
+        return words
+
+    def fork(self, seed: int) -> 'QueryWorkload':
+        """Same catalog with an independent random stream, e.g. one per load-test worker"""
+        workload = copy.copy(self)
+        workload.rng = np.random.default_rng(seed)
+        return workload
+
+    def sample_queries(self, count: int) -> List[str]:
+        return [self.queries[i] for i in self.rng.choice(len(self.queries), size=count, p=self.weights)]
+
+    def keystrokes(self, query: str, min_length: int = 2,
+                   completion_rate: float = 0.6) -> List[str]:
+        """
+        Prefixes typed for `query`, one per keystroke from `min_length` on.
+        With probability 1 - completion_rate the user picks a suggestion
+        part way through and stops typing.
+        """
+        prefixes = [query[:end] for end in range(min_length, len(query) + 1)]
+        if prefixes and self.rng.random() > completion_rate:
+            prefixes = prefixes[:int(self.rng.integers(1, len(prefixes) + 1))]
+        return prefixes
+
+    def sessions(self, count: Optional[int] = None) -> Iterator[List[str]]:
+        """Keystroke sequences for Zipf-sampled queries; endless when `count` is None"""
+        produced = 0
+        while count is None or produced < count:
+            for query in self.sample_queries(1000 if count is None else min(1000, count - produced)):
+                yield self.keystrokes(query)
+                produced += 1
+
+    def history_rows(self, count: int, days: int = 30) -> Iterator[dict]:
+        """SearchHistory rows for `count` logged keystrokes spread over the last `days` days"""
+        now = datetime.utcnow()
+        emitted = 0
+        for prefixes in self.sessions():
+            at = now - timedelta(seconds=float(self.rng.uniform(0, days * 86400)))
+            for offset, prefix in enumerate(prefixes):
+                if emitted >= count:
+                    return
+                yield {'query': prefix, 'timestamp': at + timedelta(milliseconds=150 * offset)}
+                emitted += 1
@@ -1,4 +1,6 @@
+import json
 import os
+import tempfile
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -13,43 +15,191 @@ DB_CONFIG = {
     'password': os.getenv('DB_PASSWORD', ''),
 }
 
-# SQLAlchemy configuration
-SQLALCHEMY_DATABASE_URI = f"postgresql://{DB_CONFIG['user']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}"
+# SQLAlchemy configuration; DATABASE_URL overrides the Postgres settings (e.g. sqlite:///bench.db)
+SQLALCHEMY_DATABASE_URI = os.getenv(
+    'DATABASE_URL',
+    f"postgresql://{DB_CONFIG['user']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}"
+)
+# Optional read replica for read-only scans (training, prefix index, popularity seeding)
+SQLALCHEMY_REPLICA_URI = os.getenv('DATABASE_REPLICA_URL')
 SQLALCHEMY_TRACK_MODIFICATIONS = False
-SQLALCHEMY_POOL_SIZE = 10
-SQLALCHEMY_MAX_OVERFLOW = 20
+# Per worker and per engine; workers * (pool size + overflow) must fit Postgres max_connections
+SQLALCHEMY_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))
+SQLALCHEMY_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 20))
+SQLALCHEMY_POOL_TIMEOUT = 30
+SQLALCHEMY_POOL_RECYCLE = 3600
+SQLALCHEMY_POOL_PRE_PING = True
 
 # Flask configuration
 SECRET_KEY = os.getenv('SECRET_KEY', 'dev-secret-key')
 DEBUG = os.getenv('FLASK_ENV', 'development') == 'development'
+MAX_CONTENT_LENGTH = int(os.getenv('MAX_CONTENT_LENGTH', 64 * 1024))  # Largest request body, in both serving modes
 
 # Content filtering configuration
 CONTENT_FILTER = {
     'min_length': 3,
     'max_length': 100,
     'profanity_check': True,
-    'sentiment_analysis': True
+    'sentiment_analysis': True,
+    'memo_size': 50000,  # Memoized verdicts per normalized text
+    'memo_ttl': 3600,
+    'nlp_batch_size': 64,
+    'spacy_model': os.getenv('SPACY_MODEL', 'en_core_web_sm'),
+    'terms_file': os.getenv('CONTENT_FILTER_TERMS_FILE')  # JSON term lists, see ContentFilterConfig
 }
 
 # AI model configuration
 MODEL_CONFIG = {
     'model_path': 'models/trained/',
     'vectorizer_path': 'models/vectorizer/',
+    'artifact_path': os.getenv('MODEL_ARTIFACT_PATH', 'models/search_predictor.artifact'),  # Memory-mapped model, shared by workers
+    'verify_payload': os.getenv('MODEL_VERIFY_PAYLOAD', 'false').lower() == 'true',  # Also hash every artifact byte on load, not just the metadata
     'min_prediction_confidence': 0.7,
-    'max_suggestions': 5
+    'max_suggestions': 5,
+    'history_days': 30,
+    'training_chunk_size': 50000,  # Distinct queries per streamed training chunk
+    'training_workers': int(os.getenv('TRAINING_WORKERS', '0')),  # Processes per training pass; 0 trains in-process
+    'retrain_threshold': 100,  # New searches since the last build before retraining
+    'min_retrain_interval': 60,  # Seconds between background build attempts
+    'retrain_check_interval': 30  # Seconds between reads of the search count the threshold is checked against
+}
+
+# Models per locale or locale:tenant, loaded on demand in each worker
+MODEL_REGISTRY_CONFIG = {
+    'shards': [shard.strip().lower() for shard in os.getenv('MODEL_SHARDS', '').split(',')
+               if shard.strip()],  # e.g. 'de,fr,en:retail'; other requests use the default model
+    'memory_budget_mb': int(os.getenv('MODEL_MEMORY_BUDGET_MB', '1024'))  # Least recently used shards are evicted past this
+}
+
+# Similar-query lookup configuration
+SIMILARITY_CONFIG = {
+    'neighbors': 5,  # Similar queries scored per lookup
+    'ngram_index': True,  # Prune candidates by character n-grams of the prefix
+    'ngram_size': 3,
+    'max_candidates': 5000  # Rows scored per pruned lookup
+}
+
+# Typo-tolerant completion over a symmetric-delete index
+FUZZY_CONFIG = {
+    'enabled': True,
+    'max_distance': 2,  # Edits tolerated; prefixes under 6 characters get one
+    'prefix_length': 8,  # Leading characters of each query that are indexed
+    'min_length': 3,  # Shorter prefixes are never corrected
+    'max_queries': 20000,  # Most frequent queries indexed, which bounds memory and build time
+    'max_postings': 64,  # Queries kept per delete key
+    'time_budget': 0.003,  # Seconds of candidate verification per lookup, once something matched
+    'max_candidates': 1000  # Candidates verified per lookup at most, matched or not
+}
+
+# Popularity tracking configuration (submitted searches only)
+POPULARITY_CONFIG = {
+    'capacity': 10000,  # Queries tracked per horizon
+    'horizons': {  # Exponential decay time constant in seconds, not a window; None keeps an all-time count
+        'hour': 3600,
+        'day': 86400,
+        '30d': 30 * 86400
+    },
+    'default_horizon': '30d',
+    'refresh_interval': 1.0,  # Seconds between re-sorts of a horizon's ranking
+    'seed_days': 30  # Submitted counts in query stats replayed at startup
+}
+
+# Prefix index configuration
+PREFIX_INDEX_CONFIG = {
+    'top_k': 10,
+    'history_days': 30
+}
+
+# Autocomplete endpoints and their HTTP caching
+AUTOCOMPLETE_CONFIG = {
+    'limit': 10,  # Suggestions per prefix
+    'max_batch_prefixes': 10,  # Prefixes resolved by one batch request
+    'max_age': 60,  # Seconds browsers may reuse a response without revalidating
+    'shared_max_age': 300  # Seconds a CDN or proxy may, for responses without a search ID
+}
+
+# asyncio serving mode (async_app.py)
+ASYNC_CONFIG = {
+    'executor_workers': int(os.getenv('ASYNC_EXECUTOR_WORKERS', '8')),  # Threads for model, filter and cache work
+    'max_pending': int(os.getenv('ASYNC_MAX_PENDING', '2000'))  # Offloaded calls in flight before answering 503
+}
+
+# Write-behind search logging configuration
+SEARCH_LOG_CONFIG = {
+    'batch_size': 500,
+    'flush_interval': 1.0,  # Seconds between flushes of a partial batch
+    'max_pending': 10000,  # Rows buffered in memory before backpressure
+    'enqueue_timeout': 0.01  # Seconds a request waits for space before dropping its row
+}
+
+# Aggregated query statistics, the source for training, ranking and popularity
+QUERY_STATS_CONFIG = {
+    'submitted_weight': 3,  # Ranking weight of a submission on top of its count
+    'min_count': 2,  # Never submitted queries seen fewer times are left out of training and ranking
+    'raw_history': os.getenv('RAW_SEARCH_HISTORY', 'true').lower() == 'true',  # Also log every request to search_history
+    'raw_retention_days': 30,  # Unreferenced search_history rows older than this are purged; None keeps them
+    'retention_interval': 3600  # Seconds between purges
+}
+
+# Persisted blocklist of reported terms, shared by every worker
+BLOCKLIST_CONFIG = {
+    'sync_interval': float(os.getenv('BLOCKLIST_SYNC_INTERVAL', '2.0')),  # Seconds between generation polls
+    'batch_size': 1000  # Terms fetched per query while catching up
+}
+
+# Metrics configuration, exposed in Prometheus format on /metrics
+METRICS_CONFIG = {
+    'enabled': os.getenv('METRICS_ENABLED', 'true').lower() == 'true',
+    'latency_buckets': [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                        0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+}
+
+# On-demand profiling of a live worker under /api/admin, off unless ADMIN_TOKEN is set
+PROFILING_CONFIG = {
+    'admin_token': os.getenv('ADMIN_TOKEN'),  # Bearer token for the admin endpoints
+    'output_dir': os.getenv('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'search-profiles')),
+    'keep': 20,  # Finished profiles kept per worker, the oldest deleted first
+    'max_requests': 1000,  # Requests one cProfile session may cover
+    'max_sample_seconds': 300,  # Longest sampling profiler run
+    'slow_request_seconds': float(os.getenv('SLOW_REQUEST_SECONDS', '0')) or None,  # Unset logs no slow requests
+    'slow_log_size': 200  # Slow requests kept per worker
+}
+
+# Startup warm-up configuration
+WARMUP_CONFIG = {
+    'enabled': os.getenv('WARMUP_ENABLED', 'true').lower() == 'true',
+    'background': True  # Warm up in a thread so the server binds immediately; /ready gates traffic
 }
 
 # Cache configuration
 CACHE_CONFIG = {
-    'CACHE_TYPE': 'redis',
+    'CACHE_TYPE': os.getenv('CACHE_TYPE', 'redis'),  # 'simple' keeps the shared tier in-process
     'CACHE_REDIS_HOST': os.getenv('REDIS_HOST', 'localhost'),
     'CACHE_REDIS_PORT': int(os.getenv('REDIS_PORT', 6379)),
-    'CACHE_DEFAULT_TIMEOUT': 300
+    'CACHE_REDIS_SOCKET_TIMEOUT': 0.05,
+    'CACHE_DEFAULT_TIMEOUT': 300,
+    'CACHE_LOCAL_MAX_SIZE': 10000,  # Entries in each worker's in-process LRU
+    'CACHE_LOCAL_TIMEOUT': 60,
+    'CACHE_SYNC_INTERVAL': 1.0  # Seconds between polls for other workers' invalidations
 }
 
-# API rate limiting
-RATELIMIT_DEFAULT = "100/hour"
-RATELIMIT_STORAGE_URL = "redis://localhost:6379/0"
+# API rate limiting: a token bucket per client IP, bursting up to the limit
+RATELIMIT_ENABLED = os.getenv('RATELIMIT_ENABLED', 'true').lower() == 'true'
+RATELIMIT_DEFAULT = os.getenv('RATELIMIT_DEFAULT', '600/minute')  # Every keystroke is a request
+RATELIMIT_STORAGE_URL = os.getenv('RATELIMIT_STORAGE_URL', 'memory://')  # redis://host:6379/0 shares buckets
+# Proxies (load balancer, CDN) in front of the app; the client IP is taken from that many X-Forwarded-For hops
+PROXY_FIX_HOPS = int(os.getenv('PROXY_FIX_HOPS', 0))
+
+# Degrade autocomplete to cached or prefix-index results with pattern filtering under overload
+LOAD_SHEDDING_CONFIG = {
+    'enabled': os.getenv('LOAD_SHEDDING_ENABLED', 'true').lower() == 'true',
+    'p99_threshold': float(os.getenv('LOAD_SHEDDING_P99', '0.25')),  # Seconds, full-path autocomplete p99
+    'max_in_flight': int(os.getenv('LOAD_SHEDDING_MAX_IN_FLIGHT', '32')),  # Concurrent autocompletes per worker
+    'window': 10.0,  # Seconds of latencies the p99 is taken over
+    'hold': 5.0,  # Seconds to stay degraded once triggered
+    'min_samples': 20,  # Fewer full-path latencies in the window are not enough for a p99
+    'probe_every': 20  # While degraded, every Nth request still takes the full path to measure recovery; 0 never
+}
 
 # CORS configuration
 CORS_ORIGINS = os.getenv('CORS_ORIGINS', '*').split(',')
@@ -76,3 +226,37 @@ LOG_CONFIG = {
         'handlers': ['file']
     }
 }
+
+
+class Config:
+    """Flask settings, loaded with app.config.from_object"""
+    SQLALCHEMY_DATABASE_URI = SQLALCHEMY_DATABASE_URI
+    SQLALCHEMY_TRACK_MODIFICATIONS = SQLALCHEMY_TRACK_MODIFICATIONS
+    SECRET_KEY = SECRET_KEY
+    DEBUG = DEBUG
+    MAX_CONTENT_LENGTH = MAX_CONTENT_LENGTH
+
+
+class DatabaseConfig:
+    """Engine settings, read by the engine registry in utils/database.py"""
+    DATABASE_URI = SQLALCHEMY_DATABASE_URI
+    REPLICA_URI = SQLALCHEMY_REPLICA_URI
+    POOL_SIZE = SQLALCHEMY_POOL_SIZE
+    MAX_OVERFLOW = SQLALCHEMY_MAX_OVERFLOW
+    POOL_TIMEOUT = SQLALCHEMY_POOL_TIMEOUT
+    POOL_RECYCLE = SQLALCHEMY_POOL_RECYCLE
+    POOL_PRE_PING = SQLALCHEMY_POOL_PRE_PING
+
+
+class ContentFilterConfig:
+    """Term lists for the content filter, read from CONTENT_FILTER['terms_file'] if set"""
+
+    def __init__(self):
+        terms = {}
+        if CONTENT_FILTER['terms_file']:
+            with open(CONTENT_FILTER['terms_file']) as f:
+                terms = json.load(f)
+        self.PROFANITY_WORDS = terms.get('PROFANITY_WORDS', {})
+        self.SENSITIVE_PHRASES = terms.get('SENSITIVE_PHRASES', {})
+        self.NEGATIVE_ADJECTIVES = set(terms.get('NEGATIVE_ADJECTIVES', []))
+        self.NEGATIVE_TERMS = set(terms.get('NEGATIVE_TERMS', []))
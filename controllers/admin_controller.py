@@ -0,0 +1,152 @@
+"""
+Admin endpoints for profiling this worker, behind `Authorization: Bearer
+$ADMIN_TOKEN`. Without ADMIN_TOKEN every route answers 404.
+"""
+import hmac
+from functools import wraps
+
+from flask import Blueprint, jsonify, request, send_file
+
+from config.config import PROFILING_CONFIG
+from controllers.search_controller import models
+from models.search_model import DEFAULT_SHARD
+from utils.profiling import ALLOCATIONS, PROFILER, PROFILES, SAMPLER, SLOW_REQUESTS, TRAIN_MODEL
+
+admin_bp = Blueprint('admin', __name__)
+
+
+def admin_required(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = PROFILING_CONFIG['admin_token']
+        if not token:
+            return jsonify({'error': 'Not found'}), 404
+        scheme, _, supplied = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() != 'bearer' or not hmac.compare_digest(supplied.encode(), token.encode()):
+            return jsonify({'error': 'Unauthorized'}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@admin_bp.route('/api/admin/profile', methods=['POST'])
+@admin_required
+def start_profile():
+    """
+    cProfile the next requests or training runs:
+    {"target": "request", "count": 50, "endpoint": "search.get_autocomplete_suggestions"}, or
+    {"target": "train_model", "shard": "de", "run": true} to also start that shard's training now
+    """
+    data = request.get_json(silent=True) or {}
+    target = data.get('target', 'request')
+    name = data.get('shard', DEFAULT_SHARD) if target == TRAIN_MODEL else data.get('endpoint')
+    try:
+        session = PROFILER.arm(target, int(data.get('count', 1 if target == TRAIN_MODEL else 100)), name)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 409
+
+    if target == TRAIN_MODEL and data.get('run'):
+        service = dict(models.loaded()).get(name)
+        if service is None:
+            PROFILER.stop()
+            return jsonify({'error': f"Model shard {name} is not loaded in this worker"}), 404
+        service.schedule_training()
+    return jsonify(session), 202
+
+
+@admin_bp.route('/api/admin/profile', methods=['GET'])
+@admin_required
+def get_profile_session():
+    """The current or last cProfile session"""
+    return jsonify({'session': PROFILER.status()})
+
+
+@admin_bp.route('/api/admin/profile', methods=['DELETE'])
+@admin_required
+def stop_profile():
+    """End the cProfile session early and write what it collected"""
+    return jsonify({'profile': PROFILER.stop()})
+
+
+@admin_bp.route('/api/admin/profile/sample', methods=['POST'])
+@admin_required
+def start_sampling():
+    """Sample every thread's stack: {"seconds": 10, "interval": 0.005}"""
+    data = request.get_json(silent=True) or {}
+    try:
+        return jsonify(SAMPLER.start(float(data.get('seconds', 10)), float(data.get('interval', 0.005)))), 202
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 409
+
+
+@admin_bp.route('/api/admin/profile/sample', methods=['GET'])
+@admin_required
+def get_sampling():
+    return jsonify({'running': SAMPLER.running, 'last': SAMPLER.last})
+
+
+@admin_bp.route('/api/admin/tracemalloc', methods=['POST'])
+@admin_required
+def start_tracemalloc():
+    """Start tracing allocations, keeping {"frames": 10} frames per traceback"""
+    data = request.get_json(silent=True) or {}
+    try:
+        return jsonify(ALLOCATIONS.start(int(data.get('frames', 10))))
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+
+
+@admin_bp.route('/api/admin/tracemalloc', methods=['DELETE'])
+@admin_required
+def stop_tracemalloc():
+    return jsonify(ALLOCATIONS.stop())
+
+
+@admin_bp.route('/api/admin/tracemalloc/snapshot', methods=['GET'])
+@admin_required
+def get_tracemalloc_snapshot():
+    """Top allocators (?limit=20&group=lineno|filename|traceback); the full snapshot is kept for download"""
+    group = request.args.get('group', 'lineno')
+    if group not in ('lineno', 'filename', 'traceback'):
+        return jsonify({'error': 'group must be lineno, filename or traceback'}), 400
+    try:
+        return jsonify(ALLOCATIONS.snapshot(int(request.args.get('limit', 20)), group))
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 409
+
+
+@admin_bp.route('/api/admin/profiles', methods=['GET'])
+@admin_required
+def list_profiles():
+    return jsonify({'profiles': PROFILES.list()})
+
+
+@admin_bp.route('/api/admin/profiles/<profile_id>', methods=['GET'])
+@admin_required
+def download_profile(profile_id):
+    """The profile file: a pstats dump (.prof), folded stacks (.folded) or a tracemalloc snapshot"""
+    profile = PROFILES.get(profile_id)
+    if profile is None:
+        return jsonify({'error': 'Unknown profile'}), 404
+    return send_file(profile['path'], mimetype='application/octet-stream', as_attachment=True,
+                     download_name=profile['filename'])
+
+
+@admin_bp.route('/api/admin/slow-requests', methods=['GET'])
+@admin_required
+def get_slow_requests():
+    return jsonify(dict(SLOW_REQUESTS.stats(), requests=SLOW_REQUESTS.entries()))
+
+
+@admin_bp.route('/api/admin/slow-requests', methods=['PUT'])
+@admin_required
+def set_slow_request_threshold():
+    """{"threshold": 0.2} logs requests slower than 200 ms from now on; null stops logging"""
+    threshold = (request.get_json(silent=True) or {}).get('threshold')
+    if threshold is not None and (not isinstance(threshold, (int, float)) or threshold < 0):
+        return jsonify({'error': 'threshold must be a number of seconds or null'}), 400
+    SLOW_REQUESTS.threshold = threshold
+    return jsonify(SLOW_REQUESTS.stats())
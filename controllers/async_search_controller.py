@@ -0,0 +1,472 @@
+"""
+asyncio serving mode for the keystroke-path endpoints.
+
+    uvicorn async_app:app --host 0.0.0.0 --port 5000
+
+A plain ASGI application sharing search_controller's model, content
+filter, popularity tracker, blocklist and write-behind buffers, and its
+request handling (rate limit headers, request metrics and slow request
+log, profiling, model status, feedback validation), so one process holds
+thousands of open autocomplete requests without a thread each. Nothing
+blocks the event loop: suggestions in the per-process cache are answered
+inline, model, filter and shared-cache work runs on a bounded thread pool
+(503 once it is full), request logging is enqueued without waiting, and
+feedback goes through an async SQLAlchemy session.
+"""
+import asyncio
+import json
+import logging
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from sqlalchemy import select
+
+from config.config import ASYNC_CONFIG, AUTOCOMPLETE_CONFIG, CACHE_CONFIG, MAX_CONTENT_LENGTH, WARMUP_CONFIG
+from controllers.search_controller import (WARM_UP_STEPS, admit, blocklist, check_rate_limit, client_address,
+                                           content_filter, feedback_error, model_status, models, observe_request,
+                                           popular_searches, popularity, prediction_service, query_stats,
+                                           rate_limiter, readiness, search_log)
+from models.base import async_session_factory, db_session, read_session
+from models.search_model import SearchHistory, UserFeedback
+from utils.blocklist import block_term
+from utils.bounded_executor import BoundedExecutor, Overloaded
+from utils.database import registry
+from utils.load_shedder import DEGRADED, FULL
+from utils.metrics import REGISTRY, span
+from utils.profiling import PROFILER, REQUEST
+from utils.warmup import start_warm_up
+
+logger = logging.getLogger(__name__)
+
+executor = BoundedExecutor(workers=ASYNC_CONFIG['executor_workers'],
+                           max_pending=ASYNC_CONFIG['max_pending'])
+
+REGISTRY.gauge('async_executor', 'Offloaded calls from the async serving mode', ['field'],
+               callback=lambda: {(name,): value for name, value in executor.stats().items()})
+
+_CORS_HEADERS = [(b'access-control-allow-origin', b'*')]
+
+
+class _Request:
+    def __init__(self, scope: Dict, body: bytes):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.args = parse_qs(scope.get('query_string', b'').decode('latin-1'), keep_blank_values=True)
+        self.headers = {name.decode('latin-1').lower(): value.decode('latin-1')
+                        for name, value in scope.get('headers', [])}
+        # Same trusted X-Forwarded-For hops as ProxyFix in the WSGI app
+        self.remote_addr = client_address((scope.get('client') or (None,))[0], self.headers.get('x-forwarded-for'))
+        self.body = body
+
+    def arg(self, name: str, default: str = '') -> str:
+        values = self.args.get(name)
+        return values[0] if values else default
+
+    def json(self):
+        return json.loads(self.body) if self.body else None
+
+
+Response = Tuple[int, List[Tuple[bytes, bytes]], bytes]
+
+
+def _json(payload, status: int = 200, headers: Optional[List[Tuple[bytes, bytes]]] = None) -> Response:
+    body = json.dumps(payload).encode('utf-8')
+    return status, [(b'content-type', b'application/json')] + (headers or []), body
+
+
+def _headers(headers: Dict[str, str]) -> List[Tuple[bytes, bytes]]:
+    return [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers.items()]
+
+
+def _cache_headers(etag: str, public: bool) -> List[Tuple[bytes, bytes]]:
+    """Weak ETag plus Cache-Control, as search_controller._cacheable sets them"""
+    max_age = AUTOCOMPLETE_CONFIG['max_age']
+    if public:
+        control = f"public, max-age={max_age}, s-maxage={AUTOCOMPLETE_CONFIG['shared_max_age']}"
+    else:
+        control = f"private, max-age={max_age}"
+    return [(b'etag', f'W/"{etag}"'.encode('latin-1')), (b'cache-control', control.encode('latin-1'))]
+
+
+def _served_headers(mode: str, etag: str, public: bool) -> List[Tuple[bytes, bytes]]:
+    """Serving mode header; degraded responses are not stored, as in search_controller._served"""
+    headers = [(b'x-serving-mode', mode.encode('latin-1'))]
+    if mode == DEGRADED:
+        return headers + [(b'cache-control', b'no-store')]
+    return headers + _cache_headers(etag, public)
+
+
+def _not_modified(request: _Request, etag: str, public: bool) -> Optional[Response]:
+    """A 304 if If-None-Match holds `etag` (compared weakly), else None"""
+    for tag in request.headers.get('if-none-match', '').split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag == '*' or (tag and tag.strip('"') == etag):
+            return 304, _cache_headers(etag, public), b''
+    return None
+
+
+def _offload(fn, *args):
+    """Run on an executor thread, releasing that thread's scoped sessions afterwards"""
+    try:
+        return fn(*args)
+    finally:
+        db_session.remove()
+        read_session.remove()
+
+
+async def _resource(resource):
+    """A LazyResource, loaded off the event loop if warm-up has not finished it yet"""
+    return resource.get() if resource.loaded else await executor.run(resource.get)
+
+
+async def _shard_service(request: _Request):
+    """The requested shard and the service to answer from; a shard not loaded yet loads in the background"""
+    default = await _resource(prediction_service)
+    shard = models.resolve(request.arg('locale'), request.arg('tenant'))
+    service = models.get(shard, wait=False)
+    return shard, service if service is not None else default
+
+
+def _suggest(service, filter_, partial_queries: List[str], limit: int) -> Dict[str, List[str]]:
+    results = service.get_autocomplete_batch(partial_queries, limit=limit)
+    with span('response_filter'):
+        return {prefix: filter_.filter_suggestions(suggestions)[:limit]
+                for prefix, suggestions in results.items()}
+
+
+def _degraded_suggestions(service, filter_, partial_queries: List[str], limit: int) -> Dict[str, List[str]]:
+    """The cheap path, inline: per-process cache or prefix index, pattern filter only"""
+    with span('suggestions'):
+        results = {partial_query: service.get_degraded_suggestions(partial_query, limit, shared=False)
+                   for partial_query in partial_queries}
+    with span('response_filter'):
+        return {partial_query: filter_.filter_suggestions(suggestions, nlp=False)[:limit]
+                for partial_query, suggestions in results.items()}
+
+
+async def _suggestions(service, filter_, partial_queries: List[str], limit: int) -> Tuple[Dict[str, List[str]], str]:
+    """
+    Per-process cache hits inline, one offloaded batch for the rest; or,
+    while the offload queue or full-path latency is over the load shedding
+    limits, the cheap path. Returns the results and the mode that served them.
+    """
+    with admit(executor.pending) as mode:
+        if mode == DEGRADED:
+            return _degraded_suggestions(service, filter_, partial_queries, limit), mode
+        return await _full_suggestions(service, filter_, partial_queries, limit), mode
+
+
+async def _full_suggestions(service, filter_, partial_queries: List[str], limit: int) -> Dict[str, List[str]]:
+    results = {}
+    misses = []
+    with span('suggestions'):
+        for partial_query in partial_queries:
+            cached = service.cached_suggestions(partial_query, limit)
+            if cached is None:
+                misses.append(partial_query)
+            else:
+                results[partial_query] = cached
+        if misses:
+            results.update(await executor.run(_offload, _suggest, service, filter_, misses, limit))
+    with span('response_filter'):
+        # Cached entries passed the full filter when stored; re-checking them against terms
+        # blocked since needs only the term matcher, never spaCy on the event loop
+        for partial_query in partial_queries:
+            if partial_query not in misses:
+                results[partial_query] = filter_.filter_suggestions(results[partial_query], nlp=False)[:limit]
+    return results
+
+
+async def get_autocomplete_suggestions(request: _Request) -> Response:
+    """Get autocomplete suggestions for partial search query"""
+    query = request.arg('q')
+    if not query or len(query.strip()) < 2:
+        return _json({'suggestions': []})
+
+    shard, service = await _shard_service(request)
+    # The shared tier is synced by a background task, not on the loop
+    etag = service.cache_version(sync=False)
+    public = search_log is None
+
+    search_id = str(uuid.uuid4()) if search_log is not None else None
+    with span('search_log_submit'):
+        query_stats.record(query, timeout=0, shard=shard)
+        if search_log is not None:
+            search_log.submit({
+                'search_uuid': search_id,
+                'query': query,
+                'timestamp': datetime.utcnow(),
+                'ip_address': request.remote_addr,
+                'user_agent': request.headers.get('user-agent', '')[:255]
+            }, timeout=0)
+    not_modified = _not_modified(request, etag, public)
+    if not_modified is not None:
+        return not_modified
+
+    filter_ = await _resource(content_filter)
+    limit = AUTOCOMPLETE_CONFIG['limit']
+    results, mode = await _suggestions(service, filter_, [query], limit)
+
+    response = {'suggestions': results[query], 'mode': mode, 'shard': service.shard,
+                'exhaustive': service.is_exhaustive(query, results[query], limit)}
+    if search_id is not None:
+        response['search_id'] = search_id
+    return _json(response, headers=_served_headers(mode, etag, public))
+
+
+async def get_autocomplete_batch(request: _Request) -> Response:
+    """Suggestions for several prefixes at once; nothing is logged, so responses are public"""
+    prefixes = list(dict.fromkeys(request.args.get('q', [])))
+    if len(prefixes) > AUTOCOMPLETE_CONFIG['max_batch_prefixes']:
+        return _json({'error': f"At most {AUTOCOMPLETE_CONFIG['max_batch_prefixes']} prefixes per request"}, 400)
+
+    _, service = await _shard_service(request)
+    etag = service.cache_version(sync=False)
+    not_modified = _not_modified(request, etag, True)
+    if not_modified is not None:
+        return not_modified
+
+    filter_ = await _resource(content_filter)
+    limit = AUTOCOMPLETE_CONFIG['limit']
+    servable = [prefix for prefix in prefixes if len(prefix.strip()) >= 2]
+    results = {prefix: [] for prefix in prefixes}
+    served, mode = await _suggestions(service, filter_, servable, limit)
+    results.update(served)
+    exhaustive = {prefix: service.is_exhaustive(prefix, suggestions, limit) for prefix, suggestions in results.items()}
+    return _json({'results': results, 'exhaustive': exhaustive, 'mode': mode, 'shard': service.shard},
+                 headers=_served_headers(mode, etag, True))
+
+
+async def get_popular_searches(request: _Request) -> Response:
+    """Get the most popular submitted queries, scored by decayed count over ?horizon="""
+    limit = int(request.arg('limit', '10'))
+    horizon = request.arg('horizon', popularity.default_horizon)
+    if horizon not in popularity.horizons:
+        return _json({'error': f"Unknown horizon, expected one of {popularity.horizons}"}, 400)
+    filter_ = await _resource(content_filter)
+    return _json({'popular_searches': popular_searches(limit, horizon, filter_), 'horizon': horizon})
+
+
+async def _resolve_search_id(session, search_id):
+    """Map a client-facing search ID to its SearchHistory primary key"""
+    if isinstance(search_id, int):
+        return search_id
+    statement = select(SearchHistory.id).where(SearchHistory.search_uuid == search_id)
+    history_id = (await session.execute(statement)).scalar()
+    if history_id is None and search_log is not None:
+        # The row may still be sitting in the write-behind buffer
+        await executor.run(search_log.flush)
+        history_id = (await session.execute(statement)).scalar()
+    return history_id
+
+
+def _apply_report(suggestion: str):
+    content_filter.get().add_inappropriate_term(suggestion)
+    for _, service in models.loaded():
+        service.remove_suggestion(suggestion)
+
+
+async def submit_feedback(request: _Request) -> Response:
+    """Submit user feedback for autocomplete suggestions"""
+    try:
+        data = request.json()
+    except ValueError:
+        data = None
+    error = feedback_error(data)
+    if error is not None:
+        return _json(*error)
+    search_id = data.get('search_id')
+    suggestion = data.get('suggestion')
+    is_inappropriate = data.get('is_inappropriate', False)
+
+    async with async_session_factory()() as session:
+        if search_id:
+            with span('resolve_search_id'):
+                search_id = await _resolve_search_id(session, search_id)
+            if search_id is None:
+                return _json({'error': 'Unknown search_id'}, 404)
+
+        session.add(UserFeedback(
+            search_id=search_id,
+            feedback_type='report' if is_inappropriate else 'positive',
+            comment=suggestion,
+            timestamp=datetime.utcnow(),
+            ip_address=request.remote_addr
+        ))
+        with span('feedback_commit'):
+            await session.commit()
+
+        if is_inappropriate:
+            with span('blocklist_commit'):
+                await session.run_sync(block_term, suggestion, 'report')
+
+    if is_inappropriate:
+        await executor.run(_offload, _apply_report, suggestion)
+    else:
+        # A suggestion the user went with counts as a submitted search of its shard
+        query_stats.record(suggestion, submitted=True, timeout=0,
+                           shard=models.resolve(data.get('locale'), data.get('tenant')))
+        popularity.observe(suggestion)
+    return _json({'status': 'success'})
+
+
+async def get_readiness(request: _Request) -> Response:
+    """Report whether the model, filter and index are loaded, with a startup-time breakdown"""
+    report = readiness.report()
+    if prediction_service.loaded:
+        report['components']['model']['stages'] = prediction_service.get().load_timings
+    return _json(report, 200 if report['ready'] else 503)
+
+
+async def get_model_status(request: _Request) -> Response:
+    """Get the serving model generation and background training state, of ?locale=&tenant= if given"""
+    return _json(*model_status(request.arg('locale'), request.arg('tenant')))
+
+
+async def get_model_registry(request: _Request) -> Response:
+    """Loaded model shards with their memory footprint and load latency"""
+    return _json(await executor.run(models.stats))
+
+
+async def get_metrics(request: _Request) -> Response:
+    """Metrics in Prometheus text format, rendered off the loop"""
+    body = await executor.run(REGISTRY.render)
+    return 200, [(b'content-type', b'text/plain; version=0.0.4')], body.encode('utf-8')
+
+
+# Endpoint names match the Flask blueprint's, so request metrics line up across modes
+ROUTES = {
+    ('GET', '/api/search/autocomplete'): ('search.get_autocomplete_suggestions', get_autocomplete_suggestions),
+    ('GET', '/api/search/autocomplete/batch'): ('search.get_autocomplete_batch', get_autocomplete_batch),
+    ('GET', '/api/search/popular'): ('search.get_popular_searches', get_popular_searches),
+    ('POST', '/api/search/feedback'): ('search.submit_feedback', submit_feedback),
+    ('GET', '/api/search/model'): ('search.get_model_status', get_model_status),
+    ('GET', '/api/search/ready'): ('search.get_readiness', get_readiness),
+    ('GET', '/api/search/models'): ('search.get_model_registry', get_model_registry),
+    ('GET', '/metrics'): ('search.get_metrics', get_metrics)
+}
+
+
+async def _sync_shared_cache():
+    """Poll the shared tier's invalidation log off the loop, as cache_version() would per request"""
+    interval = CACHE_CONFIG.get('CACHE_SYNC_INTERVAL', 1.0)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            for _, service in models.loaded():
+                await executor.run(service.cache.sync)
+        except Overloaded:
+            pass
+        except Exception as e:
+            logger.warning(f"Shared cache sync failed: {str(e)}")
+
+
+class AsyncSearchApp:
+    """ASGI application over ROUTES, with warm-up and shutdown in the lifespan protocol"""
+
+    def __init__(self, warm_up: bool = WARMUP_CONFIG['enabled']):
+        self.warm_up = warm_up
+        self._tasks: List[asyncio.Task] = []
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                if self.warm_up:
+                    start_warm_up(WARM_UP_STEPS, background=WARMUP_CONFIG['background'])
+                self._tasks.append(asyncio.create_task(_sync_shared_cache()))
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                for task in self._tasks:
+                    task.cancel()
+                blocklist.stop()
+                models.shutdown(wait=False)
+                executor.shutdown(wait=False)
+                await registry.dispose_async()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @staticmethod
+    async def _rate_limit(endpoint: str, request: _Request) -> Tuple[bool, List[Tuple[bytes, bytes]]]:
+        """search_controller.check_rate_limit, with a shared store consulted off the loop"""
+        if rate_limiter is None or rate_limiter.store.local:
+            allowed, headers = check_rate_limit(endpoint, request.remote_addr)
+        else:
+            allowed, headers = await executor.run(check_rate_limit, endpoint, request.remote_addr)
+        return allowed, _headers(headers)
+
+    @staticmethod
+    async def _read_body(scope, receive) -> Optional[bytes]:
+        """The request body, or None once it is over MAX_CONTENT_LENGTH"""
+        for name, value in scope.get('headers', []):
+            if name == b'content-length' and value.isdigit() and int(value) > MAX_CONTENT_LENGTH:
+                return None
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if len(body) > MAX_CONTENT_LENGTH:
+                return None
+            if not message.get('more_body'):
+                return body
+
+    async def _dispatch(self, endpoint: str, handler, request: _Request) -> Response:
+        allowed, limit_headers = await self._rate_limit(endpoint, request)
+        if not allowed:
+            return _json({'error': 'Rate limit exceeded'}, 429, limit_headers)
+        # Profiles cover the loop thread while the request is in flight, so they include other
+        # requests' coroutines; offloaded work shows up in the sampling profiler instead
+        profile = PROFILER.begin(REQUEST, endpoint) if PROFILER.active else None
+        started = time.perf_counter()
+        try:
+            status, headers, payload = await handler(request)
+        finally:
+            if profile is not None:
+                PROFILER.end(profile, time.perf_counter() - started)
+        return status, headers + limit_headers, payload
+
+    async def _http(self, scope, receive, send):
+        started = time.perf_counter()
+        body = await self._read_body(scope, receive)
+        request = _Request(scope, body or b'')
+
+        endpoint = None
+        if body is None:
+            status, headers, payload = _json({'error': 'Request body too large'}, 413)
+        elif request.method == 'OPTIONS':
+            status, headers, payload = 204, [(b'access-control-allow-methods', b'GET, POST, OPTIONS'),
+                                             (b'access-control-allow-headers', b'Content-Type')], b''
+        else:
+            route = ROUTES.get((request.method, request.path))
+            if route is None:
+                status, headers, payload = _json({'error': 'Not found'}, 404)
+            else:
+                endpoint, handler = route
+                try:
+                    status, headers, payload = await self._dispatch(endpoint, handler, request)
+                except Overloaded:
+                    status, headers, payload = _json({'error': 'Overloaded, retry shortly'}, 503,
+                                                     [(b'retry-after', b'1')])
+                except Exception as e:
+                    status, headers, payload = _json({'error': str(e)}, 500)
+
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': headers + _CORS_HEADERS + [(b'content-length', str(len(payload)).encode())]})
+        await send({'type': 'http.response.body', 'body': payload})
+        if endpoint is not None:
+            query_string = scope.get('query_string', b'').decode('latin-1')
+            observe_request(endpoint, request.method, f"{request.path}?{query_string}", status,
+                            time.perf_counter() - started,
+                            dict(headers).get(b'x-serving-mode', b'').decode() or None)
+
@@ -1,15 +1,336 @@
-from flask import Blueprint, request, jsonify
-from sqlalchemy.exc import SQLAlchemy
+from flask import Blueprint, Response, g, request, jsonify
+from werkzeug.http import parse_list_header
+from contextlib import nullcontext
 from datetime import datetime
+import time
+import uuid
 
-from models.search_model import SearchHistory, AutocompleteSuggestions, UserFeedback
+from models.base import db_session, read_session
+from models.search_model import DEFAULT_SHARD, SearchHistory, UserFeedback
+from services.model_registry import ModelRegistry
+from services.popularity import PopularityTracker
 from services.prediction_service import PredictionService
+from utils.blocklist import BlocklistSync, block_term
 from utils.content_filter import ContentFilter
-from utils.database import db_session
+from utils.load_shedder import DEGRADED, FULL, LoadShedder
+from utils.metrics import REGISTRY, REQUEST_SECONDS, span
+from utils.profiling import PROFILER, REQUEST, SLOW_REQUESTS
+from utils.query_stats import QueryStatsBuffer, purge_search_history
+from utils.rate_limit import RateLimiter, create_bucket_store
+from utils.warmup import LazyResource, Readiness
+from utils.write_behind import WriteBehindBuffer
+from config.config import (AUTOCOMPLETE_CONFIG, BLOCKLIST_CONFIG, LOAD_SHEDDING_CONFIG, MODEL_REGISTRY_CONFIG,
+                           POPULARITY_CONFIG, PROXY_FIX_HOPS, QUERY_STATS_CONFIG, RATELIMIT_DEFAULT, RATELIMIT_ENABLED,
+                           RATELIMIT_STORAGE_URL, SEARCH_LOG_CONFIG)
 
 search_bp = Blueprint('search', __name__)
-prediction_service = PredictionService()
-content_filter = ContentFilter()
+
+# Heavy resources are built on first use or by warm_up(), never at import
+readiness = Readiness(required=['database', 'content_filter', 'nlp', 'blocklist', 'model', 'popularity'])
+content_filter = LazyResource('content_filter', ContentFilter, readiness)
+# One model per configured locale or locale:tenant, loaded when first requested
+models = ModelRegistry(
+    lambda shard: PredictionService(db_session, content_filter=content_filter.get(), popularity=popularity,
+                                    read_session=read_session, shard=shard),
+    shards=MODEL_REGISTRY_CONFIG['shards'],
+    memory_budget=MODEL_REGISTRY_CONFIG['memory_budget_mb'] * 1024 * 1024,
+    after_background_load=lambda: (db_session.remove(), read_session.remove())
+)
+prediction_service = LazyResource('model', lambda: models.get(DEFAULT_SHARD), readiness)
+popularity = PopularityTracker(
+    POPULARITY_CONFIG['horizons'],
+    capacity=POPULARITY_CONFIG['capacity'],
+    refresh_interval=POPULARITY_CONFIG['refresh_interval'],
+    default_horizon=POPULARITY_CONFIG['default_horizon']
+)
+# Raw per-request rows are optional; aggregated query stats are always kept
+search_log = WriteBehindBuffer(SearchHistory, db_session.session_factory, **SEARCH_LOG_CONFIG) \
+    if QUERY_STATS_CONFIG['raw_history'] else None
+_retention_days = QUERY_STATS_CONFIG['raw_retention_days']
+def _check_retrain(shards):
+    """After each query stats batch, loaded shards that counted searches retrain in the background past the threshold"""
+    try:
+        for shard, service in models.loaded():
+            if shard in shards:
+                service.check_retrain()
+    finally:
+        read_session.remove()
+
+query_stats = QueryStatsBuffer(
+    db_session.session_factory,
+    on_written=_check_retrain,
+    maintenance=(lambda session: purge_search_history(session, _retention_days))
+    if _retention_days is not None else None,
+    maintenance_interval=QUERY_STATS_CONFIG['retention_interval'],
+    **SEARCH_LOG_CONFIG
+)
+
+def _apply_blocked_terms(terms):
+    """Apply terms reported on any worker: the filter blocks them and cached entries serving them go"""
+    filter_ = content_filter.get()
+    for term in terms:
+        filter_.add_inappropriate_term(term)
+    for _, service in models.loaded():
+        service.apply_blocked_terms(terms)
+
+# Admission control: a token bucket per client IP, and a cheap autocomplete path under overload
+rate_limiter = RateLimiter(RATELIMIT_DEFAULT, create_bucket_store(RATELIMIT_STORAGE_URL)) \
+    if RATELIMIT_ENABLED else None
+RATE_LIMIT_EXEMPT = {'search.get_readiness', 'search.get_metrics', 'search.get_model_status',
+                     'search.get_model_registry'}
+load_shedder = LoadShedder(**{name: value for name, value in LOAD_SHEDDING_CONFIG.items() if name != 'enabled'}) \
+    if LOAD_SHEDDING_CONFIG['enabled'] else None
+
+def admit(queue_depth=None):
+    """Context yielding the serving mode for an autocomplete request"""
+    return load_shedder.admit(queue_depth) if load_shedder is not None else nullcontext(FULL)
+
+blocklist = BlocklistSync(db_session.session_factory, _apply_blocked_terms,
+                          interval=BLOCKLIST_CONFIG['sync_interval'],
+                          batch_size=BLOCKLIST_CONFIG['batch_size'])
+
+def _cache_lookups():
+    if not prediction_service.loaded:
+        return None
+    stats = prediction_service.get().cache.stats()
+    return {
+        ('local_hit',): stats['local_hits'],
+        ('shared_hit',): stats['shared_hits'],
+        ('miss',): stats['local_misses'] - stats['shared_hits']
+    }
+
+def _cache_hit_ratio():
+    if not prediction_service.loaded:
+        return None
+    stats = prediction_service.get().cache.stats()
+    lookups = stats['local_hits'] + stats['local_misses']
+    return (stats['local_hits'] + stats['shared_hits']) / lookups if lookups else None
+
+def _model_info():
+    if not prediction_service.loaded:
+        return None
+    model = prediction_service.get().model
+    age = (datetime.utcnow() - model.built_at).total_seconds() if model.built_at else None
+    return {('generation',): model.generation, ('age_seconds',): age,
+            ('queries',): len(model.queries), ('prefix_index_size',): len(model.prefix_index)}
+
+REGISTRY.counter('suggestion_cache_lookups_total', 'Suggestion cache lookups by outcome',
+                 ['result'], callback=_cache_lookups)
+REGISTRY.gauge('suggestion_cache_hit_ratio', 'Share of suggestion cache lookups served from either tier',
+               callback=_cache_hit_ratio)
+REGISTRY.gauge('search_model_info', 'Serving model generation, age and size', ['field'],
+               callback=_model_info)
+REGISTRY.gauge('model_shard', 'Memory footprint, load latency and use of each loaded model shard',
+               ['shard', 'field'],
+               callback=lambda: {(shard, field): value
+                                 for shard, info in models.stats()['shards'].items()
+                                 for field, value in [('memory_bytes', info['memory']['total']),
+                                                      ('load_seconds', info['load_seconds']),
+                                                      ('hits', info['hits'])]})
+REGISTRY.gauge('search_log_buffer', 'Write-behind search log counters and backlog', ['field'],
+               callback=lambda: {(name,): value for name, value in search_log.stats().items()}
+               if search_log is not None else None)
+REGISTRY.gauge('query_stats_buffer', 'Write-behind query stats counters and backlog', ['field'],
+               callback=lambda: {(name,): value for name, value in query_stats.stats().items()})
+REGISTRY.counter('rate_limit_decisions_total', 'Rate limiter decisions and store failures', ['result'],
+                 callback=lambda: {(name,): value for name, value in rate_limiter.stats().items()}
+                 if rate_limiter is not None else None)
+REGISTRY.gauge('load_shedder', 'Autocomplete serving modes, in-flight requests and full-path p99', ['field'],
+               callback=lambda: {(name,): value for name, value in load_shedder.stats().items()
+                                 if value is not None} if load_shedder is not None else None)
+REGISTRY.gauge('blocklist_sync', 'Applied blocklist generation and sync counters', ['field'],
+               callback=lambda: {(name,): value for name, value in blocklist.stats().items()
+                                 if value is not None})
+
+def _warm_database():
+    from models.base import init_db
+    with readiness.track('database'):
+        init_db()
+
+def _warm_content_filter():
+    filter_ = content_filter.get()
+    with readiness.track('nlp'):
+        filter_.load_nlp()
+
+def _warm_blocklist():
+    # Everything reported so far, then only the deltas
+    with readiness.track('blocklist'):
+        blocklist.sync()
+    blocklist.start()
+
+def _warm_model():
+    try:
+        prediction_service.get()
+    finally:
+        db_session.remove()
+        read_session.remove()
+
+def _warm_popularity():
+    with readiness.track('popularity'):
+        try:
+            popularity.seed_from_query_stats(read_session, days=POPULARITY_CONFIG['seed_days'])
+        finally:
+            read_session.remove()
+
+# Ordered startup steps, run by app.py before or alongside serving
+WARM_UP_STEPS = [_warm_database, _warm_content_filter, _warm_blocklist, _warm_popularity, _warm_model]
+
+def _shard_service(locale=None, tenant=None):
+    """
+    The requested shard and the service to answer from: the shard's own once
+    loaded, the default model while it loads in the background
+    """
+    default = prediction_service.get()
+    shard = models.resolve(locale, tenant)
+    service = models.get(shard, wait=False)
+    return shard, service if service is not None else default
+
+def _resolve_search_id(search_id):
+    """Map a client-facing search ID to its SearchHistory primary key"""
+    if isinstance(search_id, int):
+        return search_id
+
+    def lookup():
+        return db_session.query(SearchHistory.id)\
+            .filter(SearchHistory.search_uuid == search_id)\
+            .scalar()
+
+    history_id = lookup()
+    if history_id is None and search_log is not None:
+        # The row may still be sitting in the write-behind buffer
+        search_log.flush()
+        history_id = lookup()
+    return history_id
+
+@search_bp.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+@search_bp.before_request
+def start_profile():
+    # One attribute check unless an admin armed a request profile
+    if PROFILER.active:
+        profile = PROFILER.begin(REQUEST, request.endpoint)
+        if profile is not None:
+            g.profile = (profile, time.perf_counter())
+
+# Request handling shared with the async controller, so both serving modes answer alike
+
+def client_address(remote_addr, forwarded_for=None):
+    """
+    The client IP as app.py's ProxyFix sees it: the X-Forwarded-For entry
+    added by the outermost of PROXY_FIX_HOPS trusted proxies, or the peer
+    address when there are none or the header has fewer entries.
+    """
+    if not PROXY_FIX_HOPS or not forwarded_for:
+        return remote_addr
+    hops = parse_list_header(forwarded_for)
+    if len(hops) < PROXY_FIX_HOPS:
+        return remote_addr
+    return hops[-PROXY_FIX_HOPS] or remote_addr
+
+def check_rate_limit(endpoint, client):
+    """
+    Take a token from the client's bucket unless the endpoint is exempt.
+    Returns whether the request may proceed and the headers to send:
+    X-RateLimit-Limit/Remaining, plus Retry-After when it may not.
+    """
+    if rate_limiter is None or endpoint in RATE_LIMIT_EXEMPT:
+        return True, {}
+    allowed, remaining, retry_after = rate_limiter.hit(client or 'unknown')
+    headers = {'X-RateLimit-Limit': str(rate_limiter.limit), 'X-RateLimit-Remaining': str(remaining)}
+    if not allowed:
+        headers['Retry-After'] = str(retry_after)
+    return allowed, headers
+
+def observe_request(endpoint, method, path, status, duration, mode=None):
+    """Request latency metric, and the slow request log when a threshold is set"""
+    REQUEST_SECONDS.observe(duration, endpoint, str(status))
+    if SLOW_REQUESTS.threshold is not None and duration >= SLOW_REQUESTS.threshold:
+        SLOW_REQUESTS.record(duration, endpoint=endpoint, method=method, path=path[:500],
+                             status=status, mode=mode)
+
+def model_status(locale=None, tenant=None):
+    """Status of the shard serving locale/tenant, or 202 with loaded False while it loads"""
+    shard = models.resolve(locale, tenant)
+    service = models.get(shard, wait=False) if shard != DEFAULT_SHARD else prediction_service.get()
+    if service is None:
+        return {'shard': shard, 'loaded': False}, 202
+    return service.model_status(), 200
+
+def popular_searches(limit, horizon, filter_=None):
+    """
+    The `limit` most popular queries over `horizon` that the content filter
+    passes, so reported and blocklisted queries stop ranking at once
+    """
+    filter_ = filter_ or content_filter.get()
+    wanted = limit
+    while True:
+        popular = popularity.top(wanted, horizon)
+        allowed = set(filter_.filter_suggestions([entry['query'] for entry in popular], nlp=False))
+        passed = [entry for entry in popular if entry['query'] in allowed]
+        if len(passed) >= limit or len(popular) < wanted:
+            return passed[:limit]
+        wanted *= 2
+
+def feedback_error(data):
+    """The 4xx body and status for a malformed feedback request, else None"""
+    if not isinstance(data, dict):
+        return {'error': 'Expected a JSON object'}, 400
+    # Without raw history there are no search IDs to point feedback at
+    if not data.get('suggestion') or (search_log is not None and not data.get('search_id')):
+        return {'error': 'Missing required fields'}, 400
+    return None
+
+@search_bp.before_request
+def enforce_rate_limit():
+    """Answer 429 with Retry-After once the client's token bucket is empty"""
+    allowed, headers = check_rate_limit(request.endpoint, request.remote_addr)
+    g.rate_limit_headers = headers
+    if allowed:
+        return None
+    return jsonify({'error': 'Rate limit exceeded'}), 429
+
+@search_bp.after_request
+def add_rate_limit_headers(response):
+    response.headers.update(g.pop('rate_limit_headers', {}))
+    return response
+
+@search_bp.after_request
+def record_request_duration(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        observe_request(request.endpoint, request.method, request.full_path, response.status_code,
+                        time.perf_counter() - started, response.headers.get('X-Serving-Mode'))
+    return response
+
+def _cacheable(response, etag, public):
+    """
+    Weak ETag plus Cache-Control. Only responses that are the same for every
+    user (no search ID) are public, so a CDN or proxy may share them.
+    """
+    response.set_etag(etag, weak=True)
+    response.cache_control.max_age = AUTOCOMPLETE_CONFIG['max_age']
+    if public:
+        response.cache_control.public = True
+        response.cache_control.s_maxage = AUTOCOMPLETE_CONFIG['shared_max_age']
+    else:
+        response.cache_control.private = True
+    return response
+
+def _not_modified(etag, public):
+    """A 304 if the client already holds the response for `etag`, else None"""
+    if request.if_none_match.contains_weak(etag):
+        return _cacheable(Response(status=304), etag, public)
+    return None
+
+def _served(response, mode, etag, public):
+    """Report the serving mode; degraded responses are not stored, so clients get the full ones later"""
+    response.headers['X-Serving-Mode'] = mode
+    if mode == DEGRADED:
+        response.cache_control.no_store = True
+        return response
+    return _cacheable(response, etag, public)
 
 @search_bp.route('/api/search/autocomplete', methods=['GET'])
 def get_autocomplete_suggestions():
@@ -19,63 +340,138 @@ def get_autocomplete_suggestions():
         if not query or len(query.strip()) < 2:
             return jsonify({'suggestions': []})
 
-        # Get predictions from ML model
-        raw_suggestions = prediction_service.get_suggestions(query)
-        
-        # Filter suggestions for inappropriate content
-        filtered_suggestions = [
-            sugg for sugg in raw_suggestions 
-            if not content_filter.is_inappropriate(sugg)
-        ]
-
-        # Log the search query
-        search_history = SearchHistory(
-            query=query,
-            timestamp=datetime.utcnow()
-        )
-        db_session.add(search_history)
-        db_session.commit()
+        # Same model, blocklist and prefix means the same suggestions, so revalidation skips the work
+        shard, service = _shard_service(request.args.get('locale'), request.args.get('tenant'))
+        etag = service.cache_version()
+        public = search_log is None
+        not_modified = _not_modified(etag, public)
 
-        return jsonify({
-            'suggestions': filtered_suggestions[:10],
-            'search_id': search_history.id
-        })
+        # Log the search query through the write-behind buffers, off the request path
+        search_id = str(uuid.uuid4()) if search_log is not None else None
+        with span('search_log_submit'):
+            query_stats.record(query, shard=shard)
+            if search_log is not None:
+                search_log.submit({
+                    'search_uuid': search_id,
+                    'query': query,
+                    'timestamp': datetime.utcnow(),
+                    'ip_address': request.remote_addr,
+                    'user_agent': request.user_agent.string[:255]
+                })
+        if not_modified is not None:
+            return not_modified
+
+        limit = AUTOCOMPLETE_CONFIG['limit']
+        with admit() as mode:
+            # Under overload: cached or prefix index results with the pattern filter only
+            with span('suggestions'):
+                raw_suggestions = service.get_autocomplete_suggestions(query, limit=limit) if mode == FULL \
+                    else service.get_degraded_suggestions(query, limit=limit)
+
+            # Filter suggestions for inappropriate content
+            with span('response_filter'):
+                filtered_suggestions = content_filter.get().filter_suggestions(raw_suggestions,
+                                                                               nlp=mode == FULL)
+
+        suggestions = filtered_suggestions[:limit]
+        response = {'suggestions': suggestions, 'mode': mode, 'shard': service.shard,
+                    'exhaustive': service.is_exhaustive(query, suggestions, limit)}
+        if search_id is not None:
+            response['search_id'] = search_id
+        return _served(jsonify(response), mode, etag, public)
 
     except Exception as e:
         db_session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@search_bp.route('/api/search/autocomplete/batch', methods=['GET'])
+def get_autocomplete_batch():
+    """
+    Suggestions for several prefixes at once (?q=py&q=pyt&q=pyth), e.g. for
+    prefetching the likely next keystrokes. Nothing is logged, so responses
+    are public and cacheable by shared caches.
+    """
+    try:
+        prefixes = list(dict.fromkeys(request.args.getlist('q')))
+        if len(prefixes) > AUTOCOMPLETE_CONFIG['max_batch_prefixes']:
+            return jsonify({'error': f"At most {AUTOCOMPLETE_CONFIG['max_batch_prefixes']} prefixes per request"}), 400
+
+        _, service = _shard_service(request.args.get('locale'), request.args.get('tenant'))
+        etag = service.cache_version()
+        not_modified = _not_modified(etag, True)
+        if not_modified is not None:
+            return not_modified
+
+        limit = AUTOCOMPLETE_CONFIG['limit']
+        servable = [prefix for prefix in prefixes if len(prefix.strip()) >= 2]
+        filter_ = content_filter.get()
+        results = {prefix: [] for prefix in prefixes}
+        with admit() as mode:
+            with span('suggestions'):
+                if mode == FULL:
+                    raw_results = service.get_autocomplete_batch(servable, limit=limit)
+                else:
+                    raw_results = {prefix: service.get_degraded_suggestions(prefix, limit=limit)
+                                   for prefix in servable}
+
+            with span('response_filter'):
+                for prefix, suggestions in raw_results.items():
+                    results[prefix] = filter_.filter_suggestions(suggestions, nlp=mode == FULL)[:limit]
+
+        exhaustive = {prefix: service.is_exhaustive(prefix, suggestions, limit)
+                      for prefix, suggestions in results.items()}
+        return _served(jsonify({'results': results, 'exhaustive': exhaustive, 'mode': mode, 'shard': service.shard}),
+                       mode, etag, True)
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @search_bp.route('/api/search/feedback', methods=['POST'])
 def submit_feedback():
     """Submit user feedback for autocomplete suggestions"""
+    # Outside the try, so a body over MAX_CONTENT_LENGTH is answered with 413
+    data = request.get_json(silent=True)
+    error = feedback_error(data)
+    if error is not None:
+        return jsonify(error[0]), error[1]
     try:
-        data = request.get_json()
         search_id = data.get('search_id')
         suggestion = data.get('suggestion')
         is_inappropriate = data.get('is_inappropriate', False)
-        
-        if not all([search_id, suggestion]):
-            return jsonify({'error': 'Missing required fields'}), 400
+
+        if search_id:
+            with span('resolve_search_id'):
+                search_id = _resolve_search_id(search_id)
+            if search_id is None:
+                return jsonify({'error': 'Unknown search_id'}), 404
 
         # Store user feedback
         feedback = UserFeedback(
             search_id=search_id,
-            suggestion=suggestion,
-            is_inappropriate=is_inappropriate,
-            timestamp=datetime.utcnow()
+            feedback_type='report' if is_inappropriate else 'positive',
+            comment=suggestion,
+            timestamp=datetime.utcnow(),
+            ip_address=request.remote_addr
         )
-        db_session.add(feedback)
+        with span('feedback_commit'):
+            db_session.add(feedback)
+            db_session.commit()
 
-        # If marked inappropriate, add to content filter
+        # If marked inappropriate, persist it for every worker and apply it here right away
         if is_inappropriate:
-            content_filter.add_inappropriate_term(suggestion)
-            
-            # Remove from autocomplete suggestions
-            AutocompleteSuggestions.query.filter_by(
-                suggestion=suggestion
-            ).delete()
-
-        db_session.commit()
+            with span('blocklist_commit'):
+                block_term(db_session, suggestion, reason='report')
+            content_filter.get().add_inappropriate_term(suggestion)
+
+            # Remove from every loaded shard's suggestions and drop the cached entries serving it
+            for _, service in models.loaded():
+                service.remove_suggestion(suggestion)
+        else:
+            # A suggestion the user went with counts as a submitted search of its shard
+            query_stats.record(suggestion, submitted=True,
+                               shard=models.resolve(data.get('locale'), data.get('tenant')))
+            popularity.observe(suggestion)
+
         return jsonify({'status': 'success'})
 
     except Exception as e:
@@ -84,31 +480,56 @@ def submit_feedback():
 
 @search_bp.route('/api/search/popular', methods=['GET'])
 def get_popular_searches():
-    """Get most popular search queries"""
+    """Get the most popular submitted queries, scored by decayed count over ?horizon="""
     try:
         limit = int(request.args.get('limit', 10))
-        
-        popular = SearchHistory.query\
-            .with_entities(
-                SearchHistory.query,
-                db.func.count(SearchHistory.id).label('count')
-            )\
-            .group_by(SearchHistory.query)\
-            .order_by(db.text('count DESC'))\
-            .limit(limit)\
-            .all()
+        horizon = request.args.get('horizon', popularity.default_horizon)
+        if horizon not in popularity.horizons:
+            return jsonify({'error': f"Unknown horizon, expected one of {popularity.horizons}"}), 400
 
+        # Served from incrementally maintained counters, never a table scan
         return jsonify({
-            'popular_searches': [
-                {'query': p.query, 'count': p.count}
-                for p in popular
-            ]
+            'popular_searches': popular_searches(limit, horizon),
+            'horizon': horizon
         })
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@search_bp.route('/api/search/model', methods=['GET'])
+def get_model_status():
+    """Get the serving model generation and background training state, of ?locale=&tenant= if given"""
+    payload, status = model_status(request.args.get('locale'), request.args.get('tenant'))
+    return jsonify(payload), status
+
+@search_bp.route('/api/search/models', methods=['GET'])
+def get_model_registry():
+    """Loaded model shards with their memory footprint and load latency"""
+    return jsonify(models.stats())
+
+@search_bp.route('/api/search/ready', methods=['GET'])
+def get_readiness():
+    """Report whether the model, filter and index are loaded, with a startup-time breakdown"""
+    report = readiness.report()
+    if prediction_service.loaded:
+        report['components']['model']['stages'] = prediction_service.get().load_timings
+    return jsonify(report), 200 if report['ready'] else 503
+
+@search_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Stage timings, pool waits, cache, model and filter metrics in Prometheus text format"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 @search_bp.teardown_request
 def remove_session(exc=None):
-    """Remove database session at the end of each request"""
+    """Remove database sessions at the end of each request"""
     db_session.remove()
+    read_session.remove()
+
+@search_bp.teardown_request
+def end_profile(exc=None):
+    # Teardown runs even when the view raised, so the profiler is always released
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile, started = profile
+        PROFILER.end(profile, time.perf_counter() - started)
@@ -1,19 +1,30 @@
-from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import scoped_session, sessionmaker
-from sqlalchemy import create_engine
 
-from config.config import Config
+from utils.database import PRIMARY, REPLICA, registry
 
-# Initialize SQLAlchemy instance
-db = SQLAlchemy()
-
-# Create engine and session factory
-engine = create_engine(Config.SQLALCHEMY_DATABASE_URI)
+# Engines come from the shared registry, so every session in the process draws on one pool per role
+engine = registry.engine(PRIMARY)
 db_session = scoped_session(sessionmaker(autocommit=False,
                                        autoflush=False,
                                        bind=engine))
 
+# Read-only scans (training, prefix index, popularity seeding); the primary unless a replica is configured
+read_session = scoped_session(sessionmaker(autocommit=False,
+                                         autoflush=False,
+                                         bind=registry.engine(REPLICA)))
+
+_async_session_factory = None
+
+def async_session_factory():
+    """AsyncSession factory on the primary's asyncio engine, for the async serving mode; built on first use"""
+    global _async_session_factory
+    if _async_session_factory is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+        _async_session_factory = async_sessionmaker(registry.async_engine(PRIMARY),
+                                                    autoflush=False, expire_on_commit=False)
+    return _async_session_factory
+
 # Create declarative base
 Base = declarative_base()
 Base.query = db_session.query_property()
@@ -21,9 +32,11 @@ Base.query = db_session.query_property()
 def init_db():
     """Initialize database and create all tables"""
     # Import models here to ensure they are known to SQLAlchemy
-    from models.search_model import SearchHistory, AutocompleteSuggestions, UserFeedback
+    from models.search_model import (SearchHistory, QueryStats, AutocompleteSuggestion, UserFeedback,
+                                     BlockedTerm, BlocklistVersion)
     Base.metadata.create_all(bind=engine)
 
 def shutdown_session(exception=None):
-    """Remove database session at end of request"""
+    """Remove database sessions at end of request"""
     db_session.remove()
+    read_session.remove()
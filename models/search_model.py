@@ -1,12 +1,19 @@
+import re
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float, Text
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float, Text, UniqueConstraint
 from sqlalchemy.orm import relationship
 from models.base import Base
 
+# Shard of the global model; others are a locale or locale:tenant
+DEFAULT_SHARD = 'default'
+# Valid shard names, e.g. 'de' or 'en:retail'
+SHARD_PATTERN = re.compile(r'[a-z0-9_-]{1,32}(:[a-z0-9_-]{1,31})?')
+
 class SearchHistory(Base):
     __tablename__ = 'search_history'
 
     id = Column(Integer, primary_key=True)
+    search_uuid = Column(String(36), unique=True, index=True)  # Client-facing search ID, assigned before insert
     query = Column(String(255), nullable=False)
     user_id = Column(String(100))  # Optional user ID if logged in
     timestamp = Column(DateTime, default=datetime.utcnow)
@@ -20,6 +27,22 @@ class SearchHistory(Base):
     def __repr__(self):
         return f"<SearchHistory(query='{self.query}', timestamp='{self.timestamp}')>"
 
+class QueryStats(Base):
+    __tablename__ = 'query_stats'
+    __table_args__ = (UniqueConstraint('shard', 'query', name='uq_query_stats_shard_query'),)
+
+    id = Column(Integer, primary_key=True)
+    shard = Column(String(64), nullable=False, default=DEFAULT_SHARD)  # Model shard the searches were made in
+    query = Column(String(255), nullable=False)  # Normalized query
+    count = Column(Integer, nullable=False, default=0)  # Every time it was typed or submitted
+    submitted_count = Column(Integer, nullable=False, default=0)  # Times it was submitted or picked
+    first_seen = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_seen = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f"<QueryStats(shard='{self.shard}', query='{self.query}', count={self.count}, " \
+               f"submitted={self.submitted_count})>"
+
 class AutocompleteSuggestion(Base):
     __tablename__ = 'autocomplete_suggestions'
 
@@ -37,6 +60,27 @@ class AutocompleteSuggestion(Base):
     def __repr__(self):
         return f"<AutocompleteSuggestion(suggestion='{self.suggestion}', confidence={self.confidence_score})>"
 
+class BlockedTerm(Base):
+    __tablename__ = 'blocked_terms'
+
+    id = Column(Integer, primary_key=True)
+    term = Column(String(255), nullable=False, unique=True)  # Lowercased, whitespace-normalized
+    generation = Column(Integer, nullable=False, unique=True)  # Blocklist generation that added it
+    reason = Column(String(100))
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<BlockedTerm(term='{self.term}', generation={self.generation})>"
+
+class BlocklistVersion(Base):
+    __tablename__ = 'blocklist_version'
+
+    id = Column(Integer, primary_key=True)  # A single row, id 1
+    generation = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<BlocklistVersion(generation={self.generation})>"
+
 class UserFeedback(Base):
     __tablename__ = 'user_feedback'
 
@@ -0,0 +1,157 @@
+"""
+Out-of-core TF-IDF training over (query, count) chunks.
+
+Distinct queries with their weights are streamed from query_stats in
+chunks, then read twice: the first pass builds the
+vocabulary and document frequencies, the second transforms each chunk with
+the frozen vocabulary. Document frequencies are weighted by count, so the
+IDF equals fitting on every search the weights stand for while the feature
+matrix holds one row per distinct query. Peak memory is the chunk window plus the model itself,
+not the size of the history.
+"""
+from collections import Counter, deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from datetime import datetime
+from functools import partial
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from scipy.sparse import csr_matrix, vstack
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sqlalchemy.orm import Session
+
+from models.search_model import DEFAULT_SHARD
+from utils.query_stats import training_query_counts
+
+Chunk = List[Tuple[str, int]]
+
+# Set in each pool worker by _init_transform_worker
+_worker_vectorizer: Optional[TfidfVectorizer] = None
+
+
+def iter_query_counts(session: Session, since: datetime, as_of: datetime,
+                      chunk_size: int = 50000, shard: str = DEFAULT_SHARD) -> Iterator[Chunk]:
+    """A shard's weighted queries from query_stats, fetched chunk by chunk through a server-side cursor"""
+    rows = training_query_counts(session, since, as_of, shard=shard, chunk_size=chunk_size)
+    chunk = []
+    for query, count in rows:
+        chunk.append((query, count))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _document_frequencies(chunk: Chunk, ngram_range: Tuple[int, int]) -> Tuple[Counter, int]:
+    analyzer = TfidfVectorizer(ngram_range=ngram_range).build_analyzer()
+    frequencies = Counter()
+    documents = 0
+    for query, count in chunk:
+        for term in set(analyzer(query)):
+            frequencies[term] += count
+        documents += count
+    return frequencies, documents
+
+
+def _init_transform_worker(vectorizer: TfidfVectorizer):
+    global _worker_vectorizer
+    _worker_vectorizer = vectorizer
+
+
+def _transform_chunk(chunk: Chunk, vectorizer: Optional[TfidfVectorizer] = None):
+    vectorizer = vectorizer or _worker_vectorizer
+    queries = [query for query, _ in chunk]
+    return queries, [count for _, count in chunk], vectorizer.transform(queries)
+
+
+def _map_chunks(fn: Callable, chunks: Iterable[Chunk], executor: Optional[Executor],
+                window: int) -> Iterator:
+    """fn over chunks in order, with at most `window` chunks in flight"""
+    if executor is None:
+        for chunk in chunks:
+            yield fn(chunk)
+        return
+    pending = deque()
+    for chunk in chunks:
+        pending.append(executor.submit(fn, chunk))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+class ChunkedTfidfTrainer:
+    """
+    Two-pass TF-IDF fit over a re-iterable source of (query, count) chunks.
+    With `workers` > 0 both passes run chunks on a process pool, keeping
+    two chunks per worker in flight.
+    """
+
+    def __init__(self, ngram_range: Tuple[int, int] = (1, 3), min_df: int = 2, workers: int = 0):
+        self.ngram_range = ngram_range
+        self.min_df = min_df
+        self.workers = workers
+
+    def _executor(self, **kwargs) -> Optional[ProcessPoolExecutor]:
+        return ProcessPoolExecutor(max_workers=self.workers, **kwargs) if self.workers > 0 else None
+
+    def fit_vocabulary(self, chunks: Iterable[Chunk]) -> Optional[TfidfVectorizer]:
+        """First pass: a vectorizer with a frozen vocabulary and count-weighted IDF, None if no term survives min_df"""
+        frequencies = Counter()
+        documents = 0
+        executor = self._executor()
+        try:
+            count_chunk = partial(_document_frequencies, ngram_range=self.ngram_range)
+            for chunk_frequencies, chunk_documents in _map_chunks(count_chunk, chunks, executor,
+                                                                  2 * self.workers):
+                frequencies.update(chunk_frequencies)
+                documents += chunk_documents
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        vocabulary = sorted(term for term, df in frequencies.items() if df >= self.min_df)
+        if not vocabulary:
+            return None
+        df = np.array([frequencies[term] for term in vocabulary], dtype=np.float64)
+        del frequencies
+
+        vectorizer = TfidfVectorizer(ngram_range=self.ngram_range, vocabulary=vocabulary)
+        # Same smoothed IDF as TfidfVectorizer.fit over `documents` rows
+        vectorizer.idf_ = np.log((1 + documents) / (1 + df)) + 1
+        return vectorizer
+
+    def transform(self, vectorizer: Optional[TfidfVectorizer],
+                  chunks: Iterable[Chunk]) -> Tuple[List[str], List[int], Optional[csr_matrix]]:
+        """Second pass: queries, their counts and one L2-normalized feature row per query"""
+        queries: List[str] = []
+        counts: List[int] = []
+        if vectorizer is None:
+            for chunk in chunks:
+                queries.extend(query for query, _ in chunk)
+                counts.extend(count for _, count in chunk)
+            return queries, counts, None
+
+        blocks = []
+        executor = self._executor(initializer=_init_transform_worker, initargs=(vectorizer,))
+        try:
+            transform = _transform_chunk if executor is not None \
+                else partial(_transform_chunk, vectorizer=vectorizer)
+            for chunk_queries, chunk_counts, block in _map_chunks(transform, chunks, executor,
+                                                                  2 * self.workers):
+                queries.extend(chunk_queries)
+                counts.extend(chunk_counts)
+                blocks.append(block)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        features = vstack(blocks, format='csr') if blocks \
+            else csr_matrix((0, len(vectorizer.vocabulary_)), dtype=np.float64)
+        return queries, counts, features
+
+    def fit_transform(self, source: Callable[[], Iterable[Chunk]]):
+        """Both passes; `source` is called once per pass and must yield the same rows each time"""
+        vectorizer = self.fit_vocabulary(source())
+        queries, counts, features = self.transform(vectorizer, source())
+        return vectorizer, features, queries, counts
@@ -0,0 +1,173 @@
+import sys
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Set, Tuple
+
+import numpy as np
+
+from utils.query_normalizer import normalize_prefix, normalize_query
+
+
+def deletes(text: str, max_distance: int) -> Set[str]:
+    """`text` and every string obtained from it by deleting up to `max_distance` characters"""
+    variants = {text}
+    frontier = {text}
+    for _ in range(max_distance):
+        frontier = {word[:i] + word[i + 1:] for word in frontier for i in range(len(word))}
+        variants |= frontier
+    return variants
+
+
+def prefix_distance(typed: str, query: str, max_distance: int) -> int:
+    """
+    Smallest optimal-string-alignment distance (adjacent transpositions
+    count as one edit) between `typed` and any prefix of `query`, or
+    max_distance + 1 once it is certainly larger.
+    """
+    m = len(typed)
+    previous = None
+    row = list(range(m + 1))
+    best = row[m]
+    for j, char in enumerate(query[:m + max_distance], 1):
+        current = [j] + [0] * m
+        for i in range(1, m + 1):
+            cost = typed[i - 1] != char
+            current[i] = min(row[i] + 1, current[i - 1] + 1, row[i - 1] + cost)
+            if previous is not None and i > 1 and typed[i - 1] == query[j - 2] \
+                    and typed[i - 2] == char:
+                current[i] = min(current[i], previous[i - 2] + 1)
+        best = min(best, current[m])
+        if min(current) > max_distance:
+            break
+        previous, row = row, current
+    return min(best, max_distance + 1)
+
+
+class SymmetricDeleteIndex:
+    """
+    Typo-tolerant prefix completion in the style of SymSpell. Every prefix
+    of up to `prefix_length` characters of the `max_queries` most frequent
+    queries is indexed under all its deletes within `max_distance`; a typed
+    prefix is looked up under its own deletes, so candidates are found
+    without comparing against the whole history, then verified by edit
+    distance, the likeliest first, until `time_budget` seconds have run out
+    and something matched, and never more than `max_candidates` of them.
+
+    Delete keys are stored as sorted 64-bit str hashes (so the index is
+    only valid in the process that built it) with CSR postings of
+    query ids, which are assigned in descending frequency, and each key
+    keeps at most `max_postings` queries, so memory is bounded by
+    max_queries rather than by the history.
+    """
+
+    def __init__(self, queries: List[str], keys: np.ndarray, indptr: np.ndarray, postings: np.ndarray,
+                 max_distance: int = 2, prefix_length: int = 8, min_length: int = 3,
+                 time_budget: float = 0.003, max_candidates: int = 1000):
+        self.queries = queries
+        self.keys = keys
+        self.indptr = indptr
+        self.postings = postings
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.min_length = min_length
+        self.time_budget = time_budget
+        self.max_candidates = max_candidates
+        self.built_at = datetime.utcnow()
+
+    def __len__(self) -> int:
+        return len(self.queries)
+
+    @classmethod
+    def build(cls, query_counts: Iterable[Tuple[str, int]], max_distance: int = 2,
+              prefix_length: int = 8, min_length: int = 3, max_queries: int = 50000,
+              max_postings: int = 64, time_budget: float = 0.003,
+              max_candidates: int = 1000) -> 'SymmetricDeleteIndex':
+        """Build from (query, count) pairs; queries are normalized and merged like the prefix index"""
+        counts: Dict[str, int] = {}
+        for query, count in query_counts:
+            normalized = normalize_query(query)
+            if normalized:
+                counts[normalized] = counts.get(normalized, 0) + int(count)
+        queries = sorted(counts, key=lambda query: (-counts[query], query))[:max_queries]
+        del counts
+
+        index = cls(queries, np.zeros(0, dtype=np.int64), np.zeros(1, dtype=np.int64),
+                    np.zeros(0, dtype=np.int32), max_distance=max_distance,
+                    prefix_length=prefix_length, min_length=min_length, time_budget=time_budget,
+                    max_candidates=max_candidates)
+        # A prefix of length n can match typed text up to n + max_distance long,
+        # so it needs deletes as deep as the distance allowed for that length
+        depths = {length: index.distance_for(length + max_distance)
+                  for length in range(1, prefix_length + 1)}
+
+        key_hashes: List[int] = []
+        query_ids: List[int] = []
+        for query_id, query in enumerate(queries):
+            variants = set()
+            for length in range(max(1, min_length - 1), min(len(query), prefix_length) + 1):
+                variants |= deletes(query[:length], depths[length])
+            key_hashes.extend(hash(variant) for variant in variants)
+            query_ids.extend([query_id] * len(variants))
+
+        hashes = np.array(key_hashes, dtype=np.int64)
+        ids = np.array(query_ids, dtype=np.int32)
+        del key_hashes, query_ids
+        # Stable sort keeps each key's postings in ascending id, i.e. most frequent first
+        order = np.argsort(hashes, kind='stable')
+        hashes, ids = hashes[order], ids[order]
+        keys, starts = np.unique(hashes, return_index=True)
+        rank = np.arange(len(hashes)) - np.repeat(starts, np.diff(np.append(starts, len(hashes))))
+        keep = rank < max_postings
+        postings = ids[keep]
+        indptr = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum(np.minimum(np.diff(np.append(starts, len(hashes))), max_postings), out=indptr[1:])
+
+        index.keys, index.indptr, index.postings = keys, indptr, postings
+        return index
+
+    def memory_bytes(self) -> int:
+        """Arrays plus the query list and its strings"""
+        return (self.keys.nbytes + self.indptr.nbytes + self.postings.nbytes + sys.getsizeof(self.queries)
+                + sum(sys.getsizeof(query) for query in self.queries))
+
+    def distance_for(self, length: int) -> int:
+        """Edits tolerated in typed text of `length` characters; one is already a lot for a short prefix"""
+        return min(self.max_distance, max(1, length // 3))
+
+    def _candidates(self, typed: str, max_distance: int) -> np.ndarray:
+        """
+        Ids of queries sharing a delete with the head of `typed`, those
+        sharing the most deletes (the likeliest close matches) first, then
+        the most frequent.
+        """
+        variants = deletes(typed[:self.prefix_length], max_distance)
+        hashes = np.fromiter((hash(variant) for variant in variants), dtype=np.int64, count=len(variants))
+        positions = np.searchsorted(self.keys, hashes)
+        inside = positions < len(self.keys)
+        positions, hashes = positions[inside], hashes[inside]
+        positions = positions[self.keys[positions] == hashes]
+        if not len(positions):
+            return positions
+        ids, shared = np.unique(np.concatenate([self.postings[self.indptr[p]:self.indptr[p + 1]]
+                                                for p in positions]), return_counts=True)
+        return ids[np.argsort(-shared, kind='stable')]
+
+    def lookup(self, prefix: str, limit: int = 10) -> List[str]:
+        """Completions of queries within the edit distance of `prefix`, closest then most frequent first"""
+        started = time.perf_counter()
+        typed = normalize_prefix(prefix)
+        if len(typed) < self.min_length or not len(self.keys):
+            return []
+        max_distance = self.distance_for(len(typed))
+
+        matches = []
+        for query_id in self._candidates(typed, max_distance)[:self.max_candidates]:
+            # Past the budget, stop once there is something to show
+            if matches and time.perf_counter() - started > self.time_budget:
+                break
+            query = self.queries[query_id]
+            distance = prefix_distance(typed, query, max_distance)
+            if distance <= max_distance:
+                matches.append((distance, int(query_id), query))
+        matches.sort()
+        return [query for _, _, query in matches[:limit]]
@@ -0,0 +1,254 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+from services.similarity import NgramIndex
+
+MAGIC = b'AISRCHMD'
+FORMAT_VERSION = 3
+# magic, format version, metadata length, payload length, sha256 of the metadata, sha256 of the payload
+_HEADER = struct.Struct('<8sIIQ32s32s')
+_ALIGNMENT = 64
+
+# TfidfVectorizer parameters needed to rebuild its analyzer and weighting
+_VECTORIZER_PARAMS = ('lowercase', 'token_pattern', 'ngram_range', 'analyzer',
+                      'stop_words', 'strip_accents', 'norm', 'use_idf',
+                      'smooth_idf', 'sublinear_tf')
+
+
+class ArtifactError(Exception):
+    """Raised when a model artifact is missing, truncated, corrupt or of another version"""
+
+
+def _align(offset: int) -> int:
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def _encode_strings(strings: Sequence[str]):
+    """Pack strings into one UTF-8 blob plus an offsets array"""
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def write_artifact(path: str, vectorizer: TfidfVectorizer, features,
+                   queries: Sequence[str], metadata: Optional[Dict] = None,
+                   ngram_index: Optional[NgramIndex] = None):
+    """
+    Write a fitted vectorizer, its L2-normalized feature matrix, the query
+    strings and optionally their n-gram index as flat arrays. The file is written next to `path` and renamed
+    into place, so readers only ever see complete artifacts.
+    """
+    features = csr_matrix(features)
+    index_dtype = np.int32 if max(features.nnz, features.shape[1]) < 2 ** 31 else np.int64
+
+    # Feature columns are in sorted vocabulary order, so the byte strings are too
+    vocabulary = np.array(
+        [term.encode('utf-8') for term in vectorizer.get_feature_names_out()],
+        dtype=bytes
+    )
+    query_bytes, query_offsets = _encode_strings(queries)
+    arrays = {
+        'vocabulary': vocabulary,
+        'idf': np.asarray(vectorizer.idf_, dtype=np.float64),
+        'matrix_data': features.data.astype(np.float64, copy=False),
+        'matrix_indices': features.indices.astype(index_dtype, copy=False),
+        'matrix_indptr': features.indptr.astype(index_dtype, copy=False),
+        'query_bytes': query_bytes,
+        'query_offsets': query_offsets
+    }
+    if ngram_index is not None:
+        arrays['ngram_keys'] = ngram_index.keys
+        arrays['ngram_indptr'] = ngram_index.indptr
+        arrays['ngram_rows'] = ngram_index.rows
+
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        offset = _align(offset)
+        layout[name] = {'offset': offset, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+        offset += array.nbytes
+    payload_length = offset
+
+    params = vectorizer.get_params()
+    meta = dict(metadata or {})
+    meta['arrays'] = layout
+    meta['matrix_shape'] = list(features.shape)
+    meta['vectorizer'] = {name: params[name] for name in _VECTORIZER_PARAMS}
+    meta['ngram_size'] = ngram_index.n if ngram_index is not None else None
+    meta_bytes = json.dumps(meta, default=str).encode('utf-8')
+    payload_start = _align(_HEADER.size + len(meta_bytes))
+
+    meta_digest = hashlib.sha256(meta_bytes).digest()
+    digest = hashlib.sha256()
+    # A private temp file per writer, in the same directory so the rename is atomic: workers
+    # training at the same time never write into each other's file
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp',
+                                    dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            # Header is rewritten with the payload checksum once the payload is out
+            f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(meta_bytes), payload_length, meta_digest, b'\0' * 32))
+            f.write(meta_bytes)
+            f.write(b'\0' * (payload_start - _HEADER.size - len(meta_bytes)))
+            position = 0
+            for name, array in arrays.items():
+                padding = b'\0' * (layout[name]['offset'] - position)
+                data = memoryview(np.ascontiguousarray(array)).cast('B')
+                for chunk in (padding, data):
+                    digest.update(chunk)
+                    f.write(chunk)
+                position = layout[name]['offset'] + array.nbytes
+            f.seek(0)
+            f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(meta_bytes), payload_length, meta_digest,
+                                 digest.digest()))
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _csr_view(data: np.ndarray, indices: np.ndarray, indptr: np.ndarray, shape) -> csr_matrix:
+    """
+    Wrap mapped arrays in a CSR matrix without copying. The (data, indices,
+    indptr) constructor copies arrays that are small views of a larger
+    buffer, which is exactly what slices of the mapped file are.
+    """
+    matrix = csr_matrix(shape, dtype=data.dtype)
+    matrix.data = data
+    matrix.indices = indices
+    matrix.indptr = indptr
+    return matrix
+
+
+class QueryList(Sequence[str]):
+    """Read-only list of query strings decoded on access from a packed UTF-8 blob"""
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self._data = data
+        self._offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        start, end = self._offsets[i], self._offsets[i + 1]
+        return self._data[start:end].tobytes().decode('utf-8')
+
+
+class ModelArtifact:
+    """
+    A memory-mapped model artifact. Arrays are views into the mapped file,
+    so every worker opening the same artifact shares one page-cache copy.
+    Opening checks the header and hashes only the metadata, unless
+    `verify_payload` asks for a hash of every mapped byte as well.
+    Acts as the vectorizer of a loaded model generation via transform().
+    """
+
+    def __init__(self, path: str, verify_payload: bool = False):
+        self.path = path
+        try:
+            with open(path, 'rb') as f:
+                # The file this mapping holds, which a rename over `path` replaces
+                stat = os.fstat(f.fileno())
+                self.identity = (stat.st_dev, stat.st_ino)
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            raise ArtifactError(f"Cannot open model artifact {path}: {str(e)}")
+
+        if len(self._mmap) < _HEADER.size:
+            raise ArtifactError(f"Model artifact {path} is truncated")
+        magic, version, meta_length, payload_length, meta_checksum, payload_checksum = \
+            _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ArtifactError(f"{path} is not a model artifact")
+        if version != FORMAT_VERSION:
+            raise ArtifactError(f"Model artifact {path} has format version {version}, "
+                                f"expected {FORMAT_VERSION}")
+
+        meta_end = _HEADER.size + meta_length
+        payload_start = _align(meta_end)
+        if len(self._mmap) != payload_start + payload_length:
+            raise ArtifactError(f"Model artifact {path} is truncated")
+        if hashlib.sha256(memoryview(self._mmap)[_HEADER.size:meta_end]).digest() != meta_checksum:
+            raise ArtifactError(f"Model artifact {path} failed metadata checksum verification")
+        if verify_payload and hashlib.sha256(memoryview(self._mmap)[payload_start:]).digest() != payload_checksum:
+            raise ArtifactError(f"Model artifact {path} failed checksum verification")
+
+        self.metadata = json.loads(bytes(self._mmap[_HEADER.size:meta_end]))
+        buffer = np.frombuffer(self._mmap, dtype=np.uint8, offset=payload_start)
+        arrays = {}
+        for name, spec in self.metadata['arrays'].items():
+            dtype = np.dtype(spec['dtype'])
+            count = int(np.prod(spec['shape']))
+            arrays[name] = np.frombuffer(buffer, dtype=dtype, count=count, offset=spec['offset'])
+
+        self.vocabulary = arrays['vocabulary']
+        self.idf = arrays['idf']
+        self.matrix = _csr_view(arrays['matrix_data'], arrays['matrix_indices'],
+                                arrays['matrix_indptr'], tuple(self.metadata['matrix_shape']))
+        self.queries = QueryList(arrays['query_bytes'], arrays['query_offsets'])
+        self.ngram_index = NgramIndex(arrays['ngram_keys'], arrays['ngram_indptr'],
+                                      arrays['ngram_rows'], self.metadata['ngram_size']) \
+            if 'ngram_keys' in arrays else None
+        self.params = self.metadata['vectorizer']
+        params = dict(self.params, ngram_range=tuple(self.params['ngram_range']))
+        self._analyzer = TfidfVectorizer(**params).build_analyzer()
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the mapping; pages are shared by every process mapping the same file"""
+        return len(self._mmap)
+
+    def transform(self, texts: Iterable[str]) -> csr_matrix:
+        """TF-IDF weight `texts` exactly as the fitted vectorizer would"""
+        indptr = [0]
+        indices: List[int] = []
+        values: List[float] = []
+        for text in texts:
+            terms = [term.encode('utf-8') for term in self._analyzer(text)]
+            if terms:
+                candidates = np.array(terms, dtype=bytes)
+                positions = np.searchsorted(self.vocabulary, candidates)
+                positions[positions >= len(self.vocabulary)] = 0
+                known = positions[self.vocabulary[positions] == candidates] \
+                    if len(self.vocabulary) else positions[:0]
+                columns, counts = np.unique(known, return_counts=True)
+                indices.extend(columns.tolist())
+                values.extend(counts.tolist())
+            indptr.append(len(indices))
+
+        matrix = csr_matrix(
+            (np.asarray(values, dtype=np.float64), np.asarray(indices, dtype=np.int64), indptr),
+            shape=(len(indptr) - 1, len(self.vocabulary))
+        )
+        if self.params['sublinear_tf']:
+            np.log(matrix.data, matrix.data)
+            matrix.data += 1
+        if self.params['use_idf']:
+            matrix.data *= self.idf[matrix.indices]
+        if self.params['norm']:
+            matrix = normalize(matrix, norm=self.params['norm'], copy=False)
+        return matrix
@@ -0,0 +1,57 @@
+from datetime import datetime
+from typing import Dict, Optional, Sequence
+
+from services.fuzzy_index import SymmetricDeleteIndex
+from services.prefix_index import PrefixIndex
+from services.similarity import SimilarityEngine
+
+
+class ModelGeneration:
+    """
+    One complete, immutable model build: vectorizer, similarity engine,
+    feature matrix, the queries they were fitted on and the matching prefix
+    and fuzzy indexes.
+    Serving code reads a single generation reference per request, so a new
+    build can be swapped in atomically while requests are in flight.
+    """
+
+    def __init__(self, generation: int = 0, vectorizer=None,
+                 similarity: Optional[SimilarityEngine] = None, features=None,
+                 queries: Optional[Sequence[str]] = None,
+                 prefix_index: Optional[PrefixIndex] = None,
+                 watermark: int = 0, built_at: Optional[datetime] = None,
+                 build_duration: float = 0.0, fuzzy_index: Optional[SymmetricDeleteIndex] = None):
+        self.generation = generation
+        self.vectorizer = vectorizer
+        self.similarity = similarity
+        self.features = features
+        self.queries = queries if queries is not None else []
+        self.prefix_index = prefix_index if prefix_index is not None else PrefixIndex()
+        self.watermark = watermark
+        self.built_at = built_at
+        self.build_duration = build_duration
+        self.fuzzy_index = fuzzy_index
+
+    @property
+    def is_trained(self) -> bool:
+        return self.vectorizer is not None and self.similarity is not None and bool(self.queries)
+
+    def replace(self, **changes) -> 'ModelGeneration':
+        """Return a copy with the given attributes replaced"""
+        attrs = dict(self.__dict__)
+        attrs.update(changes)
+        return ModelGeneration(**attrs)
+
+    def to_dict(self) -> Dict:
+        return {
+            'generation': self.generation,
+            'built_at': self.built_at.isoformat() if self.built_at else None,
+            'build_duration': round(self.build_duration, 3),
+            'watermark': self.watermark,
+            'query_count': len(self.queries),
+            'prefix_index_size': len(self.prefix_index),
+            'fuzzy_index_size': len(self.fuzzy_index) if self.fuzzy_index is not None else 0
+        }
+
+    def __repr__(self):
+        return f"<ModelGeneration(generation={self.generation}, watermark={self.watermark})>"
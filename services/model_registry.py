@@ -0,0 +1,158 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from models.search_model import DEFAULT_SHARD, SHARD_PATTERN
+from services.prediction_service import PredictionService
+
+
+class ModelRegistry:
+    """
+    Prediction services keyed by shard: a locale, a locale:tenant, or the
+    default model. A shard is loaded the first time it is asked for (its
+    artifact mapped, or trained from its own query stats), so a worker only
+    holds the shards its traffic needs, and the least recently used ones are
+    evicted once the loaded footprints add up to more than `memory_budget`
+    bytes. The default shard is never evicted. Only configured shards can
+    be loaded, so request parameters cannot grow the registry.
+    """
+
+    def __init__(self, factory: Callable[[str], PredictionService], shards: Iterable[str] = (),
+                 memory_budget: int = 1024 * 1024 * 1024,
+                 after_background_load: Optional[Callable[[], None]] = None):
+        invalid = [shard for shard in shards if not SHARD_PATTERN.fullmatch(shard)]
+        if invalid:
+            raise ValueError(f"Invalid model shard names: {', '.join(invalid)}")
+        self.factory = factory
+        self.shards = set(shards) | {DEFAULT_SHARD}
+        self.memory_budget = memory_budget
+        self.after_background_load = after_background_load
+        self.logger = logging.getLogger(__name__)
+
+        self._services: 'OrderedDict[str, PredictionService]' = OrderedDict()
+        self._info: Dict[str, Dict] = {}
+        self._loading: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix='model-loader')
+        self._stats = {'loads': 0, 'load_errors': 0, 'evictions': 0}
+
+    def resolve(self, locale: Optional[str] = None, tenant: Optional[str] = None) -> str:
+        """The most specific configured shard for a request: locale:tenant, then locale, then the default"""
+        locale = (locale or '').strip().lower()
+        tenant = (tenant or '').strip().lower()
+        if locale and tenant and f"{locale}:{tenant}" in self.shards:
+            return f"{locale}:{tenant}"
+        if locale in self.shards:
+            return locale
+        return DEFAULT_SHARD
+
+    def get(self, shard: str = DEFAULT_SHARD, wait: bool = True) -> Optional[PredictionService]:
+        """
+        The service for `shard`, loading it if needed. With wait=False a
+        shard that is not loaded yet is loaded on the background loader and
+        None is returned, so the caller can serve the default model meanwhile.
+        """
+        with self._lock:
+            service = self._services.get(shard)
+            if service is not None:
+                self._services.move_to_end(shard)
+                info = self._info[shard]
+                info['hits'] += 1
+                info['last_used'] = time.time()
+                return service
+            if shard not in self.shards:
+                raise KeyError(f"Unknown model shard: {shard}")
+            future = self._loading.get(shard)
+            owner = future is None
+            if owner:
+                future = self._loading[shard] = Future()
+
+        if owner:
+            if wait:
+                self._load(shard, future)
+            else:
+                self._loader.submit(self._load_in_background, shard, future)
+        if not wait:
+            return None
+        return future.result()
+
+    def _load_in_background(self, shard: str, future: Future):
+        try:
+            self._load(shard, future)
+        finally:
+            if self.after_background_load is not None:
+                self.after_background_load()
+
+    def _load(self, shard: str, future: Future):
+        started = time.perf_counter()
+        try:
+            service = self.factory(shard)
+        except Exception as e:
+            self.logger.error(f"Error loading model shard {shard}: {str(e)}")
+            with self._lock:
+                self._stats['load_errors'] += 1
+                del self._loading[shard]
+            future.set_exception(e)
+            return
+
+        now = time.time()
+        with self._lock:
+            self._services[shard] = service
+            self._info[shard] = {'load_seconds': round(time.perf_counter() - started, 3),
+                                 'loaded_at': now, 'last_used': now, 'hits': 0}
+            self._stats['loads'] += 1
+            del self._loading[shard]
+        future.set_result(service)
+        self.enforce_budget(keep=shard)
+
+    def enforce_budget(self, keep: Optional[str] = None) -> List[str]:
+        """Evict least recently used shards, never the default or `keep`, until the rest fit the budget"""
+        footprints = {shard: service.memory_footprint()['total'] for shard, service in self.loaded()}
+        evicted = []
+        with self._lock:
+            total = sum(footprints.get(shard, 0) for shard in self._services)
+            for shard in list(self._services):
+                if total <= self.memory_budget:
+                    break
+                if shard in (DEFAULT_SHARD, keep):
+                    continue
+                evicted.append(self._services.pop(shard))
+                del self._info[shard]
+                total -= footprints.get(shard, 0)
+                self._stats['evictions'] += 1
+                self.logger.info(f"Evicted model shard {shard} to stay within the memory budget")
+        for service in evicted:
+            # Requests already holding the service finish on it; only its trainer stops
+            service.shutdown(wait=False)
+        if total > self.memory_budget:
+            self.logger.warning(f"Loaded model shards use {total} bytes, over the {self.memory_budget} byte budget")
+        return [service.shard for service in evicted]
+
+    def loaded(self) -> List[Tuple[str, PredictionService]]:
+        """Loaded (shard, service) pairs, least recently used first"""
+        with self._lock:
+            return list(self._services.items())
+
+    def shutdown(self, wait: bool = True):
+        self._loader.shutdown(wait=wait)
+        for _, service in self.loaded():
+            service.shutdown(wait=wait)
+
+    def stats(self) -> Dict:
+        """Per-shard memory footprint and load latency, with registry totals"""
+        loaded = self.loaded()
+        footprints = {shard: service.memory_footprint() for shard, service in loaded}
+        with self._lock:
+            shards = {shard: dict(self._info[shard], memory=footprints[shard],
+                                  generation=service.model.generation,
+                                  load_timings=dict(service.load_timings))
+                      for shard, service in loaded if shard in self._info}
+            return dict(self._stats,
+                        configured=sorted(self.shards),
+                        loading=sorted(self._loading),
+                        memory_budget=self.memory_budget,
+                        memory_total=sum(footprint['total'] for footprint in footprints.values()),
+                        shards=shards)
@@ -0,0 +1,213 @@
+import heapq
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from models.search_model import QueryStats
+from utils.query_normalizer import normalize_query
+
+_EPOCH = datetime(1970, 1, 1)
+# Fold the decay into the stored scores before exp() gets anywhere near overflow
+_MAX_EXPONENT = 50.0
+
+
+def _to_epoch(timestamp: Optional[datetime]) -> float:
+    if timestamp is None:
+        return time.time()
+    return (timestamp.replace(tzinfo=None) - _EPOCH).total_seconds()
+
+
+def _spread_factor(duration: float, time_constant: Optional[float]) -> float:
+    """
+    Decayed weight, relative to one search at the end of the interval, of a
+    search spread evenly over `duration` seconds: the integral of
+    exp(-t / time_constant) over the interval divided by its length.
+    """
+    if time_constant is None or duration <= 0:
+        return 1.0
+    return -math.expm1(-duration / time_constant) * time_constant / duration
+
+
+class DecayedTopK:
+    """
+    Weighted Space-Saving summary of the `capacity` heaviest queries (a new
+    query evicting the minimum inherits its score as an overcount), with
+    optional exponential time decay. Decay uses a forward landmark: a search
+    at time t adds exp((t - landmark) / time_constant), so scores only grow,
+    their order never changes with the clock, and the decayed count is the
+    score scaled by one shared factor at read time.
+    """
+
+    def __init__(self, capacity: int, time_constant: Optional[float] = None):
+        self.capacity = capacity
+        self.time_constant = time_constant
+        self.landmark = time.time()
+        self._scores: Dict[str, float] = {}
+        # Lazy min-heap of (score when pushed, query); stale entries are re-pushed on pop
+        self._heap: List[Tuple[float, str]] = []
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def _weight(self, at: float) -> float:
+        if self.time_constant is None:
+            return 1.0
+        exponent = (at - self.landmark) / self.time_constant
+        if exponent > _MAX_EXPONENT:
+            self._rescale(at)
+            exponent = 0.0
+        return math.exp(exponent)
+
+    def _rescale(self, at: float):
+        factor = math.exp(-(at - self.landmark) / self.time_constant)
+        self._scores = {query: score * factor for query, score in self._scores.items()}
+        self._heap = [(score * factor, query) for score, query in self._heap]
+        self.landmark = at
+
+    def _pop_min(self) -> Tuple[str, float]:
+        while True:
+            score, query = heapq.heappop(self._heap)
+            current = self._scores[query]
+            if current == score:
+                return query, score
+            heapq.heappush(self._heap, (current, query))
+
+    def add(self, query: str, at: float, count: int = 1):
+        weight = self._weight(at) * count
+        if query in self._scores:
+            self._scores[query] += weight
+            return
+        error = 0.0
+        if len(self._scores) >= self.capacity:
+            evicted, error = self._pop_min()
+            del self._scores[evicted]
+        self._scores[query] = error + weight
+        heapq.heappush(self._heap, (self._scores[query], query))
+
+    def scale(self, at: float, landmark: Optional[float] = None) -> float:
+        """Factor turning scores stored against `landmark` into decayed counts as of `at`"""
+        if self.time_constant is None:
+            return 1.0
+        return math.exp(-(at - (landmark or self.landmark)) / self.time_constant)
+
+    def score(self, query: str) -> float:
+        return self._scores.get(query, 0.0)
+
+    def ranked(self) -> List[Tuple[str, float]]:
+        return sorted(self._scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+class PopularityTracker:
+    """
+    Incrementally maintained popularity of submitted queries over several
+    decay horizons. Each horizon is a DecayedTopK whose time constant is the
+    horizon (None means an undecayed all-time count): a search counts fully
+    now and e^-1 as much one horizon later, so a horizon is not a window and
+    its scores are decayed counts, not integers. Recording a search is
+    O(log capacity) and reading the top queries is a slice of a ranking that
+    is re-sorted at most every `refresh_interval` seconds.
+
+    Only submitted searches are observed, never autocomplete keystrokes,
+    so partial prefixes do not rank. Counts are per process: every worker
+    seeds from the submitted counts in query stats at startup and then sees
+    its own traffic.
+    """
+
+    def __init__(self, horizons: Dict[str, Optional[float]], capacity: int = 10000,
+                 refresh_interval: float = 1.0, default_horizon: Optional[str] = None):
+        self.capacity = capacity
+        self.refresh_interval = refresh_interval
+        self._horizons = {name: DecayedTopK(capacity, seconds) for name, seconds in horizons.items()}
+        self.default_horizon = default_horizon or next(iter(self._horizons))
+        # horizon -> (refreshed at, landmark of the scores, ranking)
+        self._rankings: Dict[str, Tuple[float, float, List[Tuple[str, float]]]] = {}
+        self._dirty = set(self._horizons)
+        self._lock = threading.Lock()
+
+    @property
+    def horizons(self) -> List[str]:
+        return list(self._horizons)
+
+    def observe(self, query: str, timestamp: Optional[datetime] = None, count: int = 1):
+        """Record `count` submitted searches for `query` at `timestamp` (now by default)"""
+        normalized = normalize_query(query)
+        if not normalized:
+            return
+        at = _to_epoch(timestamp)
+        with self._lock:
+            for summary in self._horizons.values():
+                summary.add(normalized, at, count)
+            self._dirty.update(self._horizons)
+
+    def observe_spread(self, query: str, first_seen: datetime, last_seen: datetime, count: int):
+        """Record `count` submitted searches assumed evenly spread from first_seen to last_seen"""
+        normalized = normalize_query(query)
+        if not normalized:
+            return
+        start, end = _to_epoch(first_seen), _to_epoch(last_seen)
+        with self._lock:
+            for summary in self._horizons.values():
+                summary.add(normalized, end, count * _spread_factor(end - start, summary.time_constant))
+            self._dirty.update(self._horizons)
+
+    def seed_from_query_stats(self, db_session: Session, days: int = 30) -> int:
+        """Seed from queries submitted in the last `days` days of query_stats; returns the queries read"""
+        cutoff_date = datetime.utcnow() - timedelta(days=days)
+        rows = db_session.query(QueryStats.query, QueryStats.submitted_count,
+                                QueryStats.first_seen, QueryStats.last_seen)\
+            .filter(QueryStats.last_seen >= cutoff_date, QueryStats.submitted_count > 0)\
+            .yield_per(10000)
+        seen = 0
+        for query, count, first_seen, last_seen in rows:
+            if first_seen < cutoff_date:
+                # Only the share of the count that falls inside the seeding period
+                count *= (last_seen - cutoff_date) / (last_seen - first_seen)
+                first_seen = cutoff_date
+            self.observe_spread(query, first_seen, last_seen, count)
+            seen += 1
+        return seen
+
+    def _ranking(self, horizon: str) -> Tuple[float, List[Tuple[str, float]]]:
+        refreshed_at, landmark, ranking = self._rankings.get(horizon, (0.0, 0.0, []))
+        now = time.monotonic()
+        if horizon in self._dirty and now - refreshed_at >= self.refresh_interval:
+            with self._lock:
+                summary = self._horizons[horizon]
+                landmark, ranking = summary.landmark, summary.ranked()
+                self._dirty.discard(horizon)
+            self._rankings[horizon] = (now, landmark, ranking)
+        return landmark, ranking
+
+    def top(self, limit: int = 10, horizon: Optional[str] = None) -> List[Dict]:
+        """The `limit` most popular queries over `horizon`, scored by their decayed counts"""
+        name = horizon or self.default_horizon
+        if name not in self._horizons:
+            raise KeyError(name)
+        landmark, ranking = self._ranking(name)
+        scale = self._horizons[name].scale(time.time(), landmark)
+        popular = []
+        for query, score in ranking[:limit]:
+            score = round(score * scale, 2)
+            if not score:
+                # Ranking is descending, so everything after has decayed away too
+                break
+            popular.append({'query': query, 'score': score})
+        return popular
+
+    def score(self, query: str, horizon: Optional[str] = None) -> float:
+        """Decayed count of `query`, for use as a ranking signal"""
+        summary = self._horizons[horizon or self.default_horizon]
+        normalized = normalize_query(query)
+        with self._lock:
+            return summary.score(normalized) * summary.scale(time.time())
+
+    def scores(self, queries: Iterable[str], horizon: Optional[str] = None) -> Dict[str, float]:
+        return {query: self.score(query, horizon) for query in queries}
+
+    def stats(self) -> Dict:
+        return {name: {'tracked': len(summary), 'time_constant': summary.time_constant}
+                for name, summary in self._horizons.items()}
@@ -1,126 +1,542 @@
 from typing import List, Dict, Optional
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.neighbors import NearestNeighbors
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-import joblib
+import fcntl
+import hashlib
 import os
-from models.search_model import SearchHistory, AutocompleteSuggestions
+import threading
+import time
+from models.search_model import DEFAULT_SHARD, SearchHistory, AutocompleteSuggestion
+from services.chunked_training import ChunkedTfidfTrainer, iter_query_counts
+from services.fuzzy_index import SymmetricDeleteIndex
+from services.model_artifact import ArtifactError, ModelArtifact, write_artifact
+from services.model_generation import ModelGeneration
+from services.popularity import PopularityTracker
+from services.prefix_index import PrefixIndex
+from services.similarity import NgramIndex, SimilarityEngine
+from utils.cache import SuggestionCache, create_suggestion_cache
 from utils.content_filter import ContentFilter
-from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
+from utils.metrics import span
+from utils.profiling import PROFILER, TRAIN_MODEL
+from utils.query_normalizer import normalize_query
+from utils.query_stats import (aggregate, query_event, total_searches, training_query_counts,
+                               upsert_query_stats)
+from utils.term_matcher import TermMatcher
+from config.config import (CACHE_CONFIG, FUZZY_CONFIG, MODEL_CONFIG, PREFIX_INDEX_CONFIG,
+                           QUERY_STATS_CONFIG, SIMILARITY_CONFIG)
+from sqlalchemy.orm import Session, scoped_session
+
+def shard_artifact_path(shard: str) -> str:
+    """MODEL_CONFIG['artifact_path'] for the default shard; other shards add their name before the extension"""
+    path = MODEL_CONFIG['artifact_path']
+    if shard == DEFAULT_SHARD:
+        return path
+    root, extension = os.path.splitext(path)
+    return f"{root}.{shard.replace(':', '.')}{extension}"
+
 
 class PredictionService:
-    def __init__(self, db_session: Session):
+    """
+    Suggestions from one model shard: the global model by default, or the
+    model of a locale or locale:tenant, trained only on that shard's query
+    stats and persisted to its own artifact.
+    """
+
+    def __init__(self, db_session: Session, cache: Optional[SuggestionCache] = None,
+                 content_filter: Optional[ContentFilter] = None,
+                 popularity: Optional[PopularityTracker] = None,
+                 read_session: Optional[Session] = None, shard: str = DEFAULT_SHARD):
+        self.shard = shard
         self.db_session = db_session
-        self.content_filter = ContentFilter()
-        self.vectorizer = TfidfVectorizer(ngram_range=(1, 3), min_df=2)
-        self.knn_model = NearestNeighbors(n_neighbors=5, metric='cosine')
-        self.model_path = 'models/search_predictor.joblib'
+        # Training and index scans are read-only and may go to a replica
+        self.read_session = read_session if read_session is not None else db_session
+        self.popularity = popularity
+        self.content_filter = content_filter if content_filter is not None else ContentFilter()
+        self.cache = cache if cache is not None else create_suggestion_cache(
+            CACHE_CONFIG, namespace=shard if shard != DEFAULT_SHARD else None)
+        self.removed_suggestions = set()
+        self.model_path = shard_artifact_path(shard)
+        self.model = ModelGeneration(prefix_index=PrefixIndex(top_k=PREFIX_INDEX_CONFIG['top_k']))
+        self._swap_lock = threading.Lock()
+        self._training_lock = threading.Lock()
+        self._training_future: Optional[Future] = None
+        self._last_training_started = 0.0
+        self._last_retrain_check = 0.0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='model-trainer')
+        self.load_timings: Dict[str, float] = {}
         self.load_or_train_model()
 
+    # Read-only views of the serving generation
+    @property
+    def vectorizer(self):
+        return self.model.vectorizer
+
+    @property
+    def similarity(self) -> Optional[SimilarityEngine]:
+        return self.model.similarity
+
+    @property
+    def queries(self) -> List[str]:
+        return self.model.queries
+
+    @property
+    def prefix_index(self) -> PrefixIndex:
+        return self.model.prefix_index
+
     def load_or_train_model(self):
-        if os.path.exists(self.model_path):
+        started = time.perf_counter()
+        if not os.path.exists(self.model_path):
+            # Workers starting together wait for the one building the artifact, then map it
+            with self._trainer_lock(blocking=True):
+                if not os.path.exists(self.model_path):
+                    self.train_model()
+                    self.load_timings['train_model'] = round(time.perf_counter() - started, 3)
+                    return
+
+        try:
             self.load_model()
+        except ArtifactError as e:
+            print(f"Error loading model, retraining: {str(e)}")
         else:
-            self.train_model()
+            self.load_timings['load_model'] = round(time.perf_counter() - started, 3)
+            started = time.perf_counter()
+            self.rebuild_prefix_index()
+            self.load_timings['prefix_index'] = round(time.perf_counter() - started, 3)
+            return
+
+        self.train_model()
+        self.load_timings['train_model'] = round(time.perf_counter() - started, 3)
+
+    @contextmanager
+    def _trainer_lock(self, blocking: bool = False):
+        """
+        Hold the lock file next to the artifact, so one worker on the host
+        builds this shard at a time while the others map what it writes.
+        Yields whether the lock was taken; without blocking it is not taken
+        while another worker holds it.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(self.model_path)), exist_ok=True)
+        with open(self.model_path + '.lock', 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def artifact_changed(self) -> bool:
+        """Whether the file at model_path is not the one being served, i.e. another worker renamed a new one in"""
+        try:
+            stat = os.stat(self.model_path)
+        except FileNotFoundError:
+            return False
+        serving = self.model.vectorizer
+        return not isinstance(serving, ModelArtifact) or serving.identity != (stat.st_dev, stat.st_ino)
+
+    def reload_artifact(self) -> bool:
+        """Map the artifact at model_path if it changed; returns whether the serving generation did"""
+        if not self.artifact_changed():
+            return False
+        self.swap_model(self._open_artifact(self.model.prefix_index, self.model.fuzzy_index))
+        # The indexes are rebuilt from query stats, as when the artifact is loaded at startup
+        self.rebuild_prefix_index()
+        return True
+
+    def _open_artifact(self, prefix_index: PrefixIndex,
+                       fuzzy_index: Optional[SymmetricDeleteIndex] = None) -> ModelGeneration:
+        """Memory-map the artifact at model_path as a generation"""
+        artifact = ModelArtifact(self.model_path, verify_payload=MODEL_CONFIG['verify_payload'])
+        similarity = SimilarityEngine(artifact, artifact.matrix, artifact.ngram_index,
+                                      max_candidates=SIMILARITY_CONFIG['max_candidates'])
+        built_at = artifact.metadata.get('built_at')
+        return ModelGeneration(
+            generation=artifact.metadata.get('generation', 1),
+            vectorizer=artifact,
+            similarity=similarity,
+            features=artifact.matrix,
+            queries=artifact.queries,
+            prefix_index=prefix_index,
+            watermark=artifact.metadata.get('watermark', 0),
+            built_at=datetime.fromisoformat(built_at) if built_at else None,
+            build_duration=artifact.metadata.get('build_duration', 0.0),
+            fuzzy_index=fuzzy_index
+        )
 
     def load_model(self):
-        model_data = joblib.load(self.model_path)
-        self.vectorizer = model_data['vectorizer']
-        self.knn_model = model_data['knn']
-
-    def train_model(self):
-        # Get historical searches from last 30 days
-        cutoff_date = datetime.now() - timedelta(days=30)
-        historical_searches = self.db_session.query(SearchHistory.query_text)\
-            .filter(SearchHistory.timestamp >= cutoff_date)\
-            .all()
-        
-        search_texts = [search[0] for search in historical_searches]
-        if not search_texts:
-            return
-            
-        # Transform search texts to TF-IDF features
-        features = self.vectorizer.fit_transform(search_texts)
-        
-        # Train KNN model
-        self.knn_model.fit(features)
-        
-        # Save model
-        model_data = {
-            'vectorizer': self.vectorizer,
-            'knn': self.knn_model
+        self.swap_model(self._open_artifact(self.prefix_index, self.model.fuzzy_index))
+
+    def save_model(self, model: ModelGeneration):
+        """Persist a generation as a memory-mappable artifact, renamed into place once complete"""
+        write_artifact(self.model_path, model.vectorizer, model.features, model.queries, {
+            'generation': model.generation,
+            'watermark': model.watermark,
+            'built_at': model.built_at.isoformat() if model.built_at else None,
+            'build_duration': model.build_duration
+        }, ngram_index=model.similarity.ngram_index)
+
+    def swap_model(self, model: ModelGeneration):
+        """Make `model` the serving generation; a single reference assignment, so readers never block"""
+        with self._swap_lock:
+            self.model = model
+
+    def rebuild_prefix_index(self) -> PrefixIndex:
+        """Rebuild the prefix and fuzzy indexes from query stats and swap them in"""
+        cutoff_date = datetime.utcnow() - timedelta(days=PREFIX_INDEX_CONFIG['history_days'])
+        query_counts = list(training_query_counts(self.read_session, cutoff_date, shard=self.shard))
+        index = PrefixIndex.build(query_counts, top_k=PREFIX_INDEX_CONFIG['top_k'])
+        self.swap_prefix_index(index, self._build_fuzzy_index(query_counts))
+        return index
+
+    def swap_prefix_index(self, index: PrefixIndex, fuzzy_index: Optional[SymmetricDeleteIndex] = None):
+        """Replace the prefix index, and the fuzzy index if given, of the serving generation"""
+        changes = {'prefix_index': index}
+        if fuzzy_index is not None:
+            changes['fuzzy_index'] = fuzzy_index
+        with self._swap_lock:
+            self.model = self.model.replace(**changes)
+
+    @staticmethod
+    def _build_fuzzy_index(query_counts) -> Optional[SymmetricDeleteIndex]:
+        if not FUZZY_CONFIG['enabled']:
+            return None
+        return SymmetricDeleteIndex.build(
+            query_counts,
+            max_distance=FUZZY_CONFIG['max_distance'],
+            prefix_length=FUZZY_CONFIG['prefix_length'],
+            min_length=FUZZY_CONFIG['min_length'],
+            max_queries=FUZZY_CONFIG['max_queries'],
+            max_postings=FUZZY_CONFIG['max_postings'],
+            time_budget=FUZZY_CONFIG['time_budget'],
+            max_candidates=FUZZY_CONFIG['max_candidates']
+        )
+
+    def build_generation(self) -> ModelGeneration:
+        """Train a new model generation off to the side; the serving generation is untouched"""
+        started = time.perf_counter()
+
+        # Searches recorded so far; the retrain trigger counts new ones against this
+        watermark = total_searches(self.read_session, self.shard)
+        as_of = datetime.utcnow()
+        cutoff_date = as_of - timedelta(days=MODEL_CONFIG['history_days'])
+
+        # Two streamed passes over distinct queries; memory is bounded by the chunk size
+        trainer = ChunkedTfidfTrainer(ngram_range=(1, 3), min_df=2,
+                                      workers=MODEL_CONFIG['training_workers'])
+        vectorizer, features, search_texts, counts = trainer.fit_transform(
+            lambda: iter_query_counts(self.read_session, cutoff_date, as_of,
+                                      MODEL_CONFIG['training_chunk_size'], shard=self.shard))
+        prefix_index = PrefixIndex.build(zip(search_texts, counts),
+                                         top_k=PREFIX_INDEX_CONFIG['top_k'])
+        fuzzy_index = self._build_fuzzy_index(zip(search_texts, counts))
+
+        similarity = None
+        if vectorizer is not None:
+            ngram_index = NgramIndex.build(search_texts, n=SIMILARITY_CONFIG['ngram_size']) \
+                if SIMILARITY_CONFIG['ngram_index'] else None
+            similarity = SimilarityEngine(vectorizer, features, ngram_index,
+                                          max_candidates=SIMILARITY_CONFIG['max_candidates'])
+
+        return ModelGeneration(
+            generation=self.model.generation + 1,
+            vectorizer=vectorizer,
+            similarity=similarity,
+            features=features,
+            queries=search_texts,
+            prefix_index=prefix_index,
+            watermark=watermark,
+            built_at=datetime.utcnow(),
+            build_duration=time.perf_counter() - started,
+            fuzzy_index=fuzzy_index
+        )
+
+    def train_model(self) -> ModelGeneration:
+        """Build, persist and swap in a new generation synchronously"""
+        with PROFILER.profile(TRAIN_MODEL, self.shard):
+            model = self.build_generation()
+            if model.is_trained:
+                self.save_model(model)
+                # Serve from the mapped file so the in-memory build can be freed
+                model = self._open_artifact(model.prefix_index, model.fuzzy_index)
+            self.swap_model(model)
+        return model
+
+    def schedule_training(self) -> Future:
+        """Queue a background build; callers arriving mid-build share the in-flight future"""
+        with self._training_lock:
+            if self._training_future is None or self._training_future.done():
+                self._last_training_started = time.monotonic()
+                self._training_future = self._executor.submit(self._train_in_background)
+            return self._training_future
+
+    def _train_in_background(self) -> Optional[ModelGeneration]:
+        try:
+            with self._trainer_lock() as elected:
+                if not elected:
+                    # Another worker is building this shard; check_retrain maps its artifact
+                    return None
+                # It may have finished just before the lock was free
+                if self.reload_artifact() and not self._retrain_due():
+                    return self.model
+                return self.train_model()
+        except Exception as e:
+            print(f"Error training model: {str(e)}")
+            return None
+        finally:
+            self._remove_sessions()
+
+    def _reload_in_background(self) -> bool:
+        try:
+            return self.reload_artifact()
+        except Exception as e:
+            print(f"Error reloading model: {str(e)}")
+            return False
+        finally:
+            self._remove_sessions()
+
+    def _remove_sessions(self):
+        # The trainer thread owns its own scoped sessions
+        for session in {self.db_session, self.read_session}:
+            if isinstance(session, scoped_session):
+                session.remove()
+
+    @property
+    def is_training(self) -> bool:
+        future = self._training_future
+        return future is not None and not future.done()
+
+    def model_status(self) -> Dict:
+        """Report the serving generation and trainer state"""
+        status = self.model.to_dict()
+        status['shard'] = self.shard
+        status['training'] = self.is_training
+        return status
+
+    def memory_footprint(self) -> Dict[str, int]:
+        """Approximate bytes held by the serving generation: model arrays (mapped or built) and both indexes"""
+        model = self.model
+        footprint = {
+            'model': 0,
+            'prefix_index': model.prefix_index.memory_bytes(),
+            'fuzzy_index': model.fuzzy_index.memory_bytes() if model.fuzzy_index is not None else 0
         }
-        joblib.dump(model_data, self.model_path)
+        if isinstance(model.vectorizer, ModelArtifact):
+            footprint['model'] = model.vectorizer.nbytes
+        elif model.features is not None:
+            features = model.features
+            footprint['model'] = features.data.nbytes + features.indices.nbytes + features.indptr.nbytes
+        footprint['total'] = sum(footprint.values())
+        return footprint
+
+    def shutdown(self, wait: bool = True):
+        """Stop the background trainer"""
+        self._executor.shutdown(wait=wait)
 
     def get_autocomplete_suggestions(self, partial_query: str, limit: int = 5) -> List[str]:
         if not partial_query:
             return []
+        return self.get_autocomplete_batch([partial_query], limit)[partial_query]
+
+    def get_autocomplete_batch(self, partial_queries: List[str], limit: int = 5) -> Dict[str, List[str]]:
+        """Suggestions for several prefixes; prefixes missing from cache and prefix index share one similarity search"""
+        results: Dict[str, List[str]] = {}
+        misses = []
+        for partial_query in dict.fromkeys(partial_queries):
+            if not partial_query:
+                results[partial_query] = []
+                continue
+            with span('cache_get'):
+                cached_suggestions = self.cache.get(partial_query, limit)
+            if cached_suggestions is not None:
+                results[partial_query] = cached_suggestions
+            else:
+                misses.append(partial_query)
+
+        if misses:
+            generated = self._generate_suggestions(misses, limit)
+            with span('cache_set'):
+                for partial_query in misses:
+                    self.cache.set(partial_query, limit, generated[partial_query])
+            results.update(generated)
+        return results
+
+    def get_degraded_suggestions(self, partial_query: str, limit: int = 5, shared: bool = True) -> List[str]:
+        """
+        Cheap path under overload: a cached entry from either tier (only the
+        per-process one with `shared` False), else prefix index completions
+        under the pattern filter only. No model or NLP work, and nothing is cached.
+        """
+        with span('cache_get'):
+            cached_suggestions = self.cache.get(partial_query, limit) if shared \
+                else self.cache.get_local(partial_query, limit)
+        if cached_suggestions is not None:
+            return cached_suggestions
+        with span('prefix_index'):
+            completions = self.model.prefix_index.lookup(partial_query)
+        candidates = [s for s in completions if normalize_query(s) not in self.removed_suggestions]
+        with span('content_filter'):
+            return self.content_filter.filter_suggestions(candidates, nlp=False)[:limit]
 
-        # Get cached suggestions first
-        cached_suggestions = self.db_session.query(AutocompleteSuggestions.suggestion)\
-            .filter(AutocompleteSuggestions.partial_query == partial_query)\
-            .order_by(desc(AutocompleteSuggestions.frequency))\
-            .limit(limit)\
-            .all()
+    def is_exhaustive(self, partial_query: str, suggestions: List[str], limit: int = 5) -> bool:
+        """
+        Whether `suggestions` come from a prefix index node holding every
+        indexed completion of `partial_query`, none cut off by `limit`, so a
+        client may narrow them for longer prefixes instead of asking again.
+        Similarity and typo-corrected results never are.
+        """
+        if not suggestions:
+            return False
+        prefix_index = self.model.prefix_index
+        completions = prefix_index.lookup(partial_query)
+        return len(completions) < prefix_index.top_k and len(completions) <= limit \
+            and set(suggestions) <= set(completions)
 
-        if cached_suggestions:
-            return [sugg[0] for sugg in cached_suggestions]
+    def cached_suggestions(self, partial_query: str, limit: int = 5) -> Optional[List[str]]:
+        """Suggestions from the per-process cache, or None; no I/O and no model work"""
+        return self.cache.get_local(partial_query, limit)
+
+    def cache_version(self, sync: bool = True) -> str:
+        """
+        Opaque token that changes whenever served suggestions may: a new
+        model or prefix index, new blocklist terms, a removed suggestion or
+        a cache invalidation published by another worker. With `sync` False
+        the shared tier is not polled, for callers that sync on their own.
+        """
+        model = self.model
+        if sync:
+            self.cache.sync()
+        parts = (self.shard, model.generation, model.prefix_index.built_at, self.content_filter.terms_generation,
+                 len(self.removed_suggestions), self.cache.invalidation_sequence)
+        return hashlib.blake2b(repr(parts).encode('utf-8'), digest_size=8).hexdigest()
+
+    def _servable(self, suggestions: List[str]) -> List[str]:
+        """Drop removed suggestions, then run the rest through the content filter in one batch"""
+        candidates = [s for s in suggestions if normalize_query(s) not in self.removed_suggestions]
+        with span('content_filter'):
+            return self.content_filter.filter_suggestions(candidates)
+
+    def _generate_suggestions(self, partial_queries: List[str], limit: int) -> Dict[str, List[str]]:
+        model = self.model
+        results: Dict[str, List[str]] = {}
+        pending = []
+
+        # Serve from the in-memory prefix index first, without a DB round trip
+        for partial_query in partial_queries:
+            with span('prefix_index'):
+                completions = model.prefix_index.lookup(partial_query)
+            completions = self._servable(completions)
+            if completions:
+                results[partial_query] = completions[:limit]
+            else:
+                pending.append(partial_query)
+
+        if not pending:
+            return results
 
         # Generate new suggestions using the model
         try:
-            partial_vector = self.vectorizer.transform([partial_query])
-            distances, indices = self.knn_model.kneighbors(partial_vector)
-            
-            # Get similar queries from training data
-            similar_queries = self.vectorizer.get_feature_names_out()[indices[0]]
-            
-            # Filter suggestions
-            filtered_suggestions = []
-            for suggestion in similar_queries:
-                if suggestion.startswith(partial_query) and \
-                   not self.content_filter.is_inappropriate(suggestion):
-                    filtered_suggestions.append(suggestion)
-                    
-                    # Cache the suggestion
-                    new_suggestion = AutocompleteSuggestions(
-                        partial_query=partial_query,
-                        suggestion=suggestion,
-                        frequency=1
-                    )
-                    self.db_session.add(new_suggestion)
-            
-            self.db_session.commit()
-            return filtered_suggestions[:limit]
-            
+            k = max(limit, SIMILARITY_CONFIG['neighbors'])
+            for partial_query, similar_queries in zip(pending, self.find_similar(pending, k=k)):
+                # Filter suggestions
+                filtered_suggestions = self._servable([
+                    suggestion for suggestion in dict.fromkeys(similar_queries)
+                    if suggestion.startswith(partial_query)
+                ])
+                results[partial_query] = filtered_suggestions[:limit]
+
         except Exception as e:
             print(f"Error generating suggestions: {str(e)}")
-            return []
+
+        # Nothing starts with it, so it may be a typo: complete queries within a small edit distance
+        for partial_query in pending:
+            if results.get(partial_query) or model.fuzzy_index is None:
+                results.setdefault(partial_query, [])
+                continue
+            with span('fuzzy_index'):
+                corrections = model.fuzzy_index.lookup(partial_query, limit=limit)
+            results[partial_query] = self._servable(corrections)[:limit]
+        return results
+
+    def find_similar(self, partial_queries: List[str], k: Optional[int] = None) -> List[List[str]]:
+        """Most similar training queries for each partial query, best first, in one batch"""
+        model = self.model
+        if not model.is_trained:
+            return [[] for _ in partial_queries]
+        k = k or SIMILARITY_CONFIG['neighbors']
+        results = []
+        for neighbors in model.similarity.search(partial_queries, k=k):
+            ranked = [(model.queries[row], similarity) for row, similarity in neighbors]
+            if self.popularity is not None:
+                # Equally similar queries are ordered by how often they are submitted
+                popularity = self.popularity.scores(query for query, _ in ranked)
+                ranked.sort(key=lambda item: (-round(item[1], 6), -popularity[item[0]]))
+            results.append([query for query, _ in ranked])
+        return results
 
     def update_model(self, new_search_text: str):
         try:
-            # Add new search to history
-            new_search = SearchHistory(query_text=new_search_text)
-            self.db_session.add(new_search)
+            # Count the search in query stats, and in raw history if it is kept
+            upsert_query_stats(self.db_session, aggregate(
+                event for event in [query_event(new_search_text, submitted=True, shard=self.shard)] if event))
+            if QUERY_STATS_CONFIG['raw_history']:
+                self.db_session.add(SearchHistory(query=new_search_text))
             self.db_session.commit()
+            self.check_retrain()
 
-            # Retrain model if enough new data
-            search_count = self.db_session.query(func.count(SearchHistory.id))\
-                .filter(SearchHistory.timestamp >= datetime.now() - timedelta(hours=1))\
-                .scalar()
-                
-            if search_count >= 100:  # Retrain after 100 new searches
-                self.train_model()
-                
         except Exception as e:
             print(f"Error updating model: {str(e)}")
             self.db_session.rollback()
 
+    def check_retrain(self) -> Optional[Future]:
+        """
+        Map an artifact another worker built, or else queue a background
+        build once retrain_threshold searches arrived since the serving
+        build. Checked at most every retrain_check_interval seconds, so
+        callers may check after every write.
+        """
+        now = time.monotonic()
+        if now - self._last_retrain_check < MODEL_CONFIG['retrain_check_interval']:
+            return None
+        self._last_retrain_check = now
+        if self.artifact_changed():
+            # Mapped on the trainer thread; whether a build is due is checked on the next round
+            return self._executor.submit(self._reload_in_background)
+        if not self._retrain_allowed() or not self._retrain_due():
+            return None
+        return self.schedule_training()
+
+    def _retrain_due(self) -> bool:
+        new_searches = total_searches(self.read_session, self.shard) - self.model.watermark
+        return new_searches >= MODEL_CONFIG['retrain_threshold']
+
+    def _retrain_allowed(self) -> bool:
+        """Rate-limit builds so a failing build is not retried on every search"""
+        elapsed = time.monotonic() - self._last_training_started
+        return not self.is_training and elapsed >= MODEL_CONFIG['min_retrain_interval']
+
+    def apply_blocked_terms(self, terms: List[str]) -> int:
+        """
+        Stop serving terms blocked on any worker and drop this process's cache
+        entries with a suggestion containing one; the reporting worker already
+        invalidated the shared tier and deleted the stored rows. Returns the
+        entries dropped.
+        """
+        matcher = TermMatcher()
+        matcher.add_many(terms, True)
+        self.removed_suggestions.update(normalize_query(term) for term in terms)
+        return self.cache.invalidate_matching(lambda suggestion: bool(matcher.match(suggestion)))
+
     def remove_suggestion(self, suggestion: str):
+        # Stop serving it before touching any cache, so a concurrent miss cannot re-cache it
+        self.removed_suggestions.add(normalize_query(suggestion))
+        self.cache.invalidate_suggestion(suggestion)
         try:
-            self.db_session.query(AutocompleteSuggestions)\
-                .filter(AutocompleteSuggestions.suggestion == suggestion)\
+            self.db_session.query(AutocompleteSuggestion)\
+                .filter(AutocompleteSuggestion.suggestion == suggestion)\
                 .delete()
             self.db_session.commit()
         except Exception as e:
@@ -0,0 +1,139 @@
+import sys
+from bisect import bisect_left
+from datetime import datetime
+from heapq import nsmallest
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from utils.query_normalizer import normalize_prefix, normalize_query
+
+
+class _Node:
+    """Radix tree node: edges keyed by first character, plus precomputed top-k"""
+    __slots__ = ('children', 'top')
+
+    def __init__(self):
+        self.children: Dict[str, Tuple[str, '_Node']] = {}
+        self.top: Tuple[Tuple[int, str], ...] = ()
+
+
+def _rank_key(entry: Tuple[int, str]):
+    count, query = entry
+    return (-count, query)
+
+
+class PrefixIndex:
+    """
+    Immutable in-memory prefix index over historical queries.
+    Every node stores its top-k completions ranked by frequency, so a lookup
+    costs O(len(prefix)) and never touches the database.
+    """
+
+    def __init__(self, top_k: int = 10):
+        self.top_k = top_k
+        self.size = 0
+        self.built_at: Optional[datetime] = None
+        self._root = _Node()
+        self._memory_bytes: Optional[int] = None
+
+    def __len__(self) -> int:
+        return self.size
+
+    @classmethod
+    def build(cls, query_counts: Iterable[Tuple[str, int]], top_k: int = 10) -> 'PrefixIndex':
+        """Build an index from (query, count) pairs; queries are normalized and merged"""
+        counts: Dict[str, int] = {}
+        for query, count in query_counts:
+            normalized = normalize_query(query)
+            if normalized:
+                counts[normalized] = counts.get(normalized, 0) + int(count)
+
+        index = cls(top_k=top_k)
+        queries = sorted(counts)
+        if queries:
+            index._root = index._build_node(queries, counts, 0, len(queries), 0)
+        index.size = len(queries)
+        index.built_at = datetime.utcnow()
+        return index
+
+    def _build_node(self, queries: List[str], counts: Dict[str, int],
+                    lo: int, hi: int, depth: int) -> _Node:
+        """Build the node for queries[lo:hi], which all share a prefix of length `depth`"""
+        node = _Node()
+        candidates = []
+
+        # Sorted order puts the query ending exactly at this node first
+        if len(queries[lo]) == depth:
+            candidates.append((counts[queries[lo]], queries[lo]))
+            lo += 1
+
+        while lo < hi:
+            first = queries[lo]
+            char = first[depth]
+            end = bisect_left(queries, first[:depth] + chr(ord(char) + 1), lo, hi)
+            last = queries[end - 1]
+
+            # Compress the edge down to the longest prefix shared by the group
+            edge_end = depth + 1
+            limit = min(len(first), len(last))
+            while edge_end < limit and first[edge_end] == last[edge_end]:
+                edge_end += 1
+
+            child = self._build_node(queries, counts, lo, end, edge_end)
+            node.children[char] = (first[depth:edge_end], child)
+            candidates.extend(child.top)
+            lo = end
+
+        node.top = tuple(nsmallest(self.top_k, candidates, key=_rank_key))
+        return node
+
+    def memory_bytes(self) -> int:
+        """Approximate heap size of nodes, edges, top-k entries and query strings; measured once"""
+        if self._memory_bytes is None:
+            total = 0
+            seen = set()
+            stack = [self._root]
+            while stack:
+                node = stack.pop()
+                total += sys.getsizeof(node) + sys.getsizeof(node.children) + sys.getsizeof(node.top)
+                # Parents share their children's entry tuples and query strings
+                for entry in node.top:
+                    if id(entry) not in seen:
+                        seen.add(id(entry))
+                        total += sys.getsizeof(entry)
+                        if id(entry[1]) not in seen:
+                            seen.add(id(entry[1]))
+                            total += sys.getsizeof(entry[1])
+                for edge in node.children.values():
+                    total += sys.getsizeof(edge) + sys.getsizeof(edge[0])
+                    stack.append(edge[1])
+            self._memory_bytes = total
+        return self._memory_bytes
+
+    def _find(self, prefix: str) -> Optional[_Node]:
+        """Walk the tree along `prefix`; the result may sit mid-edge"""
+        node = self._root
+        i = 0
+        while i < len(prefix):
+            edge = node.children.get(prefix[i])
+            if edge is None:
+                return None
+            label, child = edge
+            n = min(len(label), len(prefix) - i)
+            if prefix[i:i + n] != label[:n]:
+                return None
+            i += n
+            node = child
+        return node
+
+    def lookup_with_counts(self, prefix: str, limit: Optional[int] = None) -> List[Tuple[str, int]]:
+        """Return the most frequent completions of `prefix` as (query, count) pairs"""
+        prefix = normalize_prefix(prefix)
+        node = self._find(prefix) if prefix else None
+        if node is None:
+            return []
+        top = node.top if limit is None else node.top[:limit]
+        return [(query, count) for count, query in top]
+
+    def lookup(self, prefix: str, limit: Optional[int] = None) -> List[str]:
+        """Return the most frequent completions of `prefix`"""
+        return [query for query, _ in self.lookup_with_counts(prefix, limit)]
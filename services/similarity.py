@@ -0,0 +1,132 @@
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from utils.metrics import span
+from utils.query_normalizer import normalize_prefix, normalize_query
+
+
+def char_ngrams(text: str, n: int) -> set:
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class NgramIndex:
+    """
+    Inverted index from character n-grams to the rows of the queries that
+    contain them, stored as flat arrays (sorted keys + CSR postings) so it can
+    live inside the memory-mapped model artifact.
+    """
+
+    def __init__(self, keys: np.ndarray, indptr: np.ndarray, rows: np.ndarray, n: int):
+        self.keys = keys
+        self.indptr = indptr
+        self.rows = rows
+        self.n = n
+
+    @classmethod
+    def build(cls, queries: Iterable[str], n: int = 3) -> 'NgramIndex':
+        postings: Dict[bytes, List[int]] = {}
+        for row, query in enumerate(queries):
+            for gram in char_ngrams(normalize_query(query), n):
+                postings.setdefault(gram.encode('utf-8'), []).append(row)
+
+        keys = sorted(postings)
+        indptr = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum([len(postings[key]) for key in keys], out=indptr[1:])
+        rows = np.fromiter((row for key in keys for row in postings[key]),
+                           dtype=np.int32, count=int(indptr[-1]))
+        return cls(np.array(keys, dtype=bytes), indptr, rows, n)
+
+    def postings(self, gram: str) -> np.ndarray:
+        key = gram.encode('utf-8')
+        position = int(np.searchsorted(self.keys, key))
+        if position >= len(self.keys) or self.keys[position] != key:
+            return self.rows[:0]
+        return self.rows[self.indptr[position]:self.indptr[position + 1]]
+
+    def candidates(self, prefix: str, max_grams: int = 3) -> Optional[np.ndarray]:
+        """
+        Rows whose query contains every one of the `max_grams` rarest n-grams
+        of `prefix`, or None when the prefix is too short to prune on.
+        """
+        grams = char_ngrams(normalize_prefix(prefix), self.n)
+        if not grams:
+            return None
+        lists = sorted((self.postings(gram) for gram in grams), key=len)[:max_grams]
+        rows = lists[0]
+        for other in lists[1:]:
+            if not len(rows):
+                break
+            rows = np.intersect1d(rows, other, assume_unique=True)
+        return rows
+
+
+class SimilarityEngine:
+    """
+    Cosine top-k over the L2-normalized TF-IDF matrix of a model generation.
+    Scores are sparse dot products, so only rows sharing a term with the query
+    are ever touched, and top-k selection uses argpartition. When an n-gram
+    index is available, each query is first narrowed to the rows containing
+    its character n-grams, at most `max_candidates` of them. Rows are built
+    heaviest query first, so those are the most searched candidates.
+    """
+
+    def __init__(self, vectorizer, matrix: csr_matrix,
+                 ngram_index: Optional[NgramIndex] = None,
+                 max_candidates: int = 5000):
+        self.vectorizer = vectorizer
+        self.matrix = matrix
+        self.ngram_index = ngram_index
+        self.max_candidates = max_candidates
+
+    @property
+    def size(self) -> int:
+        return self.matrix.shape[0]
+
+    @staticmethod
+    def _top_k(rows: np.ndarray, scores: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        if len(scores) > k:
+            selected = np.argpartition(-scores, k - 1)[:k]
+            rows, scores = rows[selected], scores[selected]
+        order = np.lexsort((rows, -scores))
+        return [(int(rows[i]), float(scores[i])) for i in order]
+
+    def search(self, texts: Sequence[str], k: int = 5) -> List[List[Tuple[int, float]]]:
+        """Return up to k (row, cosine similarity) pairs per text, best first"""
+        if not len(texts) or not self.size:
+            return [[] for _ in texts]
+        with span('vectorize'):
+            vectors = self.vectorizer.transform(texts)
+
+        with span('ngram_candidates'):
+            candidates = [self.ngram_index.candidates(text) for text in texts] \
+                if self.ngram_index is not None else [None] * len(texts)
+
+        with span('similarity_search'):
+            return self._score(vectors, candidates, k)
+
+    def _score(self, vectors: csr_matrix, candidates: List[Optional[np.ndarray]],
+               k: int) -> List[List[Tuple[int, float]]]:
+        results: List[Optional[List[Tuple[int, float]]]] = [None] * len(candidates)
+        unpruned = [i for i, rows in enumerate(candidates) if rows is None]
+        if unpruned:
+            # One sparse product for every query that could not be pruned
+            scores = (vectors[unpruned] @ self.matrix.T).tocsr()
+            for position, i in enumerate(unpruned):
+                start, end = scores.indptr[position], scores.indptr[position + 1]
+                results[i] = self._top_k(scores.indices[start:end], scores.data[start:end], k)
+
+        for i, rows in enumerate(candidates):
+            if rows is None:
+                continue
+            # Candidate rows are ascending, i.e. most searched first
+            rows = rows[:self.max_candidates]
+            if not len(rows):
+                results[i] = []
+                continue
+            # Candidates contain the prefix's n-grams, so they stay eligible at score 0
+            scores = np.asarray((self.matrix[rows] @ vectors[i].T).todense()).ravel()
+            results[i] = self._top_k(rows, scores, k)
+
+        return results
@@ -5,26 +5,126 @@ document.addEventListener('DOMContentLoaded', function() {
     const suggestionsContainer = document.getElementById('suggestions-container');
     let debounceTimer;
 
+    const CACHE_SIZE = 200;
+    const CACHE_TTL_MS = 60000;
+    const MIN_DELAY_MS = 80;
+    const MAX_DELAY_MS = 400;
+
+    // Same normalization as the server (case-folded, single-spaced, trailing space kept)
+    const normalizePrefix = (text) => {
+        const normalized = text.replace(/\s+/g, ' ').trim().toLowerCase();
+        return normalized && /\s$/.test(text) ? normalized + ' ' : normalized;
+    };
+
+    // LRU of prefix -> suggestions; a Map iterates in insertion order, so the first key is the oldest
+    const suggestionCache = new Map();
+
+    const cacheGet = (prefix) => {
+        const entry = suggestionCache.get(prefix);
+        if (!entry) {
+            return null;
+        }
+        suggestionCache.delete(prefix);
+        if (Date.now() - entry.storedAt > CACHE_TTL_MS) {
+            return null;
+        }
+        suggestionCache.set(prefix, entry);
+        return entry;
+    };
+
+    // exhaustive: the server says the list holds every completion of its prefix
+    const cacheSet = (prefix, suggestions, exhaustive) => {
+        suggestionCache.delete(prefix);
+        suggestionCache.set(prefix, {
+            suggestions,
+            exhaustive,
+            storedAt: Date.now()
+        });
+        if (suggestionCache.size > CACHE_SIZE) {
+            suggestionCache.delete(suggestionCache.keys().next().value);
+        }
+    };
+
+    // Cached suggestions for the prefix itself, or narrowed from an exhaustive list for a shorter one.
+    // Narrowing to nothing asks the server, which may have typo corrections
+    const cachedSuggestions = (prefix) => {
+        const exact = cacheGet(prefix);
+        if (exact) {
+            return exact.suggestions;
+        }
+        for (let length = prefix.length - 1; length >= 2; length--) {
+            const entry = cacheGet(prefix.slice(0, length));
+            if (entry && entry.exhaustive) {
+                const narrowed = entry.suggestions.filter(s => normalizePrefix(s).startsWith(prefix));
+                if (narrowed.length === 0) {
+                    return null;
+                }
+                cacheSet(prefix, narrowed, true);
+                return narrowed;
+            }
+        }
+        return null;
+    };
+
+    // Debounce delay follows measured server latency: short when responses are fast, longer when slow
+    let latencyEstimate = 150;
+
+    const recordLatency = (elapsed) => {
+        latencyEstimate = 0.8 * latencyEstimate + 0.2 * elapsed;
+    };
+
+    const debounceDelay = () => Math.min(MAX_DELAY_MS, Math.max(MIN_DELAY_MS, latencyEstimate));
+
     // Debounce function to limit API calls while typing
-    const debounce = (func, delay) => {
+    const debounce = (func, delayFn) => {
         return (...args) => {
             clearTimeout(debounceTimer);
-            debounceTimer = setTimeout(() => func.apply(this, args), delay);
+            debounceTimer = setTimeout(() => func.apply(this, args), delayFn());
         };
     };
 
-    // Fetch autocomplete suggestions from API
+    // Only the latest request matters; starting a new one aborts the one in flight
+    let inFlight = null;
+
+    // Fetch autocomplete suggestions from API; resolves to null when superseded
     const fetchSuggestions = async (query) => {
+        const prefix = normalizePrefix(query);
+        const cached = cachedSuggestions(prefix);
+        if (cached) {
+            if (inFlight) {
+                inFlight.abort();
+                inFlight = null;
+            }
+            return cached;
+        }
+
+        if (inFlight) {
+            inFlight.abort();
+        }
+        const controller = new AbortController();
+        inFlight = controller;
+        const started = performance.now();
         try {
-            const response = await fetch(`/api/search/autocomplete?q=${encodeURIComponent(query)}`);
+            const response = await fetch(`/api/search/autocomplete?q=${encodeURIComponent(query)}`, {
+                signal: controller.signal
+            });
             if (!response.ok) {
                 throw new Error('Network response was not ok');
             }
             const data = await response.json();
+            recordLatency(performance.now() - started);
+            cacheSet(prefix, data.suggestions, data.exhaustive === true);
             return data.suggestions;
         } catch (error) {
+            if (error.name === 'AbortError') {
+                return null;
+            }
             console.error('Error fetching suggestions:', error);
             return [];
+        } finally {
+            if (inFlight === controller) {
+                inFlight = null;
+            }
         }
     };
 
@@ -113,11 +213,18 @@ document.addEventListener('DOMContentLoaded', function() {
         const query = e.target.value.trim();
         if (query.length >= 2) {
             const suggestions = await fetchSuggestions(query);
-            renderSuggestions(suggestions);
+            // A superseded request resolves to null; a newer one renders instead
+            if (suggestions !== null && e.target.value.trim() === query) {
+                renderSuggestions(suggestions);
+            }
         } else {
+            if (inFlight) {
+                inFlight.abort();
+                inFlight = null;
+            }
             suggestionsContainer.style.display = 'none';
         }
-    }, 300));
+    }, debounceDelay));
 
     searchInput.addEventListener('keypress', (e) => {
         if (e.key === 'Enter') {
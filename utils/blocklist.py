@@ -0,0 +1,143 @@
+"""
+Persisted, versioned blocklist of reported terms.
+
+Every report is a blocked_terms row stamped with the next blocklist
+generation, a counter kept in the single blocklist_version row. The counter
+is incremented in the same transaction as the insert, so its row lock
+orders concurrent reports and a worker that sees generation N can trust
+that every term up to N is committed. Workers poll the counter and fetch
+only the terms added since the generation they have applied.
+"""
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models.search_model import BlockedTerm, BlocklistVersion
+
+_MAX_LENGTH = BlockedTerm.term.type.length
+
+
+def normalize_term(term: str) -> str:
+    return ' '.join(term.lower().split())
+
+
+def current_generation(session: Session) -> int:
+    return int(session.query(BlocklistVersion.generation)
+               .filter(BlocklistVersion.id == 1).scalar() or 0)
+
+
+def _next_generation(session: Session) -> int:
+    """Increment the counter, holding its row lock until the caller commits"""
+    updated = session.query(BlocklistVersion)\
+        .filter(BlocklistVersion.id == 1)\
+        .update({BlocklistVersion.generation: BlocklistVersion.generation + 1}, synchronize_session=False)
+    if not updated:
+        session.add(BlocklistVersion(id=1, generation=1))
+        session.flush()
+    return current_generation(session)
+
+
+def block_term(session: Session, term: str, reason: Optional[str] = None) -> Optional[int]:
+    """
+    Persist a blocked term and return the generation it was added in (its
+    existing generation if it was already blocked), or None if it
+    normalizes to nothing storable.
+    """
+    term = normalize_term(term)
+    if not term or len(term) > _MAX_LENGTH:
+        return None
+    for attempt in range(2):
+        existing = session.query(BlockedTerm.generation).filter(BlockedTerm.term == term).scalar()
+        if existing is not None:
+            return existing
+        try:
+            generation = _next_generation(session)
+            session.add(BlockedTerm(term=term, generation=generation, reason=reason))
+            session.commit()
+            return generation
+        except IntegrityError:
+            # Another worker blocked the same term or created the counter row first
+            session.rollback()
+    return session.query(BlockedTerm.generation).filter(BlockedTerm.term == term).scalar()
+
+
+def terms_since(session: Session, generation: int, up_to: int, limit: int) -> List[Tuple[int, str]]:
+    """(generation, term) added after `generation` and no later than `up_to`, oldest first"""
+    return session.query(BlockedTerm.generation, BlockedTerm.term)\
+        .filter(BlockedTerm.generation > generation)\
+        .filter(BlockedTerm.generation <= up_to)\
+        .order_by(BlockedTerm.generation)\
+        .limit(limit)\
+        .all()
+
+
+class BlocklistSync:
+    """
+    Keeps this process at the latest blocklist generation. A background
+    thread reads the counter every `interval` seconds and, only when it
+    moved, hands the new terms to `apply`, so a term reported on any worker
+    is blocked everywhere without a reload or a database check per request.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session], apply: Callable[[List[str]], None],
+                 interval: float = 2.0, batch_size: int = 1000):
+        self.session_factory = session_factory
+        self.apply = apply
+        self.interval = interval
+        self.batch_size = batch_size
+        self.generation = 0
+        self.logger = logging.getLogger(__name__)
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats = {'polls': 0, 'applied': 0, 'errors': 0, 'last_sync': None}
+
+    def sync(self) -> int:
+        """Apply every term added since the last sync; returns how many"""
+        with self._lock:
+            session = self.session_factory()
+            try:
+                self._stats['polls'] += 1
+                latest = current_generation(session)
+                applied = 0
+                while self.generation < latest:
+                    rows = terms_since(session, self.generation, latest, self.batch_size)
+                    if not rows:
+                        break
+                    self.apply([term for _, term in rows])
+                    self.generation = rows[-1][0]
+                    applied += len(rows)
+                self._stats['applied'] += applied
+                self._stats['last_sync'] = time.time()
+                return applied
+            finally:
+                session.close()
+
+    def start(self):
+        """Poll in a daemon thread until stop()"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='blocklist-sync', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sync()
+            except Exception as e:
+                self._stats['errors'] += 1
+                self.logger.error(f"Error syncing blocklist: {str(e)}")
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self) -> Dict:
+        return dict(self._stats, generation=self.generation)
@@ -0,0 +1,41 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Dict
+
+
+class Overloaded(Exception):
+    """Raised instead of queueing once the executor's pending limit is reached"""
+
+
+class BoundedExecutor:
+    """
+    Runs blocking calls for coroutines on a fixed thread pool. At most
+    `max_pending` calls may be queued or running; past that run() raises
+    Overloaded at once, so a burst becomes fast rejections instead of an
+    unbounded queue with ever-growing latency. Use it from one event loop.
+    """
+
+    def __init__(self, workers: int = 8, max_pending: int = 2000):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='async-offload')
+        self._stats = {'submitted': 0, 'rejected': 0}
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        if self.pending >= self.max_pending:
+            self._stats['rejected'] += 1
+            raise Overloaded(f"{self.pending} offloaded calls already pending")
+        self.pending += 1
+        self._stats['submitted'] += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, partial(fn, *args, **kwargs))
+        finally:
+            self.pending -= 1
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait)
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self._stats, pending=self.pending, workers=self.workers)
@@ -0,0 +1,409 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    import redis
+except ImportError:  # Redis is only needed when CACHE_TYPE is 'redis'
+    redis = None
+
+from utils.query_normalizer import normalize_prefix, normalize_query
+
+
+class LRUCache:
+    """Thread-safe, size-bounded LRU cache with a per-entry TTL"""
+
+    def __init__(self, max_size: int = 10000, ttl: float = 60.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: 'OrderedDict[Any, Tuple[float, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[0] > time.monotonic()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key) -> bool:
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def items(self) -> List[Tuple[Any, Any]]:
+        """Snapshot of the live (key, value) pairs"""
+        now = time.monotonic()
+        with self._lock:
+            return [(key, value) for key, (expires_at, value) in self._entries.items()
+                    if expires_at > now]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations
+        }
+
+
+class InMemorySharedCache:
+    """
+    Process-local stand-in for the shared cache tier, used in tests and
+    single-process deployments. Mirrors the RedisSharedCache interface.
+    """
+
+    def __init__(self, max_events: int = 10000):
+        self.max_events = max_events
+        self._entries: Dict[str, Tuple[float, List[str]]] = {}
+        self._keys_by_suggestion: Dict[str, set] = {}
+        self._events: List[Tuple[int, str]] = []
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[List[str]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._entries[key]
+                return None
+            return list(entry[1])
+
+    def set(self, key: str, suggestions: List[str], ttl: float):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, list(suggestions))
+            for suggestion in suggestions:
+                self._keys_by_suggestion.setdefault(normalize_query(suggestion), set()).add(key)
+
+    def invalidate_suggestion(self, suggestion: str) -> int:
+        """Drop every entry containing `suggestion` and publish an invalidation event"""
+        suggestion = normalize_query(suggestion)
+        with self._lock:
+            keys = self._keys_by_suggestion.pop(suggestion, set())
+            for key in keys:
+                self._entries.pop(key, None)
+            self._sequence += 1
+            self._events.append((self._sequence, suggestion))
+            del self._events[:-self.max_events]
+            return len(keys)
+
+    def invalidate_matching(self, predicate: Callable[[str], bool]) -> int:
+        """Drop every entry holding a suggestion `predicate` accepts, without publishing"""
+        with self._lock:
+            matched = [suggestion for suggestion in self._keys_by_suggestion if predicate(suggestion)]
+            keys = set()
+            for suggestion in matched:
+                keys |= self._keys_by_suggestion.pop(suggestion)
+            for key in keys:
+                self._entries.pop(key, None)
+            return len(keys)
+
+    def invalidations_since(self, sequence: int) -> Tuple[int, Optional[List[str]]]:
+        """
+        Return (latest sequence, suggestions invalidated after `sequence`).
+        The list is None when the event log no longer reaches back that far.
+        """
+        with self._lock:
+            if self._events and self._events[0][0] > sequence + 1:
+                return self._sequence, None
+            return self._sequence, [s for seq, s in self._events if seq > sequence]
+
+
+class RedisSharedCache:
+    """Shared cache tier on Redis; entries are JSON lists with a server-side TTL"""
+
+    def __init__(self, host: str = 'localhost', port: int = 6379, db: int = 0,
+                 prefix: str = 'autocomplete', socket_timeout: float = 0.05,
+                 max_events: int = 10000):
+        if redis is None:
+            raise RuntimeError("CACHE_TYPE 'redis' requires the redis package")
+        self.client = redis.Redis(host=host, port=port, db=db,
+                                  socket_timeout=socket_timeout,
+                                  socket_connect_timeout=socket_timeout)
+        self.prefix = prefix
+        self.max_events = max_events
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}:entry:{key}"
+
+    def _index_key(self, suggestion: str) -> str:
+        return f"{self.prefix}:by_suggestion:{suggestion}"
+
+    def get(self, key: str) -> Optional[List[str]]:
+        value = self.client.get(self._key(key))
+        return json.loads(value) if value is not None else None
+
+    def set(self, key: str, suggestions: List[str], ttl: float):
+        pipe = self.client.pipeline()
+        pipe.set(self._key(key), json.dumps(suggestions), ex=max(1, int(ttl)))
+        for suggestion in suggestions:
+            index_key = self._index_key(normalize_query(suggestion))
+            pipe.sadd(index_key, key)
+            pipe.expire(index_key, max(1, int(ttl)))
+        pipe.execute()
+
+    def invalidate_suggestion(self, suggestion: str) -> int:
+        suggestion = normalize_query(suggestion)
+        keys = [k.decode() for k in self.client.smembers(self._index_key(suggestion))]
+        sequence = self.client.incr(f"{self.prefix}:invalidation_seq")
+        pipe = self.client.pipeline()
+        if keys:
+            pipe.delete(*[self._key(key) for key in keys])
+        pipe.delete(self._index_key(suggestion))
+        pipe.zadd(f"{self.prefix}:invalidations", {f"{sequence}:{suggestion}": sequence})
+        pipe.zremrangebyrank(f"{self.prefix}:invalidations", 0, -self.max_events - 1)
+        pipe.execute()
+        return len(keys)
+
+    def invalidations_since(self, sequence: int) -> Tuple[int, Optional[List[str]]]:
+        latest = int(self.client.get(f"{self.prefix}:invalidation_seq") or 0)
+        if latest <= sequence:
+            return latest, []
+        events = self.client.zrangebyscore(f"{self.prefix}:invalidations",
+                                           sequence + 1, latest, withscores=True)
+        if not events or int(events[0][1]) > sequence + 1:
+            return latest, None
+        return latest, [member.decode().split(':', 1)[1] for member, _ in events]
+
+
+def create_shared_cache(cache_config: Dict, namespace: Optional[str] = None):
+    """Build the shared cache tier described by CACHE_CONFIG"""
+    if cache_config.get('CACHE_TYPE') == 'redis':
+        if redis is None:
+            # Caching is an optimization; run with the in-process tier only
+            logging.getLogger(__name__).warning(
+                "redis package not installed, suggestion cache is process-local")
+            return None
+        return RedisSharedCache(
+            host=cache_config.get('CACHE_REDIS_HOST', 'localhost'),
+            port=cache_config.get('CACHE_REDIS_PORT', 6379),
+            socket_timeout=cache_config.get('CACHE_REDIS_SOCKET_TIMEOUT', 0.05),
+            prefix=f"autocomplete:shard:{namespace}" if namespace else 'autocomplete'
+        )
+    return InMemorySharedCache()
+
+
+def create_suggestion_cache(cache_config: Dict, namespace: Optional[str] = None) -> 'SuggestionCache':
+    """Build the two-tier suggestion cache described by CACHE_CONFIG; `namespace` separates model shards"""
+    return SuggestionCache(
+        shared=create_shared_cache(cache_config, namespace),
+        local_max_size=cache_config.get('CACHE_LOCAL_MAX_SIZE', 10000),
+        local_ttl=cache_config.get('CACHE_LOCAL_TIMEOUT', 60),
+        shared_ttl=cache_config.get('CACHE_DEFAULT_TIMEOUT', 300),
+        sync_interval=cache_config.get('CACHE_SYNC_INTERVAL', 1.0)
+    )
+
+
+class SuggestionCache:
+    """
+    Two-tier autocomplete cache: a per-process LRU in front of a shared tier.
+    Every entry is indexed by the suggestions it contains, so reporting or
+    removing a suggestion drops exactly the entries that could serve it.
+    Other workers learn about invalidations by polling the shared tier's
+    event log at most every `sync_interval` seconds.
+    """
+
+    def __init__(self, shared=None, local_max_size: int = 10000, local_ttl: float = 60.0,
+                 shared_ttl: float = 300.0, sync_interval: float = 1.0,
+                 error_backoff: float = 5.0):
+        self.local = LRUCache(max_size=local_max_size, ttl=local_ttl)
+        self.shared = shared
+        self.shared_ttl = shared_ttl
+        self.sync_interval = sync_interval
+        self.error_backoff = error_backoff
+        self.logger = logging.getLogger(__name__)
+
+        self._keys_by_suggestion: Dict[str, set] = {}
+        self._index_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._last_sync = 0.0
+        self._sequence = 0
+        self._shared_down_until = 0.0
+        self._counters = {
+            'shared_hits': 0,
+            'shared_misses': 0,
+            'shared_errors': 0,
+            'invalidations': 0
+        }
+
+    @staticmethod
+    def make_key(prefix: str, limit: int) -> str:
+        return f"{limit}:{normalize_prefix(prefix)}"
+
+    def _shared_available(self) -> bool:
+        return self.shared is not None and time.monotonic() >= self._shared_down_until
+
+    def _shared_failed(self, e: Exception):
+        self._counters['shared_errors'] += 1
+        self._shared_down_until = time.monotonic() + self.error_backoff
+        self.logger.warning(f"Shared cache unavailable: {str(e)}")
+
+    def get(self, prefix: str, limit: int) -> Optional[List[str]]:
+        self.sync()
+        key = self.make_key(prefix, limit)
+        suggestions = self.local.get(key)
+        if suggestions is not None:
+            return suggestions
+
+        if not self._shared_available():
+            return None
+        try:
+            suggestions = self.shared.get(key)
+        except Exception as e:
+            self._shared_failed(e)
+            return None
+
+        if suggestions is None:
+            self._counters['shared_misses'] += 1
+            return None
+        self._counters['shared_hits'] += 1
+        self._set_local(key, suggestions)
+        return suggestions
+
+    def get_local(self, prefix: str, limit: int) -> Optional[List[str]]:
+        """Look in the per-process tier only, so the caller never waits on the shared tier"""
+        return self.local.get(self.make_key(prefix, limit))
+
+    def set(self, prefix: str, limit: int, suggestions: List[str]):
+        key = self.make_key(prefix, limit)
+        self._set_local(key, suggestions)
+        if self._shared_available():
+            try:
+                self.shared.set(key, suggestions, self.shared_ttl)
+            except Exception as e:
+                self._shared_failed(e)
+
+    def _set_local(self, key: str, suggestions: List[str]):
+        self.local.set(key, suggestions)
+        with self._index_lock:
+            for suggestion in suggestions:
+                self._keys_by_suggestion.setdefault(normalize_query(suggestion), set()).add(key)
+            if len(self._keys_by_suggestion) > 4 * self.local.max_size:
+                self._rebuild_index()
+
+    def _rebuild_index(self):
+        """Drop reverse-index entries left behind by evicted or expired keys"""
+        index: Dict[str, set] = {}
+        for key, suggestions in self.local.items():
+            for suggestion in suggestions:
+                index.setdefault(normalize_query(suggestion), set()).add(key)
+        self._keys_by_suggestion = index
+
+    def _invalidate_local(self, suggestion: str) -> int:
+        suggestion = normalize_query(suggestion)
+        with self._index_lock:
+            keys = self._keys_by_suggestion.pop(suggestion, set())
+        for key in keys:
+            self.local.delete(key)
+        return len(keys)
+
+    def invalidate_matching(self, predicate: Callable[[str], bool]) -> int:
+        """
+        Drop local entries holding any suggestion `predicate` accepts, and
+        the in-process shared tier's too. A Redis tier is left alone: it is
+        cleared by exact invalidate_suggestion() calls and by TTL.
+        """
+        with self._index_lock:
+            matched = [suggestion for suggestion in self._keys_by_suggestion if predicate(suggestion)]
+            keys = set()
+            for suggestion in matched:
+                keys |= self._keys_by_suggestion.pop(suggestion)
+        for key in keys:
+            self.local.delete(key)
+        removed = len(keys)
+        if isinstance(self.shared, InMemorySharedCache):
+            removed += self.shared.invalidate_matching(predicate)
+        return removed
+
+    def invalidate_suggestion(self, suggestion: str) -> int:
+        """Drop every cached entry containing `suggestion`, here and in the shared tier"""
+        removed = self._invalidate_local(suggestion)
+        self._counters['invalidations'] += 1
+        if self.shared is not None:
+            try:
+                removed += self.shared.invalidate_suggestion(suggestion)
+            except Exception as e:
+                self._shared_failed(e)
+        return removed
+
+    def sync(self, force: bool = False):
+        """Apply invalidations published by other workers since the last sync"""
+        if self.shared is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_sync < self.sync_interval:
+            return
+        if not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_sync = now
+            if not self._shared_available():
+                return
+            try:
+                sequence, suggestions = self.shared.invalidations_since(self._sequence)
+            except Exception as e:
+                self._shared_failed(e)
+                return
+            if suggestions is None:
+                # Fell too far behind the event log; start over
+                self.clear_local()
+            else:
+                for suggestion in suggestions:
+                    self._invalidate_local(suggestion)
+            self._sequence = sequence
+        finally:
+            self._sync_lock.release()
+
+    @property
+    def invalidation_sequence(self) -> int:
+        """Position in the shared invalidation log this worker has applied up to"""
+        return self._sequence
+
+    def clear_local(self):
+        self.local.clear()
+        with self._index_lock:
+            self._keys_by_suggestion.clear()
+
+    def stats(self) -> Dict[str, int]:
+        stats = {f"local_{name}": value for name, value in self.local.stats().items()}
+        stats.update(self._counters)
+        return stats
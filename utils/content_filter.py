@@ -1,69 +1,169 @@
 import re
-import spacy
-import nltk
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
-from typing import List, Dict, Union
+import threading
+from typing import List, Dict, Optional, Union
 import logging
-from config.config import ContentFilterConfig
+from config.config import ContentFilterConfig, CONTENT_FILTER
+from utils.cache import LRUCache
+from utils.metrics import FILTER_REJECTIONS, span
+from utils.term_matcher import TermMatcher
 
-# Download required NLTK data
-nltk.download('punkt')
-nltk.download('stopwords')
-nltk.download('averaged_perceptron_tagger')
+# spaCy is imported and loaded on first use (or during warm-up), never at import
+_nlp = None
+_nlp_lock = threading.Lock()
 
-# Initialize spaCy
-nlp = spacy.load('en_core_web_sm')
+def get_nlp():
+    """
+    Load the spaCy pipeline with only the components the checks read: POS tags
+    (tagger + attribute_ruler), dependency children (parser) and entities (ner)
+    """
+    global _nlp
+    if _nlp is None:
+        with _nlp_lock:
+            if _nlp is None:
+                import spacy
+                _nlp = spacy.load(CONTENT_FILTER['spacy_model'], exclude=['lemmatizer', 'senter'])
+    return _nlp
+
+_WORDS = re.compile(r'\w+')
+
+# Term matcher label for terms reported through user feedback
+REPORTED_TERM = ('reported', None)
 
 class ContentFilter:
     def __init__(self):
         self.config = ContentFilterConfig()
-        self.stop_words = set(stopwords.words('english'))
-        self.profanity_patterns = self._load_profanity_patterns()
-        self.sensitive_patterns = self._load_sensitive_patterns()
+        self._stop_words: Optional[set] = None
+        self.term_matcher = self._load_term_matcher()
+        self.nlp_trigger_words = self._load_nlp_trigger_words()
+        self.verdicts = LRUCache(max_size=CONTENT_FILTER['memo_size'], ttl=CONTENT_FILTER['memo_ttl'])
+        self.terms_generation = 0
         self.logger = logging.getLogger(__name__)
 
-    def _load_profanity_patterns(self) -> Dict[str, re.Pattern]:
-        """Load and compile regex patterns for profanity detection"""
-        patterns = {}
-        for category, words in self.config.PROFANITY_WORDS.items():
-            pattern = r'\b(' + '|'.join(map(re.escape, words)) + r')\b'
-            patterns[category] = re.compile(pattern, re.IGNORECASE)
-        return patterns
+    @property
+    def stop_words(self) -> set:
+        """NLTK English stopwords from locally installed data; never downloads"""
+        if self._stop_words is None:
+            try:
+                from nltk.corpus import stopwords
+                self._stop_words = set(stopwords.words('english'))
+            except LookupError:
+                self.logger.warning("NLTK stopwords corpus not installed, using an empty set")
+                self._stop_words = set()
+        return self._stop_words
+
+    def load_nlp(self):
+        """Load the spaCy pipeline ahead of the first request that needs it"""
+        get_nlp()
 
-    def _load_sensitive_patterns(self) -> Dict[str, re.Pattern]:
-        """Load and compile regex patterns for sensitive content detection"""
-        patterns = {}
+    def _load_term_matcher(self) -> TermMatcher:
+        """Load profanity and sensitive phrases into one matcher, labelled by category"""
+        matcher = TermMatcher()
+        for category, words in self.config.PROFANITY_WORDS.items():
+            matcher.add_many(words, ('profanity', category))
         for category, phrases in self.config.SENSITIVE_PHRASES.items():
-            pattern = r'\b(' + '|'.join(map(re.escape, phrases)) + r')\b'
-            patterns[category] = re.compile(pattern, re.IGNORECASE)
-        return patterns
+            matcher.add_many(phrases, ('sensitive', category))
+        matcher.rebuild()
+        return matcher
+
+    def add_inappropriate_term(self, term: str):
+        """Block a user-reported term; takes effect for the next filtered text"""
+        term = ' '.join(term.split())
+        if not term or term in self.term_matcher:
+            return
+        self.term_matcher.add(term, REPORTED_TERM)
+        # Memoized verdicts from older generations are ignored from now on
+        self.terms_generation += 1
+
+    def _load_nlp_trigger_words(self) -> set:
+        """Words without which neither NLP check can fire"""
+        return {word.lower() for word in self.config.NEGATIVE_ADJECTIVES} | \
+               {word.lower() for word in self.config.NEGATIVE_TERMS}
+
+    def _needs_nlp(self, text: str) -> bool:
+        """Cheap pre-screen so spaCy only runs on texts containing a trigger word"""
+        return any(word in self.nlp_trigger_words for word in _WORDS.findall(text.lower()))
 
     def filter_content(self, text: str) -> Dict[str, Union[bool, List[str]]]:
         """
         Filter content for inappropriate or sensitive material
         Returns dict with filtering results and reasons
         """
+        return self.filter_contents([text])[0]
+
+    def filter_contents(self, texts: List[str], nlp: bool = True) -> List[Dict[str, Union[bool, List[str]]]]:
+        """
+        Filter a batch of texts. Verdicts are memoized per normalized text and
+        all texts that need NLP go through a single nlp.pipe call. With `nlp`
+        False, texts without a memoized verdict get the pattern checks only
+        and their partial verdicts are not memoized.
+        """
+        keys = [' '.join(text.split()) for text in texts]
+        generation = self.terms_generation
+        results = {}
+        pending = []
+        with span('filter_patterns'):
+            for key in keys:
+                if key in results:
+                    continue
+                cached = self.verdicts.get(key)
+                if cached is not None and cached[0] == generation:
+                    results[key] = cached[1]
+                else:
+                    results[key] = self._check_patterns(key)
+                    pending.append(key)
+
+        if not nlp:
+            return [self._copy_result(results[key]) for key in keys]
+
+        nlp_texts = [key for key in pending if self._needs_nlp(key)]
+        if nlp_texts:
+            with span('filter_nlp'):
+                docs = get_nlp().pipe(nlp_texts, batch_size=CONTENT_FILTER['nlp_batch_size'])
+                for key, doc in zip(nlp_texts, docs):
+                    self._check_doc(doc, results[key])
+
+        for key in pending:
+            self.verdicts.set(key, (generation, results[key]))
+
+        return [self._copy_result(results[key]) for key in keys]
+
+    @staticmethod
+    def _copy_result(result: Dict[str, Union[bool, List[str]]]) -> Dict[str, Union[bool, List[str]]]:
+        return {'is_safe': result['is_safe'], 'reasons': list(result['reasons'])}
+
+    def _check_patterns(self, text: str) -> Dict[str, Union[bool, List[str]]]:
+        """Run the pattern-based checks"""
         result = {
             'is_safe': True,
             'reasons': []
         }
 
+        # Single scan over all profanity, sensitive and reported terms
+        matched = self.term_matcher.match(text)
+        if not matched:
+            return result
+
         # Check for profanity
-        for category, pattern in self.profanity_patterns.items():
-            if pattern.search(text):
+        for category in self.config.PROFANITY_WORDS:
+            if ('profanity', category) in matched:
                 result['is_safe'] = False
                 result['reasons'].append(f'Contains {category} profanity')
 
         # Check for sensitive content
-        for category, pattern in self.sensitive_patterns.items():
-            if pattern.search(text):
-                result['is_safe'] = False 
+        for category in self.config.SENSITIVE_PHRASES:
+            if ('sensitive', category) in matched:
+                result['is_safe'] = False
                 result['reasons'].append(f'Contains sensitive {category} content')
 
-        # NLP-based checks
-        doc = nlp(text)
-        
+        # Check for terms reported by users
+        if REPORTED_TERM in matched:
+            result['is_safe'] = False
+            result['reasons'].append('Contains reported term')
+
+        return result
+
+    def _check_doc(self, doc, result: Dict[str, Union[bool, List[str]]]):
+        """Run the NLP-based checks on a parsed doc, updating `result` in place"""
         # Check for personal attacks
         if self._contains_personal_attack(doc):
             result['is_safe'] = False
@@ -74,8 +174,6 @@ class ContentFilter:
             result['is_safe'] = False
             result['reasons'].append('Contains hate speech indicators')
 
-        return result
-
     def _contains_personal_attack(self, doc) -> bool:
         """Check if text contains patterns indicating personal attacks"""
         # Look for combinations of personal pronouns and negative adjectives
@@ -99,18 +197,23 @@ class ContentFilter:
                 return True
         return False
 
-    def filter_suggestions(self, suggestions: List[str]) -> List[str]:
+    def filter_suggestions(self, suggestions: List[str], nlp: bool = True) -> List[str]:
         """Filter a list of autocomplete suggestions"""
         filtered_suggestions = []
-        for suggestion in suggestions:
-            filter_result = self.filter_content(suggestion)
+        for suggestion, filter_result in zip(suggestions, self.filter_contents(suggestions, nlp)):
             if filter_result['is_safe']:
                 filtered_suggestions.append(suggestion)
             else:
+                for reason in filter_result['reasons']:
+                    FILTER_REJECTIONS.inc(1, reason)
                 self.logger.warning(f"Filtered out suggestion: {suggestion}, "
                                   f"reasons: {filter_result['reasons']}")
         return filtered_suggestions
 
+    def is_inappropriate(self, text: str) -> bool:
+        """Check whether a single text fails any filter"""
+        return not self.filter_content(text)['is_safe']
+
     def sanitize_input(self, text: str) -> str:
         """Sanitize input text by removing potentially harmful characters"""
         # Remove special characters and excessive whitespace
@@ -1,39 +1,183 @@
+import threading
 from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine, make_url
 from sqlalchemy.orm import sessionmaker, scoped_session
-from sqlalchemy.pool import QueuePool
 from contextlib import contextmanager
-from typing import Generator
+from typing import TYPE_CHECKING, Dict, Generator, Optional
 
 from config.config import DatabaseConfig
-from models.base import Base
+from utils.metrics import REGISTRY, instrument_pool
 
-class Database:
-    def __init__(self):
-        self.engine = create_engine(
-            DatabaseConfig.DATABASE_URI,
-            poolclass=QueuePool,
-            pool_size=5,
-            max_overflow=10,
-            pool_timeout=30,
-            pool_recycle=3600
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncEngine
+
+PRIMARY = 'primary'
+REPLICA = 'replica'
+
+# asyncio drivers per backend; psycopg (3) serves both modes
+_ASYNC_DRIVERS = {'postgresql': 'asyncpg', 'sqlite': 'aiosqlite', 'mysql': 'aiomysql'}
+_ASYNC_CAPABLE = {'asyncpg', 'psycopg', 'aiosqlite', 'aiomysql', 'asyncmy'}
+
+
+def async_uri(uri: str):
+    """The same database as `uri` through an asyncio driver"""
+    url = make_url(uri)
+    backend = url.get_backend_name()
+    if url.get_driver_name() in _ASYNC_CAPABLE:
+        return url
+    if backend not in _ASYNC_DRIVERS:
+        raise ValueError(f"No asyncio driver known for {backend}")
+    return url.set(drivername=f"{backend}+{_ASYNC_DRIVERS[backend]}")
+
+
+class EngineRegistry:
+    """
+    The process's only database engines, one per role, configured from
+    DatabaseConfig. Writes go to the primary; read-only scans may use the
+    replica, which is the primary engine itself unless REPLICA_URI is set,
+    so a worker holds at most two pools.
+    """
+
+    def __init__(self, primary_uri: str, replica_uri: Optional[str] = None,
+                 pool_size: int = 10, max_overflow: int = 20, pool_timeout: float = 30,
+                 pool_recycle: int = 3600, pool_pre_ping: bool = True):
+        self.uris = {PRIMARY: primary_uri, REPLICA: replica_uri}
+        self.pool_options = {
+            'pool_size': pool_size,
+            'max_overflow': max_overflow,
+            'pool_timeout': pool_timeout,
+            'pool_recycle': pool_recycle
+        }
+        self.pool_pre_ping = pool_pre_ping
+        self._engines: Dict[str, Engine] = {}
+        self._async_engines: Dict[str, 'AsyncEngine'] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config=DatabaseConfig) -> 'EngineRegistry':
+        return cls(
+            config.DATABASE_URI,
+            replica_uri=config.REPLICA_URI,
+            pool_size=config.POOL_SIZE,
+            max_overflow=config.MAX_OVERFLOW,
+            pool_timeout=config.POOL_TIMEOUT,
+            pool_recycle=config.POOL_RECYCLE,
+            pool_pre_ping=config.POOL_PRE_PING
         )
-        
+
+    def _engine_options(self, url) -> Dict:
+        options = {'pool_pre_ping': self.pool_pre_ping}
+        # In-memory SQLite lives in a single connection, so it keeps SQLAlchemy's default pool
+        if not (url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')):
+            options.update(self.pool_options)
+        return options
+
+    def _create_engine(self, uri: str, role: str) -> Engine:
+        url = make_url(uri)
+        engine = create_engine(url, **self._engine_options(url))
+        instrument_pool(engine, role)
+        return engine
+
+    def engine(self, role: str = PRIMARY) -> Engine:
+        """The engine for `role`; the replica role falls back to the primary engine"""
+        if role == REPLICA and not self.uris[REPLICA]:
+            role = PRIMARY
+        engine = self._engines.get(role)
+        if engine is None:
+            with self._lock:
+                engine = self._engines.get(role)
+                if engine is None:
+                    engine = self._engines[role] = self._create_engine(self.uris[role], role)
+        return engine
+
+    def async_engine(self, role: str = PRIMARY) -> 'AsyncEngine':
+        """
+        An asyncio engine on the same database as engine(role), for the async
+        serving mode. It has its own pool of the same size, reported as
+        '<role>_async'.
+        """
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        if role == REPLICA and not self.uris[REPLICA]:
+            role = PRIMARY
+        engine = self._async_engines.get(role)
+        if engine is None:
+            with self._lock:
+                engine = self._async_engines.get(role)
+                if engine is None:
+                    url = async_uri(self.uris[role])
+                    engine = create_async_engine(url, **self._engine_options(url))
+                    instrument_pool(engine.sync_engine, f"{role}_async")
+                    self._async_engines[role] = engine
+        return engine
+
+    @property
+    def has_replica(self) -> bool:
+        return bool(self.uris[REPLICA])
+
+    def pool_stats(self) -> Dict[str, Dict[str, int]]:
+        """Connections per engine: configured size, checked out, idle and overflow"""
+        stats = {}
+        engines = list(self._engines.items())
+        engines += [(f"{role}_async", engine.sync_engine) for role, engine in list(self._async_engines.items())]
+        for role, engine in engines:
+            pool = engine.pool
+            stats[role] = {
+                'size': pool.size() if hasattr(pool, 'size') else 0,
+                'checked_out': pool.checkedout() if hasattr(pool, 'checkedout') else 0,
+                'checked_in': pool.checkedin() if hasattr(pool, 'checkedin') else 0,
+                # QueuePool reports unused capacity as negative overflow
+                'overflow': max(pool.overflow(), 0) if hasattr(pool, 'overflow') else 0
+            }
+        return stats
+
+    def dispose(self):
+        """Close every pooled connection, e.g. in a worker right after fork"""
+        for role, engine in list(self._engines.items()):
+            engine.dispose()
+            # dispose() swaps in a fresh pool, which needs its checkout timing again
+            instrument_pool(engine, role)
+
+    async def dispose_async(self):
+        """Close the async engines' connections; call from the event loop on shutdown"""
+        for role in list(self._async_engines):
+            await self._async_engines.pop(role).dispose()
+
+
+registry = EngineRegistry.from_config()
+
+REGISTRY.gauge('db_pool_connections', 'Database pool connections by engine role and state',
+               ['role', 'state'],
+               callback=lambda: {(role, state): value
+                                 for role, stats in registry.pool_stats().items()
+                                 for state, value in stats.items()})
+
+
+class Database:
+    """Session helpers over the shared engine registry"""
+
+    def __init__(self, engines: EngineRegistry = registry):
+        self.engines = engines
+        self.engine = engines.engine(PRIMARY)
+
         self.session_factory = sessionmaker(
             bind=self.engine,
             autocommit=False,
             autoflush=False
         )
-        
+
         self.Session = scoped_session(self.session_factory)
-        
+
     def create_tables(self):
         """Create all database tables"""
+        from models.base import Base
         Base.metadata.create_all(self.engine)
-        
+
     def drop_tables(self):
         """Drop all database tables"""
+        from models.base import Base
         Base.metadata.drop_all(self.engine)
-        
+
     @contextmanager
     def session_scope(self) -> Generator:
         """Provide a transactional scope around a series of operations"""
@@ -46,14 +190,15 @@ class Database:
             raise e
         finally:
             session.close()
-            
+
     def get_session(self):
         """Get a new database session"""
         return self.Session()
-    
+
     def dispose_engine(self):
-        """Dispose of the database engine"""
-        self.engine.dispose()
+        """Dispose of the database engines"""
+        self.engines.dispose()
+
 
 # Global database instance
 db = Database()
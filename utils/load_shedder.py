@@ -0,0 +1,96 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+import numpy as np
+
+FULL = 'full'
+DEGRADED = 'degraded'
+
+
+class LoadShedder:
+    """
+    Picks the serving mode per request. Requests are degraded to the cheap
+    path while more than `max_in_flight` are being handled (or queued, when
+    the caller passes its own queue depth) or while the p99 of full-path
+    latencies over the last `window` seconds exceeds `p99_threshold`. Once
+    triggered it stays degraded for `hold` seconds so it does not flap.
+    Only full-path requests are timed, so triggering drops the latencies
+    that triggered it and, while degraded, every `probe_every`-th request
+    still takes the full path: recovery is judged on those fresh probes.
+    """
+
+    def __init__(self, p99_threshold: float = 0.25, max_in_flight: int = 32, window: float = 10.0,
+                 hold: float = 5.0, min_samples: int = 20, max_samples: int = 4096,
+                 refresh_interval: float = 0.5, probe_every: int = 20):
+        self.p99_threshold = p99_threshold
+        self.max_in_flight = max_in_flight
+        self.window = window
+        self.hold = hold
+        self.min_samples = min_samples
+        self.refresh_interval = refresh_interval
+        self.probe_every = probe_every
+        self.in_flight = 0
+
+        self._samples = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+        self._p99: Optional[float] = None
+        self._p99_at = 0.0
+        self._degraded_until = 0.0
+        self._counters = {FULL: 0, DEGRADED: 0, 'triggered': 0, 'probes': 0}
+        self._shed = 0
+
+    def _recent_p99(self, now: float) -> Optional[float]:
+        """p99 of full-path latencies inside the window, recomputed at most every refresh_interval"""
+        if now - self._p99_at >= self.refresh_interval:
+            self._p99_at = now
+            while self._samples and self._samples[0][0] < now - self.window:
+                self._samples.popleft()
+            self._p99 = float(np.percentile([latency for _, latency in self._samples], 99)) \
+                if len(self._samples) >= self.min_samples else None
+        return self._p99
+
+    def mode(self, queue_depth: Optional[int] = None) -> str:
+        now = time.monotonic()
+        with self._lock:
+            if now >= self._degraded_until:
+                depth = self.in_flight if queue_depth is None else queue_depth
+                p99 = self._recent_p99(now)
+                if depth > self.max_in_flight or (p99 is not None and p99 > self.p99_threshold):
+                    self._degraded_until = now + self.hold
+                    self._counters['triggered'] += 1
+                    # Judge the next decision on probes taken while degraded, not on what triggered this one
+                    self._samples.clear()
+                    self._p99 = None
+                    self._shed = 0
+            mode = DEGRADED if now < self._degraded_until else FULL
+            if mode == DEGRADED and self.probe_every:
+                self._shed += 1
+                if self._shed % self.probe_every == 0:
+                    mode = FULL
+                    self._counters['probes'] += 1
+            self._counters[mode] += 1
+            return mode
+
+    @contextmanager
+    def admit(self, queue_depth: Optional[int] = None):
+        """Count the request in flight and yield its mode; full-path latency is recorded on exit"""
+        with self._lock:
+            self.in_flight += 1
+        mode = self.mode(queue_depth)
+        started = time.monotonic()
+        try:
+            yield mode
+        finally:
+            finished = time.monotonic()
+            with self._lock:
+                self.in_flight -= 1
+                if mode == FULL:
+                    self._samples.append((finished, finished - started))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self._counters, in_flight=self.in_flight, p99=self._p99,
+                        shedding=int(time.monotonic() < self._degraded_until))
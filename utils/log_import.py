@@ -0,0 +1,290 @@
+"""
+Stream historical query logs into query_stats (and search_history, if kept).
+
+    python -m utils.log_import logs/2023.jsonl.gz logs/2024.csv --build
+    python -m utils.log_import logs/de.jsonl.gz --shard de --build
+
+Files are read line by line (gzip when they end in .gz) in plain text (one
+query per line), CSV (with a header) or JSONL, inferred from the extension
+unless --format is given. Queries are normalized, invalid ones skipped and
+exact duplicate timestamped events within a sliding window dropped (records
+without a timestamp are all counted). Each batch is then folded into
+query_stats, as submitted searches unless --typed is given, and, when raw
+history is kept, bulk-loaded into search_history: COPY on PostgreSQL,
+multi-row INSERT elsewhere. With --shard the query stats are counted for
+that locale or locale:tenant model. Memory stays constant in the size of
+the input.
+"""
+import argparse
+import csv
+import gzip
+import io
+import json
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from sqlalchemy import insert
+
+from config.config import CONTENT_FILTER, QUERY_STATS_CONFIG
+from models.base import db_session, read_session, init_db, engine
+from models.search_model import DEFAULT_SHARD, SHARD_PATTERN, SearchHistory
+from utils.cache import LRUCache
+from utils.query_normalizer import normalize_query
+from utils.query_stats import aggregate, upsert_query_stats
+
+_COLUMNS = ('query', 'timestamp', 'user_id')
+_FORMATS = {'.txt': 'text', '.log': 'text', '.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+
+
+def detect_format(path: str) -> str:
+    name = path[:-3] if path.endswith('.gz') else path
+    for extension, fmt in _FORMATS.items():
+        if name.endswith(extension):
+            return fmt
+    return 'text'
+
+
+def _open(path: str):
+    if path == '-':
+        return io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', errors='replace')
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', errors='replace', newline='')
+    return open(path, 'r', encoding='utf-8', errors='replace', newline='')
+
+
+def parse_timestamp(value) -> Optional[datetime]:
+    """ISO 8601 strings or epoch seconds, as naive UTC"""
+    if value in (None, ''):
+        return None
+    if isinstance(value, (int, float)) or str(value).replace('.', '', 1).isdigit():
+        parsed = datetime.fromtimestamp(float(value), timezone.utc)
+    else:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def read_records(path: str, fmt: str, query_field: str = 'query',
+                 timestamp_field: str = 'timestamp', user_field: str = 'user_id') -> Iterator[Dict]:
+    """Yield raw {'query', 'timestamp', 'user_id'} records from one file"""
+    with _open(path) as f:
+        if fmt == 'text':
+            for line in f:
+                yield {'query': line.rstrip('\r\n')}
+        elif fmt == 'csv':
+            for row in csv.DictReader(f):
+                yield {'query': row.get(query_field), 'timestamp': row.get(timestamp_field),
+                       'user_id': row.get(user_field)}
+        elif fmt == 'jsonl':
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    yield {'query': None}
+                    continue
+                yield {'query': row.get(query_field), 'timestamp': row.get(timestamp_field),
+                       'user_id': row.get(user_field)}
+        else:
+            raise ValueError(f"Unknown log format: {fmt}")
+
+
+class LogImporter:
+    """
+    Normalizes, deduplicates and bulk-loads query log records in batches of
+    `batch_size`. Duplicates are exact repeats of (query, timestamp, user)
+    among the last `dedupe_window` distinct events, so memory is bounded.
+    Only records with their own timestamp can be duplicates: without one,
+    repeats are indistinguishable from separate searches and all count.
+    With `submitted` the records are counted as submitted searches, which
+    popularity and ranking weigh, rather than as autocomplete keystrokes.
+    """
+
+    def __init__(self, batch_size: int = 10000, dedupe_window: int = 100000,
+                 method: str = 'auto', default_timestamp: Optional[datetime] = None,
+                 progress_interval: float = 5.0, out=sys.stderr,
+                 raw_history: bool = QUERY_STATS_CONFIG['raw_history'], shard: str = DEFAULT_SHARD,
+                 submitted: bool = True):
+        self.batch_size = batch_size
+        self.shard = shard
+        self.submitted = submitted
+        self.raw_history = raw_history
+        self.seen = LRUCache(max_size=dedupe_window, ttl=float('inf')) if dedupe_window else None
+        self.method = self._resolve_method(method)
+        self.default_timestamp = default_timestamp or datetime.utcnow()
+        self.progress_interval = progress_interval
+        self.out = out
+        self.stats = {'read': 0, 'imported': 0, 'invalid': 0, 'duplicates': 0, 'batches': 0}
+        self._started = None
+
+    @staticmethod
+    def _resolve_method(method: str) -> str:
+        if method != 'auto':
+            return method
+        return 'copy' if engine.dialect.name == 'postgresql' else 'insert'
+
+    def _clean(self, record: Dict) -> Optional[Dict]:
+        query = record.get('query')
+        if not isinstance(query, str):
+            return None
+        query = normalize_query(query)
+        if not (CONTENT_FILTER['min_length'] <= len(query) <= SearchHistory.query.type.length):
+            return None
+        try:
+            timestamp = parse_timestamp(record.get('timestamp')) or self.default_timestamp
+        except (ValueError, OverflowError, OSError):
+            return None
+        user_id = record.get('user_id') or None
+        return {'query': query, 'timestamp': timestamp,
+                'user_id': str(user_id)[:100] if user_id is not None else None}
+
+    def rows(self, records: Iterable[Dict]) -> Iterator[Dict]:
+        for record in records:
+            self.stats['read'] += 1
+            row = self._clean(record)
+            if row is None:
+                self.stats['invalid'] += 1
+                continue
+            if self.seen is not None and record.get('timestamp') not in (None, ''):
+                key = (row['query'], row['timestamp'], row['user_id'])
+                if key in self.seen:
+                    self.stats['duplicates'] += 1
+                    continue
+                self.seen.set(key, True)
+            yield row
+
+    def _insert(self, batch: List[Dict]):
+        db_session.execute(insert(SearchHistory), batch)
+        db_session.commit()
+
+    def _copy(self, batch: List[Dict]):
+        connection = engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            statement = f"COPY {SearchHistory.__tablename__} ({', '.join(_COLUMNS)}) FROM STDIN"
+            if hasattr(cursor, 'copy'):
+                # psycopg 3
+                with cursor.copy(statement) as copy:
+                    for row in batch:
+                        copy.write_row([row[column] for column in _COLUMNS])
+            else:
+                # psycopg2
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                for row in batch:
+                    writer.writerow(['' if row[c] is None else row[c] for c in _COLUMNS])
+                buffer.seek(0)
+                cursor.copy_expert(f"{statement} WITH (FORMAT csv)", buffer)
+            connection.commit()
+        finally:
+            connection.close()
+
+    def _load(self, batch: List[Dict]):
+        upsert_query_stats(db_session, aggregate(dict(row, shard=self.shard, submitted=self.submitted)
+                                                 for row in batch))
+        db_session.commit()
+        if self.raw_history:
+            if self.method == 'copy':
+                self._copy(batch)
+            else:
+                self._insert(batch)
+        self.stats['imported'] += len(batch)
+        self.stats['batches'] += 1
+
+    def _report(self, final: bool = False):
+        elapsed = time.perf_counter() - self._started
+        rate = self.stats['imported'] / elapsed if elapsed else 0.0
+        label = 'done' if final else 'progress'
+        print(f"[{label}] read={self.stats['read']} imported={self.stats['imported']} "
+              f"invalid={self.stats['invalid']} duplicates={self.stats['duplicates']} "
+              f"elapsed={elapsed:.1f}s rate={rate:,.0f} rows/s", file=self.out)
+
+    def run(self, records: Iterable[Dict]) -> Dict:
+        self._started = time.perf_counter()
+        last_report = self._started
+        batch = []
+        for row in self.rows(records):
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                self._load(batch)
+                batch = []
+                if time.perf_counter() - last_report >= self.progress_interval:
+                    self._report()
+                    last_report = time.perf_counter()
+        if batch:
+            self._load(batch)
+        self._report(final=True)
+
+        elapsed = time.perf_counter() - self._started
+        return dict(self.stats, seconds=round(elapsed, 3),
+                    rows_per_second=round(self.stats['imported'] / elapsed, 1) if elapsed else None)
+
+
+def build_model(shard: str = DEFAULT_SHARD) -> Dict:
+    """Rebuild the shard's model and prefix index once over everything imported"""
+    from services.prediction_service import PredictionService
+
+    service = PredictionService(db_session, read_session=read_session, shard=shard)
+    try:
+        if 'train_model' not in service.load_timings:
+            # The constructor only loaded an existing artifact
+            service.train_model()
+        return service.model_status()
+    finally:
+        service.shutdown()
+        db_session.remove()
+        read_session.remove()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='+', help="Log files; '-' reads stdin")
+    parser.add_argument('--format', choices=['auto', 'text', 'csv', 'jsonl'], default='auto')
+    parser.add_argument('--query-field', default='query', help='CSV column / JSON key holding the query')
+    parser.add_argument('--timestamp-field', default='timestamp', help='ISO 8601 or epoch seconds')
+    parser.add_argument('--user-field', default='user_id')
+    parser.add_argument('--batch-size', type=int, default=10000)
+    parser.add_argument('--dedupe-window', type=int, default=100000,
+                        help='Recent distinct timestamped events checked for exact duplicates; 0 disables')
+    parser.add_argument('--method', choices=['auto', 'copy', 'insert'], default='auto',
+                        help='COPY needs PostgreSQL with psycopg or psycopg2')
+    parser.add_argument('--no-raw-history', dest='raw_history', action='store_false',
+                        default=QUERY_STATS_CONFIG['raw_history'],
+                        help='Only update query_stats, without writing search_history rows')
+    parser.add_argument('--shard', default=DEFAULT_SHARD,
+                        help="Model shard the queries count for, a locale or locale:tenant in MODEL_SHARDS")
+    kind = parser.add_mutually_exclusive_group()
+    kind.add_argument('--submitted', dest='submitted', action='store_true', default=True,
+                      help='Count records as submitted searches (default), as query logs hold')
+    kind.add_argument('--typed', dest='submitted', action='store_false',
+                      help='Count records as autocomplete keystrokes, e.g. for a log of prefix requests')
+    parser.add_argument('--build', action='store_true', help='Build the model and prefix index once at the end')
+    args = parser.parse_args(argv)
+    args.shard = args.shard.lower()
+    if not SHARD_PATTERN.fullmatch(args.shard):
+        parser.error(f"invalid shard name: {args.shard}")
+
+    init_db()
+    importer = LogImporter(batch_size=args.batch_size, dedupe_window=args.dedupe_window, method=args.method,
+                           raw_history=args.raw_history, shard=args.shard, submitted=args.submitted)
+
+    def records():
+        for path in args.paths:
+            fmt = detect_format(path) if args.format == 'auto' else args.format
+            yield from read_records(path, fmt, args.query_field, args.timestamp_field, args.user_field)
+
+    try:
+        summary = importer.run(records())
+    finally:
+        db_session.remove()
+    if args.build:
+        summary['model'] = build_model(args.shard)
+    print(json.dumps(summary, default=str))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from config.config import METRICS_CONFIG
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence) -> str:
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 callback: Optional[Callable] = None):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.callback = callback
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def _current_values(self) -> Dict[LabelValues, float]:
+        """
+        Stored values, or those returned by `callback` at scrape time: a
+        number, or a dict of label values to numbers when the metric has
+        labels. Callbacks let the hot path pay nothing for values that are
+        already counted elsewhere.
+        """
+        if self.callback is None:
+            with self._lock:
+                return dict(self._values)
+        value = self.callback()
+        if not isinstance(value, dict):
+            return {(): value} if value is not None else {}
+        return {labels if isinstance(labels, tuple) else (labels,): v
+                for labels, v in value.items() if v is not None}
+
+    def samples(self) -> Iterable[Tuple[str, LabelValues, float]]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, value in self.samples():
+            names = self.label_names + (('le',) if len(labels) > len(self.label_names) else ())
+            lines.append(f"{self.name}{suffix}{_format_labels(names, labels)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1.0, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def samples(self):
+        for labels, value in sorted(self._current_values().items()):
+            yield '', labels, value
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value: float, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def samples(self):
+        for labels, value in sorted(self._current_values().items()):
+            yield '', labels, value
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram; observe() is a bisect and three additions under a lock"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 buckets: Optional[Sequence[float]] = None):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets or METRICS_CONFIG['latency_buckets']))
+        # labels -> [per-bucket counts (last one is +Inf), sum, count]
+        self._series: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, *labels):
+        position = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][position] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            snapshot = {labels: (list(counts), total, count)
+                        for labels, (counts, total, count) in self._series.items()}
+        for labels, (counts, total, count) in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                yield '_bucket', labels + (_format_value(bound),), cumulative
+            yield '_sum', labels, total
+            yield '_count', labels, count
+
+
+class MetricsRegistry:
+    """
+    Process-local metrics rendered in the Prometheus text exposition format.
+    With several workers each process keeps its own values, so scrape every
+    worker (or sum them in the query) as with any multi-process exporter.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            registered = self._metrics.setdefault(metric.name, metric)
+        if metric.callback is not None:
+            # Re-registering a callback metric points it at the newest source
+            registered.callback = metric.callback
+        return registered
+
+    def counter(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                callback: Optional[Callable] = None) -> Counter:
+        return self._register(Counter(name, documentation, label_names, callback))
+
+    def gauge(self, name: str, documentation: str, label_names: Sequence[str] = (),
+              callback: Optional[Callable] = None) -> Gauge:
+        return self._register(Gauge(name, documentation, label_names, callback))
+
+    def histogram(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                  buckets: Optional[Sequence[float]] = None) -> Histogram:
+        return self._register(Histogram(name, documentation, label_names, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                # A failing callback must not take the whole scrape down
+                lines.append(f"# {metric.name} unavailable: {_escape(e)}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'search_stage_duration_seconds',
+    'Time spent in each stage of autocomplete and the request handlers',
+    ['stage']
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    'search_request_duration_seconds',
+    'End-to-end handler time per endpoint and status code',
+    ['endpoint', 'status']
+)
+POOL_CHECKOUT_SECONDS = REGISTRY.histogram(
+    'db_pool_checkout_wait_seconds',
+    'Time spent waiting for a database connection from the pool',
+    ['role']
+)
+FILTER_REJECTIONS = REGISTRY.counter(
+    'content_filter_rejections_total',
+    'Suggestions removed by the content filter, by reason',
+    ['reason']
+)
+
+
+@contextmanager
+def _timed_span(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage)
+
+
+@contextmanager
+def _null_span(stage: str):
+    yield
+
+
+# Spans cost two perf_counter() calls and one histogram update; disabled spans time nothing
+span = _timed_span if METRICS_CONFIG['enabled'] else _null_span
+
+
+def instrument_pool(engine, role: str = 'primary'):
+    """Time connection checkouts from `engine`'s pool"""
+    if not METRICS_CONFIG['enabled']:
+        return
+    pool = engine.pool
+    do_get = pool._do_get
+
+    def timed_do_get():
+        started = time.perf_counter()
+        try:
+            return do_get()
+        finally:
+            POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - started, role)
+
+    pool._do_get = timed_do_get
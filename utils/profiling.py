@@ -0,0 +1,313 @@
+"""
+On-demand profiling of a live worker.
+
+Nothing here costs anything until an admin arms it: request and training
+hooks test one attribute, tracemalloc and the sampler are not running, and
+slow requests are only compared against a threshold when one is set.
+Finished profiles are written as standard files (pstats dumps for cProfile,
+folded stacks for the sampler, tracemalloc snapshot dumps) and can be
+downloaded. Every profiler belongs to one process, so with several workers
+each is armed and read separately.
+"""
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+from config.config import PROFILING_CONFIG
+
+# What a cProfile session can be armed for
+REQUEST = 'request'
+TRAIN_MODEL = 'train_model'
+TARGETS = (REQUEST, TRAIN_MODEL)
+
+
+class ProfileStore:
+    """Finished profiles as files in `directory`, the oldest deleted once more than `keep` exist"""
+
+    def __init__(self, directory: str, keep: int = 20):
+        self.directory = directory
+        self.keep = keep
+        self._profiles: 'OrderedDict[str, Dict]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, kind: str, extension: str, write: Callable[[str], None], **summary) -> Dict:
+        """Write a profile through `write(path)` and index it; returns its description"""
+        os.makedirs(self.directory, exist_ok=True)
+        profile_id = uuid.uuid4().hex[:12]
+        filename = f"{kind}-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{profile_id}{extension}"
+        path = os.path.join(self.directory, filename)
+        write(path)
+        profile = dict(summary, id=profile_id, kind=kind, filename=filename,
+                       created_at=time.time(), bytes=os.path.getsize(path))
+        with self._lock:
+            self._profiles[profile_id] = dict(profile, path=path)
+            while len(self._profiles) > self.keep:
+                _, oldest = self._profiles.popitem(last=False)
+                try:
+                    os.remove(oldest['path'])
+                except OSError:
+                    pass
+        return profile
+
+    def get(self, profile_id: str) -> Optional[Dict]:
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+    def list(self) -> List[Dict]:
+        """Newest first, without local paths"""
+        with self._lock:
+            return [{name: value for name, value in profile.items() if name != 'path'}
+                    for profile in reversed(self._profiles.values())]
+
+
+class CProfiler:
+    """
+    Deterministic profiles of the next `count` requests (optionally of one
+    endpoint) or training runs, merged into one pstats file. One call is
+    profiled at a time; calls arriving while another is being profiled are
+    skipped, so concurrent threads never share a profiler.
+    """
+
+    def __init__(self, store: ProfileStore, max_count: int = 1000):
+        self.store = store
+        self.max_count = max_count
+        self.active = False
+        self.logger = logging.getLogger(__name__)
+
+        self._session: Optional[Dict] = None
+        self._stats: Optional[pstats.Stats] = None
+        self._busy = threading.Lock()
+        self._lock = threading.Lock()
+
+    def arm(self, target: str = REQUEST, count: int = 100, endpoint: Optional[str] = None) -> Dict:
+        if target not in TARGETS:
+            raise ValueError(f"Unknown profiling target {target!r}, expected one of {TARGETS}")
+        if not 1 <= count <= self.max_count:
+            raise ValueError(f"count must be between 1 and {self.max_count}")
+        with self._lock:
+            if self.active:
+                raise RuntimeError("A profiling session is already running")
+            self._stats = None
+            self._session = {'target': target, 'endpoint': endpoint, 'count': count, 'profiled': 0,
+                             'skipped': 0, 'seconds': 0.0, 'started_at': time.time()}
+            self.active = True
+            return dict(self._session)
+
+    def begin(self, target: str, name: Optional[str] = None) -> Optional[cProfile.Profile]:
+        """A running profiler if this call is one to sample, else None; pass it to end()"""
+        session = self._session
+        if not self.active or session is None or session['target'] != target:
+            return None
+        if session['endpoint'] is not None and session['endpoint'] != name:
+            return None
+        if not self._busy.acquire(blocking=False):
+            session['skipped'] += 1
+            return None
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def end(self, profile: cProfile.Profile, seconds: float = 0.0):
+        profile.disable()
+        finished = None
+        try:
+            with self._lock:
+                if not self.active:
+                    return
+                if self._stats is None:
+                    self._stats = pstats.Stats(profile)
+                else:
+                    self._stats.add(profile)
+                self._session['profiled'] += 1
+                self._session['seconds'] += seconds
+                if self._session['profiled'] >= self._session['count']:
+                    finished = self._finish()
+        finally:
+            self._busy.release()
+        if finished is not None:
+            self.logger.info(f"Profile {finished['id']} written after {finished['profiled']} calls")
+
+    @contextmanager
+    def profile(self, target: str, name: Optional[str] = None):
+        """Profile the block if the session is armed for `target`"""
+        profile = self.begin(target, name) if self.active else None
+        if profile is None:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.end(profile, time.perf_counter() - started)
+
+    def stop(self) -> Optional[Dict]:
+        """End the session early, writing what was collected; None if nothing was"""
+        with self._lock:
+            return self._finish() if self.active else None
+
+    def _finish(self) -> Optional[Dict]:
+        # Called with _lock held
+        self.active = False
+        session, stats = self._session, self._stats
+        self._stats = None
+        if stats is None:
+            return None
+        summary = io.StringIO()
+        stats.stream = summary
+        stats.sort_stats('cumulative').print_stats(15)
+        return self.store.add(session['target'], '.prof', stats.dump_stats,
+                              profiled=session['profiled'], skipped=session['skipped'],
+                              seconds=round(session['seconds'], 3), endpoint=session['endpoint'],
+                              top=summary.getvalue())
+
+    def status(self) -> Optional[Dict]:
+        with self._lock:
+            return dict(self._session, active=self.active, seconds=round(self._session['seconds'], 3)) \
+                if self._session is not None else None
+
+
+class SamplingProfiler:
+    """
+    Samples every thread's stack every `interval` seconds for `duration`
+    seconds from a daemon thread, so the profiled code runs unmodified.
+    Written as folded stacks (one 'thread;outer;...;inner count' line per
+    distinct stack), which flamegraph.pl and speedscope read.
+    """
+
+    def __init__(self, store: ProfileStore, max_duration: float = 300.0):
+        self.store = store
+        self.max_duration = max_duration
+        self.last: Optional[Dict] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, duration: float = 10.0, interval: float = 0.005) -> Dict:
+        if not 0 < duration <= self.max_duration:
+            raise ValueError(f"duration must be between 0 and {self.max_duration} seconds")
+        if not 0.001 <= interval <= 1.0:
+            raise ValueError("interval must be between 0.001 and 1 second")
+        with self._lock:
+            if self.running:
+                raise RuntimeError("The sampling profiler is already running")
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, args=(duration, interval),
+                                            name='sampling-profiler', daemon=True)
+            self._thread.start()
+        return {'duration': duration, 'interval': interval, 'started_at': time.time()}
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self, duration: float, interval: float):
+        stacks = Counter()
+        samples = 0
+        own = threading.get_ident()
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline and not self._stop.is_set():
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                frames = []
+                while frame is not None:
+                    code = frame.f_code
+                    frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                frames.append(names.get(ident, str(ident)))
+                stacks[';'.join(reversed(frames))] += 1
+            samples += 1
+            time.sleep(interval)
+
+        def write(path):
+            with open(path, 'w') as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+
+        self.last = self.store.add('sample', '.folded', write, samples=samples, interval=interval,
+                                   stacks=len(stacks))
+
+
+class AllocationTracker:
+    """tracemalloc on demand: top allocators by line, with the snapshot written for offline comparison"""
+
+    def __init__(self, store: ProfileStore):
+        self.store = store
+        self._started_here = False
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = 10) -> Dict:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            self._started_here = True
+        return self.status()
+
+    def stop(self) -> Dict:
+        if self._started_here:
+            tracemalloc.stop()
+            self._started_here = False
+        return self.status()
+
+    def snapshot(self, limit: int = 20, key_type: str = 'lineno') -> Dict:
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is not tracing; start it first")
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>')
+        ])
+        top = [{'location': str(stat.traceback), 'bytes': stat.size, 'count': stat.count}
+               for stat in snapshot.statistics(key_type)[:limit]]
+        profile = self.store.add('tracemalloc', '.tracemalloc', snapshot.dump, top_count=len(top))
+        return dict(self.status(), profile=profile, top=top)
+
+    def status(self) -> Dict:
+        current, peak = tracemalloc.get_traced_memory()
+        return {'tracing': tracemalloc.is_tracing(), 'frames': tracemalloc.get_traceback_limit(),
+                'traced_bytes': current, 'peak_bytes': peak}
+
+
+class SlowRequestLog:
+    """The last `size` requests slower than `threshold` seconds; None turns the check off"""
+
+    def __init__(self, threshold: Optional[float] = None, size: int = 200):
+        self.threshold = threshold
+        self.logger = logging.getLogger(__name__)
+        self._entries = deque(maxlen=size)
+        self._recorded = 0
+
+    def record(self, seconds: float, **request):
+        entry = dict(request, seconds=round(seconds, 4), at=time.time())
+        self._entries.append(entry)
+        self._recorded += 1
+        self.logger.warning(f"Slow request: {entry}")
+
+    def entries(self) -> List[Dict]:
+        """Newest first"""
+        return list(reversed(self._entries))
+
+    def stats(self) -> Dict:
+        return {'threshold': self.threshold, 'recorded': self._recorded, 'kept': len(self._entries)}
+
+
+PROFILES = ProfileStore(PROFILING_CONFIG['output_dir'], keep=PROFILING_CONFIG['keep'])
+PROFILER = CProfiler(PROFILES, max_count=PROFILING_CONFIG['max_requests'])
+SAMPLER = SamplingProfiler(PROFILES, max_duration=PROFILING_CONFIG['max_sample_seconds'])
+ALLOCATIONS = AllocationTracker(PROFILES)
+SLOW_REQUESTS = SlowRequestLog(PROFILING_CONFIG['slow_request_seconds'], size=PROFILING_CONFIG['slow_log_size'])
@@ -0,0 +1,19 @@
+import re
+
+_WHITESPACE = re.compile(r'\s+')
+
+def normalize_query(text: str) -> str:
+    """Normalize a search query for indexing and lookup (case-folded, single-spaced)"""
+    if not text:
+        return ''
+    return _WHITESPACE.sub(' ', text).strip().lower()
+
+def normalize_prefix(text: str) -> str:
+    """
+    Normalize a partially typed query. A trailing space is kept because it is
+    meaningful while typing: "how " must not complete to "hover".
+    """
+    normalized = normalize_query(text)
+    if normalized and text[-1:].isspace():
+        normalized += ' '
+    return normalized
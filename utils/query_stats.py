@@ -0,0 +1,277 @@
+"""
+Aggregated per-query statistics kept in query_stats by upsert.
+
+    python -m utils.query_stats backfill        # fold existing search_history into query_stats, once
+    python -m utils.query_stats purge --days 30 # apply the raw history retention now
+
+Autocomplete requests are recorded as events, pre-aggregated per batch and
+upserted, so the table holds one row per normalized query however often it
+is typed. Training, prefix ranking and popularity seeding read it instead
+of scanning raw search_history rows; training and the indexes leave out
+the keystroke prefixes of longer queries unless they were submitted.
+"""
+import argparse
+import json
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from sqlalchemy import case, exists, func, or_
+from sqlalchemy.orm import Query, Session
+
+from config.config import QUERY_STATS_CONFIG
+from models.search_model import DEFAULT_SHARD, AutocompleteSuggestion, QueryStats, SearchHistory, UserFeedback
+from utils.query_normalizer import normalize_query
+from utils.write_behind import WriteBehindBuffer
+
+_MAX_LENGTH = QueryStats.query.type.length
+
+
+def query_event(query: str, timestamp: Optional[datetime] = None, submitted: bool = False,
+                count: int = 1, shard: str = DEFAULT_SHARD) -> Optional[Dict]:
+    """An event for aggregate(), or None when the query normalizes to nothing usable"""
+    normalized = normalize_query(query)
+    if not normalized or len(normalized) > _MAX_LENGTH:
+        return None
+    return {'query': normalized, 'timestamp': timestamp or datetime.utcnow(),
+            'submitted': submitted, 'count': count, 'shard': shard}
+
+
+def aggregate(events: Iterable[Dict]) -> List[Dict]:
+    """Fold events into one upsert row per shard and query, sorted so concurrent upserts lock rows in the same order"""
+    rows: Dict[tuple, Dict] = {}
+    for event in events:
+        count = event.get('count', 1)
+        key = (event.get('shard', DEFAULT_SHARD), event['query'])
+        row = rows.get(key)
+        if row is None:
+            rows[key] = {
+                'shard': key[0],
+                'query': event['query'],
+                'count': count,
+                'submitted_count': count if event.get('submitted') else 0,
+                'first_seen': event.get('first_seen', event['timestamp']),
+                'last_seen': event['timestamp']
+            }
+            continue
+        row['count'] += count
+        if event.get('submitted'):
+            row['submitted_count'] += count
+        row['first_seen'] = min(row['first_seen'], event.get('first_seen', event['timestamp']))
+        row['last_seen'] = max(row['last_seen'], event['timestamp'])
+    return [rows[key] for key in sorted(rows)]
+
+
+def upsert_query_stats(session: Session, rows: List[Dict]):
+    """Add aggregated rows to query_stats: counts are summed and first/last seen widened"""
+    if not rows:
+        return
+    dialect = session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        _merge_query_stats(session, rows)
+        return
+
+    statement = insert(QueryStats)
+    excluded = statement.excluded
+    statement = statement.on_conflict_do_update(index_elements=[QueryStats.shard, QueryStats.query], set_={
+        'count': QueryStats.count + excluded.count,
+        'submitted_count': QueryStats.submitted_count + excluded.submitted_count,
+        'first_seen': case((excluded.first_seen < QueryStats.first_seen, excluded.first_seen),
+                           else_=QueryStats.first_seen),
+        'last_seen': case((excluded.last_seen > QueryStats.last_seen, excluded.last_seen),
+                          else_=QueryStats.last_seen)
+    })
+    session.execute(statement, rows)
+
+
+def _merge_query_stats(session: Session, rows: List[Dict]):
+    """Read-modify-write fallback for databases without INSERT ... ON CONFLICT"""
+    existing = {(stats.shard, stats.query): stats for stats in session.query(QueryStats)
+                .filter(QueryStats.query.in_([row['query'] for row in rows])).with_for_update()}
+    for row in rows:
+        stats = existing.get((row['shard'], row['query']))
+        if stats is None:
+            session.add(QueryStats(**row))
+            continue
+        stats.count += row['count']
+        stats.submitted_count += row['submitted_count']
+        stats.first_seen = min(stats.first_seen, row['first_seen'])
+        stats.last_seen = max(stats.last_seen, row['last_seen'])
+    session.flush()
+
+
+def weighted_query_counts(session: Session, since: datetime, as_of: Optional[datetime] = None,
+                          min_count: int = QUERY_STATS_CONFIG['min_count'],
+                          submitted_weight: int = QUERY_STATS_CONFIG['submitted_weight'],
+                          shard: str = DEFAULT_SHARD) -> Query:
+    """
+    (query, weight) for `shard`'s queries last seen since `since`, heaviest
+    first; a submission weighs 1 + submitted_weight searches. Queries never
+    submitted need `min_count` searches to be included.
+    """
+    weight = QueryStats.count + submitted_weight * QueryStats.submitted_count
+    rows = session.query(QueryStats.query, weight)\
+        .filter(QueryStats.shard == shard)\
+        .filter(QueryStats.last_seen >= since)\
+        .filter(or_(QueryStats.submitted_count > 0, QueryStats.count >= min_count))
+    if as_of is not None:
+        # Queries first seen after a build started stay out of both its passes
+        rows = rows.filter(QueryStats.first_seen <= as_of)
+    # Model rows follow this order, so row ids rank queries and truncated candidate lists keep the heaviest
+    return rows.order_by(weight.desc(), QueryStats.query)
+
+
+def keystroke_prefixes(session: Session, since: datetime, as_of: Optional[datetime] = None,
+                       shard: str = DEFAULT_SHARD) -> Set[str]:
+    """
+    `shard`'s never submitted queries that are strict prefixes of another of
+    its queries: the keystrokes autocomplete logged on the way to a query,
+    which should not be suggested themselves.
+    """
+    rows = session.query(QueryStats.query, QueryStats.submitted_count)\
+        .filter(QueryStats.shard == shard)\
+        .filter(QueryStats.last_seen >= since)
+    if as_of is not None:
+        rows = rows.filter(QueryStats.first_seen <= as_of)
+    # In code point order a string's extensions come right after it, so comparing neighbours is enough
+    ordered = sorted(rows.yield_per(10000))
+    return {query for (query, submitted), (following, _) in zip(ordered, ordered[1:])
+            if not submitted and following.startswith(query)}
+
+
+def training_query_counts(session: Session, since: datetime, as_of: Optional[datetime] = None,
+                          shard: str = DEFAULT_SHARD, chunk_size: int = 10000) -> Iterator[Tuple[str, int]]:
+    """weighted_query_counts without keystroke prefixes, the input of training and the prefix and fuzzy indexes"""
+    prefixes = keystroke_prefixes(session, since, as_of, shard=shard)
+    for query, weight in weighted_query_counts(session, since, as_of, shard=shard).yield_per(chunk_size):
+        if query not in prefixes:
+            yield query, weight
+
+
+def total_searches(session: Session, shard: Optional[str] = None) -> int:
+    """Searches recorded in query_stats, for one shard or all, a monotonic counter for retrain decisions"""
+    total = session.query(func.sum(QueryStats.count))
+    if shard is not None:
+        total = total.filter(QueryStats.shard == shard)
+    return int(total.scalar() or 0)
+
+
+def purge_search_history(session: Session, days: int, batch_size: int = 10000) -> int:
+    """
+    Delete search_history rows older than `days` days in batches, keeping
+    rows that feedback or stored suggestions still point at.
+    Returns the rows deleted.
+    """
+    cutoff_date = datetime.utcnow() - timedelta(days=days)
+    referenced = or_(
+        exists().where(UserFeedback.search_id == SearchHistory.id),
+        exists().where(AutocompleteSuggestion.search_id == SearchHistory.id)
+    )
+    deleted = 0
+    while True:
+        ids = [row_id for (row_id,) in session.query(SearchHistory.id)
+               .filter(SearchHistory.timestamp < cutoff_date)
+               .filter(~referenced)
+               .limit(batch_size)]
+        if not ids:
+            break
+        session.query(SearchHistory).filter(SearchHistory.id.in_(ids)).delete(synchronize_session=False)
+        session.commit()
+        deleted += len(ids)
+        if len(ids) < batch_size:
+            break
+    return deleted
+
+
+def backfill_from_search_history(session: Session, read: Optional[Session] = None,
+                                 chunk_size: int = 10000) -> int:
+    """
+    Fold every search_history row into query_stats. Counts add up, so run
+    it once, before or instead of importing the same rows again.
+    Returns the distinct raw queries read.
+    """
+    read = read or session
+    rows = read.query(SearchHistory.query, func.count(SearchHistory.id),
+                      func.min(SearchHistory.timestamp), func.max(SearchHistory.timestamp))\
+        .group_by(SearchHistory.query)\
+        .yield_per(chunk_size)
+    events = []
+    seen = 0
+    for query, count, first_seen, last_seen in rows:
+        seen += 1
+        event = query_event(query, last_seen, count=count)
+        if event is None or first_seen is None:
+            continue
+        event['first_seen'] = first_seen
+        events.append(event)
+        if len(events) >= chunk_size:
+            upsert_query_stats(session, aggregate(events))
+            session.commit()
+            events = []
+    upsert_query_stats(session, aggregate(events))
+    session.commit()
+    return seen
+
+
+class QueryStatsBuffer(WriteBehindBuffer):
+    """
+    Write-behind buffer of query events; each batch is aggregated per query
+    and upserted, so a burst of keystrokes for one query is a single row write.
+    """
+    span_name = 'query_stats_commit'
+
+    def __init__(self, session_factory: Callable[[], Session],
+                 on_written: Optional[Callable[[Set[str]], None]] = None, **options):
+        super().__init__(QueryStats, session_factory, **options)
+        # Called on the flusher thread with the shards each batch counted searches for
+        self.on_written = on_written
+
+    def record(self, query: str, submitted: bool = False, timestamp: Optional[datetime] = None,
+               timeout: Optional[float] = None, shard: str = DEFAULT_SHARD) -> bool:
+        event = query_event(query, timestamp, submitted, shard=shard)
+        return self.submit(event, timeout) if event is not None else False
+
+    def _execute(self, session: Session, batch: List[Dict]):
+        upsert_query_stats(session, aggregate(batch))
+
+    def _write(self, batch: List[Dict]):
+        super()._write(batch)
+        if self.on_written is not None:
+            try:
+                self.on_written({event.get('shard', DEFAULT_SHARD) for event in batch})
+            except Exception as e:
+                self.logger.error(f"Error after writing query stats: {str(e)}")
+
+
+def main(argv=None):
+    from models.base import db_session, read_session, init_db
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    backfill = commands.add_parser('backfill', help='Fold all search_history rows into query_stats')
+    backfill.add_argument('--force', action='store_true', help='Run even if query_stats already has rows')
+    purge = commands.add_parser('purge', help='Delete unreferenced search_history rows past retention')
+    purge.add_argument('--days', type=int, default=QUERY_STATS_CONFIG['raw_retention_days'])
+    args = parser.parse_args(argv)
+
+    init_db()
+    try:
+        if args.command == 'backfill':
+            if not args.force and db_session.query(QueryStats.id).first() is not None:
+                parser.error('query_stats is not empty; backfilling again would double count (use --force)')
+            summary = {'queries_read': backfill_from_search_history(db_session, read_session)}
+        else:
+            if args.days is None:
+                parser.error('--days is required when raw_retention_days is None')
+            summary = {'deleted': purge_search_history(db_session, args.days)}
+    finally:
+        db_session.remove()
+        read_session.remove()
+    print(json.dumps(summary))
+
+
+if __name__ == '__main__':
+    main()
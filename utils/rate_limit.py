@@ -0,0 +1,135 @@
+import logging
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Tuple
+from urllib.parse import urlparse
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+_PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+def parse_rate(rate: str) -> Tuple[int, int]:
+    """'100/hour' or '100 per hour' as (100, 3600)"""
+    match = re.fullmatch(r'\s*(\d+)\s*(?:/|per)\s*(second|minute|hour|day)s?\s*', rate.lower())
+    if match is None:
+        raise ValueError(f"Unparseable rate limit: {rate!r}")
+    return int(match.group(1)), _PERIODS[match.group(2)]
+
+
+class InMemoryBucketStore:
+    """Token buckets in this process, the least recently used dropped past `max_keys`"""
+    local = True
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._buckets: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, capacity: int, rate: float, cost: int = 1) -> Tuple[bool, float]:
+        """Refill `key`'s bucket at `rate` tokens/s up to `capacity`, then take `cost` if there are enough"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, tokens
+
+
+class RedisBucketStore:
+    """Token buckets shared by every worker, updated atomically by a Lua script on Redis time"""
+    local = False
+
+    _SCRIPT = """
+        local capacity = tonumber(ARGV[1])
+        local rate = tonumber(ARGV[2])
+        local cost = tonumber(ARGV[3])
+        local clock = redis.call('TIME')
+        local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+        local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+        local tokens = tonumber(bucket[1]) or capacity
+        local updated = tonumber(bucket[2]) or now
+        tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+        local allowed = 0
+        if tokens >= cost then
+            tokens = tokens - cost
+            allowed = 1
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+        redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+        return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, url: str, prefix: str = 'ratelimit', socket_timeout: float = 0.05):
+        if redis is None:
+            raise RuntimeError("A redis:// rate limit store requires the redis package")
+        self.client = redis.Redis.from_url(url, socket_timeout=socket_timeout,
+                                           socket_connect_timeout=socket_timeout)
+        self.prefix = prefix
+        self._script = self.client.register_script(self._SCRIPT)
+
+    def take(self, key: str, capacity: int, rate: float, cost: int = 1) -> Tuple[bool, float]:
+        allowed, tokens = self._script(keys=[f"{self.prefix}:{key}"], args=[capacity, rate, cost])
+        return bool(allowed), float(tokens)
+
+
+def create_bucket_store(url: str):
+    """'memory://' keeps buckets per process; 'redis://host:port/db' shares them across workers"""
+    scheme = urlparse(url).scheme
+    if scheme in ('redis', 'rediss'):
+        if redis is None:
+            logging.getLogger(__name__).warning(
+                "redis package not installed, rate limits are per process")
+            return InMemoryBucketStore()
+        return RedisBucketStore(url)
+    if scheme == 'memory':
+        return InMemoryBucketStore()
+    raise ValueError(f"Unknown rate limit store: {url}")
+
+
+class RateLimiter:
+    """
+    Token bucket per client key: bursts of up to `limit` requests, refilled
+    at limit/period per second. While a shared store is unreachable, buckets
+    fall back to this process for `error_backoff` seconds, so a Redis outage
+    loosens the limit to per worker instead of blocking or lifting it.
+    """
+
+    def __init__(self, rate: str, store=None, error_backoff: float = 5.0):
+        self.limit, self.period = parse_rate(rate)
+        self.rate = self.limit / self.period
+        self.store = store if store is not None else InMemoryBucketStore()
+        self.fallback = self.store if self.store.local else InMemoryBucketStore()
+        self.error_backoff = error_backoff
+        self.logger = logging.getLogger(__name__)
+        self._store_down_until = 0.0
+        self._counters = {'allowed': 0, 'limited': 0, 'store_errors': 0}
+
+    def hit(self, key: str, cost: int = 1) -> Tuple[bool, int, int]:
+        """Take `cost` tokens for `key`: (allowed, tokens remaining, seconds until enough are back)"""
+        store = self.store if time.monotonic() >= self._store_down_until else self.fallback
+        try:
+            allowed, tokens = store.take(key, self.limit, self.rate, cost)
+        except Exception as e:
+            self._counters['store_errors'] += 1
+            self._store_down_until = time.monotonic() + self.error_backoff
+            self.logger.warning(f"Rate limit store unavailable: {str(e)}")
+            allowed, tokens = self.fallback.take(key, self.limit, self.rate, cost)
+
+        self._counters['allowed' if allowed else 'limited'] += 1
+        retry_after = 0 if allowed else math.ceil((cost - tokens) / self.rate)
+        return allowed, int(tokens), retry_after
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self._counters)
@@ -0,0 +1,161 @@
+import threading
+from typing import Dict, Hashable, Iterable, List, Set, Tuple
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == '_'
+
+
+class _Automaton:
+    """Aho-Corasick automaton over lowercased terms; immutable once built"""
+    __slots__ = ('goto', 'fail', 'outputs')
+
+    def __init__(self, terms: Dict[str, Set[Hashable]]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.outputs: List[List[Tuple[int, frozenset]]] = [[]]
+
+        for term, labels in terms.items():
+            state = 0
+            for char in term:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.outputs.append([])
+                state = next_state
+            self.outputs[state].append((len(term), frozenset(labels)))
+
+        # Breadth-first pass to set failure links and inherit suffix outputs
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for char, next_state in self.goto[state].items():
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[next_state] = target if target != next_state else 0
+                self.outputs[next_state] = self.outputs[next_state] + self.outputs[self.fail[next_state]]
+                queue.append(next_state)
+
+    def __len__(self) -> int:
+        return len(self.goto)
+
+
+class TermMatcher:
+    """
+    Single-pass, case-insensitive multi-term matcher with the same word
+    boundary semantics as r'\\b(term)\\b'. Every term carries one or more
+    labels (e.g. a filter category) and a scan reports all labels matched.
+
+    Terms added at runtime go into a pending trie that is scanned alongside
+    the automaton. The automaton is rebuilt once the pending terms reach
+    `rebuild_threshold` or `rebuild_ratio` of all terms, whichever is larger,
+    so insertion stays amortized O(len(term)) as the blocklist grows.
+    match() takes no lock: the automaton and pending trie are published
+    together and never changed afterwards, as writers copy the trie nodes
+    on a new term's path instead of updating them in place.
+    """
+
+    def __init__(self, rebuild_threshold: int = 256, rebuild_ratio: float = 0.1):
+        self.rebuild_threshold = rebuild_threshold
+        self.rebuild_ratio = rebuild_ratio
+        self._terms: Dict[str, Set[Hashable]] = {}
+        self._lock = threading.Lock()
+        # (automaton, pending trie, pending count) swapped as one reference
+        self._state = (_Automaton({}), {}, 0)
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+    def __contains__(self, term: str) -> bool:
+        return term.lower() in self._terms
+
+    def add(self, term: str, label: Hashable):
+        """Insert a single term; O(len(term)) until a rebuild is due"""
+        self.add_many([term], label)
+
+    def add_many(self, terms: Iterable[str], label: Hashable):
+        with self._lock:
+            automaton, pending, pending_count = self._state
+            # Nodes copied in this call, which are not published yet and so can be changed in place
+            pending = dict(pending)
+            copied = {id(pending)}
+            for term in terms:
+                term = term.lower()
+                if not term:
+                    continue
+                labels = self._terms.setdefault(term, set())
+                if label in labels:
+                    continue
+                labels.add(label)
+
+                node = pending
+                for char in term:
+                    child = node.get(char)
+                    if child is None or id(child) not in copied:
+                        child = dict(child or {})
+                        copied.add(id(child))
+                        node[char] = child
+                    node = child
+                node[None] = node.get(None, frozenset()) | {label}
+                pending_count += 1
+
+            if pending_count >= max(self.rebuild_threshold, self.rebuild_ratio * len(self._terms)):
+                self._state = (_Automaton(self._terms), {}, 0)
+            else:
+                self._state = (automaton, pending, pending_count)
+
+    def rebuild(self):
+        """Fold all pending terms into the automaton"""
+        with self._lock:
+            self._state = (_Automaton(self._terms), {}, 0)
+
+    def match(self, text: str) -> Set[Hashable]:
+        """Return the labels of every term occurring in `text` as a whole word"""
+        automaton, pending, _ = self._state
+        text = text.lower()
+        length = len(text)
+        is_word = [_is_word_char(char) for char in text]
+
+        def at_boundary(position: int) -> bool:
+            before = is_word[position - 1] if position > 0 else False
+            after = is_word[position] if position < length else False
+            return before != after
+
+        found: Set[Hashable] = set()
+        goto = automaton.goto
+        fail = automaton.fail
+        outputs = automaton.outputs
+        state = 0
+        for end, char in enumerate(text, 1):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for term_length, labels in outputs[state]:
+                if at_boundary(end - term_length) and at_boundary(end):
+                    found.update(labels)
+
+        if pending:
+            for start in range(length):
+                if not at_boundary(start):
+                    continue
+                node = pending
+                for end in range(start, length):
+                    node = node.get(text[end])
+                    if node is None:
+                        break
+                    if None in node and at_boundary(end + 1):
+                        found.update(node[None])
+
+        return found
+
+    def stats(self) -> Dict[str, int]:
+        automaton, _, pending_count = self._state
+        return {
+            'terms': len(self._terms),
+            'automaton_states': len(automaton),
+            'pending_terms': pending_count
+        }
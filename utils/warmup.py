@@ -0,0 +1,111 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Generic, Iterable, Optional, TypeVar
+
+T = TypeVar('T')
+
+_PROCESS_STARTED = time.monotonic()
+
+
+class Readiness:
+    """Tracks which heavy components are loaded and how long each took"""
+
+    def __init__(self, required: Iterable[str]):
+        self.required = list(required)
+        self._components: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._ready_at: Optional[float] = None
+        self.logger = logging.getLogger(__name__)
+
+    @contextmanager
+    def track(self, name: str):
+        """Time a loading step and record whether it succeeded"""
+        with self._lock:
+            self._components[name] = {'state': 'loading'}
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self._finish(name, 'failed', time.perf_counter() - started, error=str(e))
+            raise
+        self._finish(name, 'ready', time.perf_counter() - started)
+
+    def _finish(self, name: str, state: str, duration: float, **details):
+        with self._lock:
+            self._components[name] = dict(state=state, duration=round(duration, 3), **details)
+            if self._ready_at is None and self._all_ready():
+                self._ready_at = time.monotonic()
+        self.logger.info(f"Startup: {name} {state} in {duration:.3f}s")
+
+    def _all_ready(self) -> bool:
+        return all(self._components.get(name, {}).get('state') == 'ready'
+                   for name in self.required)
+
+    @property
+    def is_ready(self) -> bool:
+        with self._lock:
+            return self._all_ready()
+
+    def report(self) -> Dict:
+        with self._lock:
+            components = {name: dict(self._components.get(name, {'state': 'pending'}))
+                          for name in self.required}
+            for name, info in self._components.items():
+                components.setdefault(name, dict(info))
+            ready = self._all_ready()
+            ready_after = self._ready_at - _PROCESS_STARTED if self._ready_at else None
+        return {
+            'ready': ready,
+            'components': components,
+            'uptime': round(time.monotonic() - _PROCESS_STARTED, 3),
+            'ready_after': round(ready_after, 3) if ready_after is not None else None
+        }
+
+
+class LazyResource(Generic[T]):
+    """
+    Build a heavy object on first use instead of at import. The first caller
+    (normally the warm-up thread) pays the cost; concurrent callers wait for it.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], T], readiness: Readiness):
+        self.name = name
+        self.factory = factory
+        self.readiness = readiness
+        self._value: Optional[T] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._value is not None
+
+    def get(self) -> T:
+        value = self._value
+        if value is not None:
+            return value
+        with self._lock:
+            if self._value is None:
+                with self.readiness.track(self.name):
+                    self._value = self.factory()
+            return self._value
+
+
+def start_warm_up(steps: Iterable[Callable[[], None]], background: bool = True):
+    """Run warm-up steps now or in a daemon thread; failures are logged and left to /ready"""
+    logger = logging.getLogger(__name__)
+
+    def run():
+        for step in steps:
+            try:
+                step()
+            except Exception as e:
+                logger.error(f"Warm-up step {getattr(step, '__name__', step)} failed: {str(e)}")
+
+    if background:
+        thread = threading.Thread(target=run, name='warm-up', daemon=True)
+        thread.start()
+        return thread
+    run()
+    return None
@@ -0,0 +1,168 @@
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from utils.metrics import span
+
+
+class WriteBehindBuffer:
+    """
+    Bounded write-behind buffer for append-only rows.
+    Requests enqueue plain dicts and return immediately; a background thread
+    bulk-inserts them once `batch_size` rows are pending or `flush_interval`
+    seconds have passed. When the buffer is full, callers wait at most
+    `enqueue_timeout` seconds for space before the row is dropped and counted.
+    An optional `maintenance` callable runs on the flusher thread with its
+    own session every `maintenance_interval` seconds.
+    """
+    span_name = 'search_log_commit'
+
+    def __init__(self, model, session_factory: Callable[[], Session],
+                 batch_size: int = 500, flush_interval: float = 1.0,
+                 max_pending: int = 10000, enqueue_timeout: float = 0.01,
+                 maintenance: Optional[Callable[[Session], None]] = None,
+                 maintenance_interval: float = 3600.0):
+        self.model = model
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.enqueue_timeout = enqueue_timeout
+        self.maintenance = maintenance
+        self.maintenance_interval = maintenance_interval
+        self._last_maintenance = time.monotonic()
+        self.logger = logging.getLogger(__name__)
+
+        self._pending = deque()
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._stopping = False
+        self._stats = {
+            'submitted': 0,
+            'written': 0,
+            'dropped': 0,
+            'failed': 0,
+            'batches': 0,
+            'last_flush_duration': 0.0
+        }
+
+    def start(self):
+        """Start the background flusher; flushes remaining rows at interpreter exit"""
+        with self._condition:
+            if self._thread is not None:
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+            self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, row: Dict, timeout: Optional[float] = None) -> bool:
+        """
+        Enqueue a row for insertion; returns False if it was dropped under
+        backpressure. `timeout` overrides enqueue_timeout, e.g. 0 on an event loop.
+        """
+        if self._thread is None:
+            self.start()
+
+        with self._condition:
+            if len(self._pending) >= self.max_pending:
+                # Wake the flusher and give it a moment to make room
+                self._condition.notify_all()
+                deadline = time.monotonic() + (self.enqueue_timeout if timeout is None else timeout)
+                while len(self._pending) >= self.max_pending:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['dropped'] += 1
+                        return False
+                    self._condition.wait(remaining)
+
+            self._pending.append(row)
+            self._stats['submitted'] += 1
+            if len(self._pending) >= self.batch_size:
+                self._condition.notify_all()
+        return True
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._stopping and len(self._pending) < self.batch_size:
+                    self._condition.wait(self.flush_interval)
+                if self._stopping and not self._pending:
+                    return
+            self.flush()
+            if self.maintenance is not None and \
+                    time.monotonic() - self._last_maintenance >= self.maintenance_interval:
+                self._maintain()
+
+    def _maintain(self):
+        self._last_maintenance = time.monotonic()
+        session = self.session_factory()
+        try:
+            self.maintenance(session)
+        except Exception as e:
+            session.rollback()
+            self.logger.error(f"Error in write-behind maintenance: {str(e)}")
+        finally:
+            session.close()
+
+    def _take_batch(self) -> List[Dict]:
+        with self._condition:
+            count = min(len(self._pending), self.batch_size)
+            batch = [self._pending.popleft() for _ in range(count)]
+            # Wake producers blocked on a full buffer
+            self._condition.notify_all()
+        return batch
+
+    def flush(self):
+        """Write every row submitted before this call; blocks until done"""
+        with self._flush_lock:
+            while True:
+                batch = self._take_batch()
+                if not batch:
+                    return
+                self._write(batch)
+
+    def _write(self, batch: List[Dict]):
+        started = time.perf_counter()
+        session = self.session_factory()
+        try:
+            with span(self.span_name):
+                self._execute(session, batch)
+                session.commit()
+            self._stats['written'] += len(batch)
+            self._stats['batches'] += 1
+        except Exception as e:
+            session.rollback()
+            self._stats['failed'] += len(batch)
+            self.logger.error(f"Error writing {len(batch)} buffered rows: {str(e)}")
+        finally:
+            session.close()
+            self._stats['last_flush_duration'] = time.perf_counter() - started
+
+    def _execute(self, session: Session, batch: List[Dict]):
+        session.execute(insert(self.model), batch)
+
+    def close(self, timeout: float = 10.0):
+        """Stop the flusher after writing everything still pending"""
+        with self._condition:
+            thread = self._thread
+            self._stopping = True
+            self._condition.notify_all()
+        if thread is not None:
+            thread.join(timeout)
+        self.flush()
+        with self._condition:
+            self._thread = None
+
+    def stats(self) -> Dict:
+        with self._condition:
+            stats = dict(self._stats)
+            stats['pending'] = len(self._pending)
+        return stats